@@ -0,0 +1,71 @@
+# python built-in imports
+import argparse
+import os
+import sys
+import timeit
+
+# make the calculux modules importable when run from a checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'main', 'python'))
+
+# calculux imports
+from evaluator import EVALUATION_ERRORS, Evaluator
+from precision import MODES
+
+# expressions covering rational-only input and input that needs irrational
+# functions, so the cost of promoting from fractions to decimals shows up
+EXPRESSIONS = [
+    '1/3+1/6',
+    '0.1+0.2*3',
+    'fact(30)/fact(28)',
+    '(2/3)^10-1/7',
+    'sqrt(2)*sqrt(3)',
+    'sin(pi/6)+cos(pi/3)',
+    'ln(10)/log10(e)',
+    'atan(1)*4'
+]
+
+
+def bench(mode: str, digits: int, number: int) -> dict:
+    """
+    Returns the mean time in microseconds to evaluate each expression in the
+    given precision mode.
+    """
+    evaluator = Evaluator(precision=mode, digits=digits)
+    timings = {}
+    for expression in EXPRESSIONS:
+        try:
+            evaluator.compute(expression)
+        except EVALUATION_ERRORS:
+            timings[expression] = None  # e.g. irrational in fraction mode
+            continue
+        seconds = timeit.timeit(lambda: evaluator.compute(expression), number=number)
+        timings[expression] = seconds / number * 1e6
+    return timings
+
+
+def main(argv=None) -> int:
+    """
+    Prints a table of per-expression evaluation times for every precision
+    mode.
+    """
+    parser = argparse.ArgumentParser(description='Compare the cost of the Calculux precision modes.')
+    parser.add_argument('--digits', type=int, default=30, help='significant figures (default: 30)')
+    parser.add_argument('--number', type=int, default=200, help='evaluations per timing (default: 200)')
+    args = parser.parse_args(argv)
+
+    results = {mode: bench(mode, args.digits, args.number) for mode in MODES}
+
+    width = max(len(expression) for expression in EXPRESSIONS)
+    print('{:<{}}'.format('expression (us)', width) + ''.join('{:>12}'.format(mode) for mode in MODES))
+    for expression in EXPRESSIONS:
+        cells = []
+        for mode in MODES:
+            timing = results[mode][expression]
+            cells.append('{:>12}'.format('n/a' if timing is None else '{:.1f}'.format(timing)))
+        print('{:<{}}'.format(expression, width) + ''.join(cells))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+# python built-in imports
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, List, Optional
+
+# make the calculux modules importable when run from a checkout
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SOURCE_DIR = os.path.join(PROJECT_DIR, 'src', 'main', 'python')
+sys.path.insert(0, SOURCE_DIR)
+
+# calculux imports
+from evaluator import Evaluator, evaluate_many
+
+# where results are compared against by default
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# a run fails if a benchmark is this much slower than its baseline (0.25 is 25%)
+THRESHOLD = 0.25
+
+# representative expressions, as they would be typed on the keypad
+CORPUS = [
+    '1+2',
+    '12.5*4-3/7',
+    '2E3^2',
+    '(1+2)*(3+4)/5',
+    'sin(1)^2+cos(1)^2',
+    'asin(0.5)+acos(0.5)+atan(1)',
+    'tan(0.7)*3j+2',
+    'ln(10)+log10(1000)+log(8,2)',
+    'sqrt(2)*x_rt(3,27)',
+    'fact(20)/fact(18)',
+    'mod(1234,7)^2',
+    'abs(-3+4j)',
+    'PRV*1.2',
+    'M+PRV^2',
+    'pi*e-1E-3'
+]
+
+# keys typed for the key-event benchmark: digits, a translated key, an
+# operator and Enter (which evaluates)
+KEYS = ['Key_1', 'Key_2', 'Key_Plus', 'Key_3', 'Key_ParenLeft', 'Key_4', 'Key_ParenRight', 'Key_Enter']
+
+# run inside a fresh interpreter to time start up until the window has been
+# shown and painted (with a throwaway history, so the user's isn't touched)
+STARTUP_SCRIPT = '''
+import os, sys, tempfile
+sys.path.insert(0, {source!r})
+import main
+with tempfile.TemporaryDirectory() as directory:
+    appctxt = main.ApplicationContext()
+    view = main.Calculux(appctxt, history_path=os.path.join(directory, 'history.log'))
+    view.show()
+    appctxt.app.processEvents()
+    sys.stdout.write('painted\\n')
+    sys.stdout.flush()
+'''
+
+
+def median_time(func: Callable[[], None], repeat: int) -> float:
+    """
+    Returns the median wall clock time of repeat calls to func, in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_parse_evaluate(repeat: int) -> float:
+    """
+    Median time to tokenize, parse, compile and evaluate one expression of
+    the corpus with an empty expression cache.
+    """
+    evaluator = Evaluator()
+
+    def run():
+        for expression in CORPUS:
+            evaluator.expression_cache.clear()
+            evaluator.evaluate(expression)
+    return median_time(run, repeat) / len(CORPUS)
+
+
+def bench_cached_evaluate(repeat: int) -> float:
+    """
+    Median time to evaluate one expression of the corpus that is already in
+    the expression cache.
+    """
+    evaluator = Evaluator()
+    for expression in CORPUS:
+        evaluator.evaluate(expression)
+
+    def run():
+        for expression in CORPUS:
+            evaluator.evaluate(expression)
+    return median_time(run, repeat) / len(CORPUS)
+
+
+def bench_batch(repeat: int, size: int = 10000) -> float:
+    """
+    Median time per 1000 expressions for a batch run through evaluate_many,
+    where most expressions are distinct.
+    """
+    expressions = ['{}*{}+sin({})'.format(i, CORPUS[i % len(CORPUS)], i) for i in range(size)]
+
+    def run():
+        for _ in evaluate_many(expressions):
+            pass
+    return median_time(run, repeat) / size * 1000
+
+
+def bench_startup(repeat: int) -> Optional[float]:
+    """
+    Median time from starting the interpreter to the main window being shown
+    and painted, using Qt's offscreen platform. None if Qt isn't available.
+    """
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    script = STARTUP_SCRIPT.format(source=SOURCE_DIR)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-c', script], cwd=PROJECT_DIR, env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        line = process.stdout.readline()
+        elapsed = time.perf_counter() - start
+        process.kill()
+        process.communicate()
+        if line.strip() != b'painted':
+            return None
+        timings.append(elapsed)
+    return statistics.median(timings)
+
+
+def bench_key_events(repeat: int) -> Optional[float]:
+    """
+    Median time from a key press reaching Calculux.keyPressEvent to the
+    display changing, going through keyTranslations and animateClick. None
+    if Qt isn't available. The history goes to a temporary file rather
+    than the user's, and the sandbox process is started before timing
+    begins and stopped afterwards (with the preview one).
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        import main
+        from PyQt5.QtCore import QEvent, Qt
+        from PyQt5.QtGui import QKeyEvent
+    except ImportError:
+        return None
+
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(PROJECT_DIR)  # so fbs finds the resources when run from source
+        try:
+            appctxt = main.ApplicationContext()
+            view = main.Calculux(appctxt, history_path=os.path.join(directory, 'history.log'))
+        finally:
+            os.chdir(cwd)
+        view.show()
+        view.sandbox.start()
+
+        timings = []
+        try:
+            for _ in range(repeat):
+                for name in KEYS:
+                    before = view.display.text()
+                    event = QKeyEvent(QEvent.KeyPress, getattr(Qt, name), Qt.NoModifier)
+                    start = time.perf_counter()
+                    view.keyPressEvent(event)
+                    deadline = start + 2
+                    while view.display.text() == before and time.perf_counter() < deadline:
+                        appctxt.app.processEvents()
+                    timings.append(time.perf_counter() - start)
+        finally:
+            view.sandbox.stop()
+            view.previewSandbox.stop()
+            view.evaluator.history.close()
+            view.close()
+    return statistics.median(timings)
+
+
+# benchmark name -> function taking the repeat count, every result is in
+# seconds so lower is always better
+BENCHMARKS = {
+    'parse_evaluate': bench_parse_evaluate,
+    'cached_evaluate': bench_cached_evaluate,
+    'batch_per_1000': bench_batch,
+    'startup_to_paint': bench_startup,
+    'key_event_to_display': bench_key_events
+}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Returns a description of every benchmark that is more than threshold
+    slower than its baseline.
+    """
+    regressions = []
+    for name, value in results.items():
+        previous = baseline.get(name)
+        if value is None or previous is None:
+            continue
+        if value > previous * (1 + threshold):
+            regressions.append('{}: {:.6g}s vs baseline {:.6g}s (+{:.0%})'.format(
+                name, value, previous, value / previous - 1))
+    return regressions
+
+
+def main(argv=None) -> int:
+    """
+    Runs the benchmarks, prints the results and compares them with the
+    baseline. Returns 1 if any benchmark regressed past the threshold.
+    """
+    parser = argparse.ArgumentParser(description='Run the Calculux benchmarks.')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='benchmarks to run (default: all of {})'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions per benchmark (default: 5)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='allowed slowdown before failing, as a fraction (default: {})'.format(THRESHOLD))
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark {!r}'.format(name))
+
+    results = {}
+    for name in args.names or BENCHMARKS:
+        results[name] = BENCHMARKS[name](args.repeat)
+        value = results[name]
+        print('{:<24}{}'.format(name, 'skipped (Qt not available)' if value is None else '{:.6g}s'.format(value)))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=4)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as stored:
+                baseline = json.load(stored)
+        baseline.update({name: value for name, value in results.items() if value is not None})
+        with open(args.baseline, 'w') as stored:
+            json.dump(baseline, stored, indent=4)
+        print('baseline saved to {}'.format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('no baseline at {}, run with --save-baseline to create one'.format(args.baseline))
+        return 0
+
+    with open(args.baseline) as stored:
+        regressions = compare(results, json.load(stored), args.threshold)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+# python built-in imports
+import math
+from typing import Any, Callable, List, Sequence
+
+# calculux imports
+from errors import CalculuxError, ParseError
+from nodes import BinOp, Call, Integral, Name, Number, UnaryOp
+
+# derivatives of the trigonometric functions are multiplied by this name,
+# which is bound to 1 in radians and pi/180 in degrees
+ANGLE = '_angle'
+
+# an integral is accepted once its estimated error is at most this fraction
+# of its value (or, for integrals smaller than 1, this absolute error)
+TOLERANCE = 1e-10
+
+# integration gives up after splitting the range into this many subintervals
+MAX_INTERVALS = 2000
+
+# the 15 point Kronrod rule on [-1, 1] and the 7 point Gauss rule whose
+# nodes are every other Kronrod node (from QUADPACK's qk15)
+_KRONROD_NODES = (
+    0.991455371120812639206854697526329,
+    0.949107912342758524526189684047851,
+    0.864864423359769072789712788640926,
+    0.741531185599394439863864773280788,
+    0.586087235467691130294144845693013,
+    0.405845151377397166906606412076961,
+    0.207784955007898467600689403773245,
+    0.0
+)
+_KRONROD_WEIGHTS = (
+    0.022935322010529224963732008058970,
+    0.063092092629978553290700663189204,
+    0.104790010322250183839876322541518,
+    0.140653259715525918745189590510238,
+    0.169004726639267902826583426598550,
+    0.190350578064785409913256402421014,
+    0.204432940075298892414161999234649,
+    0.209482141084727828012999174891714
+)
+_GAUSS_WEIGHTS = (
+    0.129484966168869693270611432679082,
+    0.279705391489276667901467771423780,
+    0.381830050505118944950369775488975,
+    0.417959183673469387755102040816327
+)
+
+# the 15 nodes in order, and the weights of both rules lined up with them
+# (the Gauss rule has no weight on every other node)
+NODES = tuple(-x for x in _KRONROD_NODES[:-1]) + tuple(reversed(_KRONROD_NODES))
+KRONROD_WEIGHTS = _KRONROD_WEIGHTS[:-1] + tuple(reversed(_KRONROD_WEIGHTS))
+GAUSS_WEIGHTS = (
+    0.0, _GAUSS_WEIGHTS[0], 0.0, _GAUSS_WEIGHTS[1], 0.0, _GAUSS_WEIGHTS[2], 0.0,
+    _GAUSS_WEIGHTS[3],
+    0.0, _GAUSS_WEIGHTS[2], 0.0, _GAUSS_WEIGHTS[1], 0.0, _GAUSS_WEIGHTS[0], 0.0
+)
+
+
+class IntegrationError(CalculuxError, ArithmeticError):
+    """
+    Raised when an integral doesn't converge to the required tolerance.
+    """
+
+
+_ZERO = Number(0)
+_ONE = Number(1)
+
+
+def _add(left: Any, right: Any) -> Any:
+    if left == _ZERO:
+        return right
+    if right == _ZERO:
+        return left
+    return BinOp('+', left, right)
+
+
+def _sub(left: Any, right: Any) -> Any:
+    if right == _ZERO:
+        return left
+    if left == _ZERO:
+        return UnaryOp('-', right)
+    return BinOp('-', left, right)
+
+
+def _mul(left: Any, right: Any) -> Any:
+    if left == _ZERO or right == _ZERO:
+        return _ZERO
+    if left == _ONE:
+        return right
+    if right == _ONE:
+        return left
+    return BinOp('*', left, right)
+
+
+def _div(left: Any, right: Any) -> Any:
+    if left == _ZERO:
+        return _ZERO
+    if right == _ONE:
+        return left
+    return BinOp('/', left, right)
+
+
+def depends_on(node: Any, var: str) -> bool:
+    """
+    Returns whether var appears free in node.
+    """
+    if isinstance(node, Name):
+        return node.id == var
+    if isinstance(node, UnaryOp):
+        return depends_on(node.operand, var)
+    if isinstance(node, BinOp):
+        return depends_on(node.left, var) or depends_on(node.right, var)
+    if isinstance(node, Call):
+        return any(depends_on(arg, var) for arg in node.args)
+    if isinstance(node, Integral):
+        return (node.var != var and depends_on(node.body, var)) or \
+            depends_on(node.low, var) or depends_on(node.high, var)
+    return False
+
+
+def substitute(node: Any, var: str, value: Any) -> Any:
+    """
+    Returns node with every free occurrence of var replaced by the tree value.
+    """
+    if isinstance(node, Name):
+        return value if node.id == var else node
+    if isinstance(node, UnaryOp):
+        return UnaryOp(node.op, substitute(node.operand, var, value))
+    if isinstance(node, BinOp):
+        return BinOp(node.op, substitute(node.left, var, value), substitute(node.right, var, value))
+    if isinstance(node, Call):
+        return Call(node.func, tuple(substitute(arg, var, value) for arg in node.args))
+    if isinstance(node, Integral):
+        body = node.body if node.var == var else substitute(node.body, var, value)
+        return Integral(body, node.var, substitute(node.low, var, value), substitute(node.high, var, value))
+    return node
+
+
+def derivative(node: Any, var: str) -> Any:
+    """
+    Returns the derivative of an expression tree with respect to var, as an
+    expression tree. Terms that are obviously 0 or 1 are left out as it is
+    built, the rest is left to optimizer.simplify. fact() and mod() can't
+    be differentiated and raise ParseError.
+    """
+    if isinstance(node, Number):
+        return _ZERO
+    if isinstance(node, Name):
+        return _ONE if node.id == var else _ZERO
+    if not depends_on(node, var):
+        return _ZERO
+
+    if isinstance(node, UnaryOp):
+        inner = derivative(node.operand, var)
+        return UnaryOp('-', inner) if node.op == '-' else inner
+
+    if isinstance(node, BinOp):
+        u, v = node.left, node.right
+        if node.op == '+':
+            return _add(derivative(u, var), derivative(v, var))
+        if node.op == '-':
+            return _sub(derivative(u, var), derivative(v, var))
+        if node.op == '*':
+            return _add(_mul(derivative(u, var), v), _mul(u, derivative(v, var)))
+        if node.op == '/':
+            numerator = _sub(_mul(derivative(u, var), v), _mul(u, derivative(v, var)))
+            return _div(numerator, BinOp('^', v, Number(2)))
+        if not depends_on(v, var):
+            # power rule
+            return _mul(_mul(v, BinOp('^', u, _sub(v, _ONE))), derivative(u, var))
+        if not depends_on(u, var):
+            # exponential rule
+            return _mul(_mul(node, Call('ln', (u,))), derivative(v, var))
+        # u^v = e^(v ln u)
+        return _mul(node, _add(_mul(derivative(v, var), Call('ln', (u,))),
+                               _div(_mul(v, derivative(u, var)), u)))
+
+    if isinstance(node, Call):
+        return _call_derivative(node.func, node.args, var)
+
+    if isinstance(node, Integral):
+        # Leibniz rule: the integral of the derivative of the body, plus the
+        # terms from the limits depending on var
+        inner = _ZERO
+        if node.var != var:
+            inner = Integral(derivative(node.body, var), node.var, node.low, node.high)
+        upper = _mul(substitute(node.body, node.var, node.high), derivative(node.high, var))
+        lower = _mul(substitute(node.body, node.var, node.low), derivative(node.low, var))
+        return _sub(_add(inner, upper), lower)
+
+    raise TypeError('unknown node {!r}'.format(node))
+
+
+def _call_derivative(func: str, args: Sequence[Any], var: str) -> Any:
+    """
+    Returns the derivative of a call to one of the calculator functions.
+    """
+    if func == 'log':
+        # log(u) is ln(u) and log(u, b) is ln(u)/ln(b)
+        if len(args) == 1:
+            return derivative(Call('ln', args), var)
+        return derivative(BinOp('/', Call('ln', (args[0],)), Call('ln', (args[1],))), var)
+    if func == 'x_rt':
+        index, radicand = args
+        return derivative(BinOp('^', radicand, BinOp('/', _ONE, index)), var)
+
+    if len(args) != 1:
+        raise ParseError('{}() takes 1 argument'.format(func))
+    u = args[0]
+    du = derivative(u, var)
+    angle = Name(ANGLE)
+    root = Call('sqrt', (BinOp('-', _ONE, BinOp('^', u, Number(2))),))
+
+    if func == 'sin':
+        outer = _mul(Call('cos', (u,)), angle)
+    elif func == 'cos':
+        outer = UnaryOp('-', _mul(Call('sin', (u,)), angle))
+    elif func == 'tan':
+        outer = _div(angle, BinOp('^', Call('cos', (u,)), Number(2)))
+    elif func == 'asin':
+        outer = _div(_ONE, _mul(angle, root))
+    elif func == 'acos':
+        outer = UnaryOp('-', _div(_ONE, _mul(angle, root)))
+    elif func == 'atan':
+        outer = _div(_ONE, _mul(angle, BinOp('+', _ONE, BinOp('^', u, Number(2)))))
+    elif func == 'ln':
+        outer = _div(_ONE, u)
+    elif func == 'log10':
+        outer = _div(_ONE, _mul(u, Call('ln', (Number(10),))))
+    elif func == 'sqrt':
+        outer = _div(_ONE, _mul(Number(2), Call('sqrt', (u,))))
+    elif func == 'abs':
+        outer = _div(u, Call('abs', (u,)))
+    elif func == 'radians':
+        outer = BinOp('/', Name('pi'), Number(180))
+    elif func == 'degrees':
+        outer = BinOp('/', Number(180), Name('pi'))
+    else:
+        raise ParseError("{}() can't be differentiated".format(func))
+    return _mul(outer, du)
+
+
+def integrate(batch: Callable[[List[float]], List[Any]], low: Any, high: Any) -> Any:
+    """
+    Returns the integral from low to high of the function that batch
+    evaluates at a list of points, by adaptive Gauss-Kronrod quadrature
+    (15 point Kronrod rule with a 7 point Gauss rule for the error
+    estimate). Each round bisects every subinterval whose error estimate is
+    above its share of the tolerance, and all the new subintervals are
+    evaluated in one call to batch, so there is one call per round rather
+    than one per point. The values may be numpy arrays, which are integrated
+    element-wise until the largest error is within tolerance.
+    """
+    low, high = _real_limit(low), _real_limit(high)
+    if low == high:
+        return 0.0
+
+    done = []  # (estimate, error) of subintervals that won't be split again
+    pending = [(low, high)]
+    while True:
+        points = []
+        for a, b in pending:
+            centre, half = (a + b) / 2, (b - a) / 2
+            points.extend(centre + half * x for x in NODES)
+        values = batch(points)
+
+        estimates = []
+        for i, (a, b) in enumerate(pending):
+            samples = values[15*i:15*i+15]
+            half = (b - a) / 2
+            kronrod = half * sum(w * f for w, f in zip(KRONROD_WEIGHTS, samples))
+            gauss = half * sum(w * f for w, f in zip(GAUSS_WEIGHTS, samples))
+            estimates.append((a, b, kronrod, _largest(abs(kronrod - gauss))))
+
+        result = sum(estimate for estimate, _ in done) + sum(estimate for _, _, estimate, _ in estimates)
+        error = sum(error for _, error in done) + sum(error for _, _, _, error in estimates)
+        tolerance = TOLERANCE * max(_largest(abs(result)), 1)
+        if error <= tolerance:
+            return result
+
+        intervals = len(done) + len(estimates)
+        pending = []
+        for a, b, estimate, error in estimates:
+            if error > tolerance / intervals:
+                middle = (a + b) / 2
+                pending.extend(((a, middle), (middle, b)))
+            else:
+                done.append((estimate, error))
+        if not pending or intervals + len(pending) // 2 > MAX_INTERVALS:
+            raise IntegrationError('integral did not converge')
+
+
+def _largest(value: Any) -> float:
+    """
+    Returns the largest element of a numpy array, or a number unchanged.
+    """
+    return value.max() if hasattr(value, 'max') else value
+
+
+def _real_limit(value: Any) -> float:
+    """
+    Converts a limit of integration to a float, which must be real.
+    """
+    if isinstance(value, complex):
+        if value.imag != 0:
+            raise ValueError('limits of integration must be real')
+        value = value.real
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError('limits of integration must be finite')
+    return value
@@ -0,0 +1,508 @@
+# python built-in imports
+from bisect import bisect_left
+import datetime
+from datetime import date, timedelta, timezone
+import itertools
+import re
+from typing import Any, List, NamedTuple, Sequence, Tuple
+
+# calculux imports
+from cache import LRUCache
+from errors import ParseError
+from nodes import Call, Number, Text
+from radix import as_integer
+
+try:
+    import zoneinfo
+except ImportError:
+    # before Python 3.9 there is no time zone database, so only UTC offsets
+    # can be used
+    zoneinfo = None
+
+# the keyword between a date or duration and the unit or time zone it is
+# shown in, as in (2027-01-01 - 2026-10-18) in weeks
+IN = 'in'
+
+# date and time literals are parsed into calls to MOMENT with the literal's
+# text, duration literals into calls to DURATION with the number and unit,
+# and 'in' into a call to SHOW_IN (none of them are names the user can type)
+MOMENT = 'moment'
+DURATION = 'duration'
+SHOW_IN = 'show_in'
+
+# the suffixes of duration literals (90d, 1.5h) and the names that can follow
+# 'in', with the duration they stand for
+DURATION_UNITS = {
+    'w': timedelta(weeks=1), 'd': timedelta(days=1), 'h': timedelta(hours=1),
+    'min': timedelta(minutes=1), 's': timedelta(seconds=1)
+}
+TIME_UNITS = dict(DURATION_UNITS, **{
+    'week': timedelta(weeks=1), 'weeks': timedelta(weeks=1),
+    'day': timedelta(days=1), 'days': timedelta(days=1),
+    'hour': timedelta(hours=1), 'hours': timedelta(hours=1),
+    'minute': timedelta(minutes=1), 'minutes': timedelta(minutes=1),
+    'second': timedelta(seconds=1), 'seconds': timedelta(seconds=1)
+})
+
+# the patterns the tokenizer reads as date, time and duration literals: ISO
+# 8601 dates and times such as 2026-10-18 or 2026-10-18T14:30:05.5, which may
+# end in Z, a UTC offset or a time zone in brackets (2026-10-18T14:30[Europe/
+# Paris]), and a number with one of the DURATION_UNITS. The month and day
+# have two digits, so 1000-10-5 is a subtraction, and so is text of that
+# shape that isn't a date (1234-56-78, see invalid_date)
+MOMENT_PATTERN = (r'\d{4}-\d\d-\d\d'
+                  r'(?:T\d\d:\d\d(?::\d\d(?:\.\d+)?)?(?:Z|[+-]\d\d:\d\d)?(?:\[[A-Za-z_][A-Za-z_0-9/+-]*\])?)?(?!\d)')
+DURATION_PATTERN = r'(?:\d+\.?\d*|\.\d+)(?:w|d|h|min|s)(?![A-Za-z_0-9])'
+
+# the types of the values dates, times and durations evaluate to
+TEMPORAL = (date, timedelta)
+
+# number of parsed literals and looked up time zones kept
+CACHE_SIZE = 256
+
+# the holiday tables of this many years are kept
+YEARS_CACHED = 1024
+
+_MOMENT = re.compile(r'(\d{4})-(\d\d)-(\d\d)(?:T(\d\d):(\d\d)(?::(\d\d)(?:\.(\d+))?)?(Z|[+-]\d\d:\d\d)?'
+                     r'(?:\[([^\]]+)\])?)?')
+_DATE = re.compile(r'(\d{4})-(\d\d)-(\d\d)')
+_DURATION = re.compile(r'(\d+\.?\d*|\.\d+)(w|d|h|min|s)')
+_DURATIONS = re.compile(r'-?{0}(?:[+-]{0})*'.format(_DURATION.pattern))
+_LITERAL = re.compile('{}|{}'.format(MOMENT_PATTERN, DURATION_PATTERN))
+
+_moments = LRUCache(CACHE_SIZE)
+_zones = LRUCache(CACHE_SIZE)
+
+
+class Holiday(NamedTuple):
+    """
+    A rule for a public holiday. FIXED holidays fall on day/month, WEEKDAY
+    holidays on the nth of a weekday in the month (day is the weekday,
+    Monday is 0, and a negative n counts from the end of the month), and
+    EASTER holidays day days after Easter Sunday. The rule applies from the
+    year since on.
+    """
+    kind: str
+    month: int = 0
+    day: int = 0
+    n: int = 0
+    since: int = datetime.MINYEAR
+
+
+FIXED = 'fixed'
+WEEKDAY = 'weekday'
+EASTER = 'easter'
+
+# how a calendar moves a holiday that falls at a weekend: to the nearest
+# weekday (Saturday to Friday and Sunday to Monday) or to the next working day
+NEAREST = 'nearest'
+NEXT = 'next'
+
+# the holiday calendars business days can be counted with, by name
+CALENDARS = {
+    'US': (NEAREST, (
+        Holiday(FIXED, 1, 1), Holiday(WEEKDAY, 1, 0, 3), Holiday(WEEKDAY, 2, 0, 3),
+        Holiday(WEEKDAY, 5, 0, -1), Holiday(FIXED, 6, 19, since=2021), Holiday(FIXED, 7, 4),
+        Holiday(WEEKDAY, 9, 0, 1), Holiday(WEEKDAY, 10, 0, 2), Holiday(FIXED, 11, 11),
+        Holiday(WEEKDAY, 11, 3, 4), Holiday(FIXED, 12, 25)
+    )),
+    'UK': (NEXT, (
+        Holiday(FIXED, 1, 1), Holiday(EASTER, day=-2), Holiday(EASTER, day=1),
+        Holiday(WEEKDAY, 5, 0, 1), Holiday(WEEKDAY, 5, 0, -1), Holiday(WEEKDAY, 8, 0, -1),
+        Holiday(FIXED, 12, 25), Holiday(FIXED, 12, 26)
+    ))
+}
+
+# _WORKDAYS[w][n] is the number of weekdays among the n days from a day of
+# weekday w, for n up to a week
+_WORKDAYS = tuple(tuple(sum((w + i) % 7 < 5 for i in range(n)) for n in range(8)) for w in range(7))
+
+_holidays = LRUCache(YEARS_CACHED)
+
+# calendar -> (first year, totals) where totals[year - first year] is the
+# number of holidays in the tables of the years from the year first asked
+# for up to year (negative for earlier years). The totals are extended to
+# cover the years asked for
+_totals = {}
+
+
+def is_literal(text: str) -> bool:
+    """
+    Returns whether a number token is a date, time or duration literal.
+    """
+    return _LITERAL.fullmatch(text) is not None
+
+
+def literal(text: str) -> Any:
+    """
+    Returns the tree for a date, time or duration literal. Raises ParseError
+    if it isn't a valid date or time (e.g. 2026-02-30).
+    """
+    match = _DURATION.fullmatch(text)
+    if match is not None:
+        number, unit = match.groups()
+        value = float(number) if '.' in number else int(number)
+        return Call(DURATION, (Number(value), Text(unit)))
+    try:
+        moment(text)
+    except ValueError as error:
+        raise ParseError(str(error))
+    return Call(MOMENT, (Text(text),))
+
+
+def moment(text: str) -> date:
+    """
+    Returns the date or datetime a literal stands for. Literals are parsed
+    once and kept, so a compiled expression or a column of values repeating
+    the same literal doesn't resolve its time zone again.
+    """
+    return _moments.get_or_create(text, lambda: _parse_moment(text))
+
+
+def invalid_date(text: str) -> bool:
+    """
+    Returns whether a number token starts like a date (year-month-day) that
+    doesn't exist, e.g. 2026-02-30. The tokenizer reads those as arithmetic.
+    """
+    match = _DATE.match(text)
+    if match is None:
+        return False
+    try:
+        date(*map(int, match.groups()))
+    except ValueError:
+        return True
+    return False
+
+
+def _parse_moment(text: str) -> date:
+    """
+    Parses a date or time literal on a cache miss. A time with a UTC offset
+    and a time zone must agree on the offset, which picks the earlier or
+    later of a time that happens twice when the clocks go back.
+    """
+    match = _MOMENT.fullmatch(text)
+    if match is None:
+        raise ValueError('{!r} is not a date or time'.format(text))
+    year, month, day, hour, minute, second, fraction, offset, key = match.groups()
+    if hour is None:
+        return date(int(year), int(month), int(day))
+    microsecond = int((fraction or '0').ljust(6, '0')[:6])
+    value = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0),
+                              microsecond)
+    fixed = None
+    if offset is not None:
+        fixed = timezone.utc if offset == 'Z' else timezone(_offset(offset))
+        value = value.replace(tzinfo=fixed)
+    if key is None:
+        return value
+    value = value.replace(tzinfo=zone(key))
+    if fixed is not None and value.utcoffset() != fixed.utcoffset(None):
+        value = value.replace(fold=1)
+        if value.utcoffset() != fixed.utcoffset(None):
+            raise ValueError('{} is not the UTC offset in {} at {}'.format(offset, key, text[:match.start(8)]))
+    return value
+
+
+def _offset(text: str) -> timedelta:
+    """
+    Converts a UTC offset such as +05:30 to a timedelta.
+    """
+    sign = -1 if text[0] == '-' else 1
+    return sign * timedelta(hours=int(text[1:3]), minutes=int(text[4:6]))
+
+
+def zone(key: str) -> Any:
+    """
+    Returns the time zone named key (e.g. 'Europe/Paris'). Raises ValueError
+    if there is no such zone. Lookups, including failed ones, are kept, so
+    the time zone database is only searched once per name.
+    """
+    found = _zones.get_or_create(key, lambda: _find_zone(key))
+    if found is None:
+        raise ValueError('unknown time zone {!r}'.format(key))
+    return found
+
+
+def _find_zone(key: str) -> Any:
+    """
+    Looks up a time zone on a cache miss, returning None if there is none.
+    """
+    if zoneinfo is None:
+        return timezone.utc if key == 'UTC' else None
+    try:
+        return zoneinfo.ZoneInfo(key)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError, OSError):
+        return None
+
+
+def duration(value: Any, unit: str) -> timedelta:
+    """
+    Returns value times one of the DURATION_UNITS (90d, 1.5h).
+    """
+    if isinstance(value, complex):
+        raise TypeError('durations must be real')
+    return value * DURATION_UNITS[unit]
+
+
+def target(tokens: Sequence[Tuple[str, str, int]]) -> Text:
+    """
+    Returns the tree for the tokens after 'in', which name one of the
+    TIME_UNITS or a time zone (whose name may have been split into several
+    tokens, e.g. America / New_York). Raises ParseError if they name
+    neither.
+    """
+    name = ''.join(text for _, text, _ in tokens)
+    if not name:
+        raise ParseError('expected a unit or time zone after {!r}'.format(IN))
+    if name not in TIME_UNITS:
+        try:
+            zone(name)
+        except ValueError as error:
+            raise ParseError(str(error))
+    return Text(name)
+
+
+def show_in(value: Any, name: str) -> Any:
+    """
+    Returns a duration as a number of one of the TIME_UNITS, or a time in the
+    time zone named name. A time without a zone is taken as local time.
+    """
+    if name in TIME_UNITS:
+        if not isinstance(value, timedelta):
+            raise TypeError('only durations can be shown in {}'.format(name))
+        return value / TIME_UNITS[name]
+    if not isinstance(value, datetime.datetime):
+        raise TypeError('only times can be shown in a time zone')
+    return value.astimezone(zone(name))
+
+
+def format_temporal(value: Any) -> str:
+    """
+    Formats a date, time or duration for the display, as a literal that can
+    be typed back in.
+    """
+    if isinstance(value, timedelta):
+        return format_duration(value)
+    if not isinstance(value, datetime.datetime):
+        return value.isoformat()
+    text = '{}T{:02d}:{:02d}'.format(value.date().isoformat(), value.hour, value.minute)
+    if value.second or value.microsecond:
+        text += ':{:02d}'.format(value.second)
+    if value.microsecond:
+        text += '.{:06d}'.format(value.microsecond).rstrip('0')
+    if value.tzinfo is None:
+        return text
+    if value.tzinfo is timezone.utc:
+        return text + 'Z'
+    offset = value.utcoffset()
+    sign = '-' if offset < timedelta(0) else '+'
+    minutes = abs(offset) // timedelta(minutes=1)
+    text += '{}{:02d}:{:02d}'.format(sign, minutes // 60, minutes % 60)
+    key = getattr(value.tzinfo, 'key', None)
+    return text if key is None else '{}[{}]'.format(text, key)
+
+
+def format_duration(value: timedelta) -> str:
+    """
+    Formats a duration as a sum of days, hours, minutes and seconds, e.g.
+    1d+2h+30min, or -1d-2h if it is negative.
+    """
+    sign = '-' if value < timedelta(0) else ''
+    value = abs(value)
+    minutes, seconds = divmod(value.seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    parts = []
+    for amount, unit in ((value.days, 'd'), (hours, 'h'), (minutes, 'min')):
+        if amount:
+            parts.append('{}{}'.format(amount, unit))
+    if value.microseconds:
+        parts.append('{}.{:06d}'.format(seconds, value.microseconds).rstrip('0') + 's')
+    elif seconds or not parts:
+        parts.append('{}s'.format(seconds))
+    return sign + (sign or '+').join(parts)
+
+
+def parse_temporal(text: str) -> Any:
+    """
+    Converts a displayed date, time or duration back to its value, or
+    returns None if text isn't one.
+    """
+    if _MOMENT.fullmatch(text) is not None:
+        return moment(text)
+    if _DURATIONS.fullmatch(text) is None:
+        return None
+    total = timedelta(0)
+    for match in _DURATION.finditer(text):
+        sign = -1 if match.start() > 0 and text[match.start() - 1] == '-' else 1
+        number, unit = match.groups()
+        total += sign * duration(float(number) if '.' in number else int(number), unit)
+    return total
+
+
+def easter(year: int) -> date:
+    """
+    Returns the date of Easter Sunday in the Gregorian calendar (the
+    anonymous Gregorian algorithm).
+    """
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month, day = divmod(h + l - 7 * m + 90, 25)
+    return date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+
+def _holiday_date(rule: Holiday, year: int) -> date:
+    """
+    Returns the date a holiday falls on in year, before it is moved off a
+    weekend.
+    """
+    if rule.kind == FIXED:
+        return date(year, rule.month, rule.day)
+    if rule.kind == EASTER:
+        return easter(year) + timedelta(days=rule.day)
+    if rule.n > 0:
+        first = date(year, rule.month, 1)
+        return first + timedelta(days=(rule.day - first.weekday()) % 7 + 7 * (rule.n - 1))
+    last = date(year + rule.month // 12, rule.month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - rule.day) % 7 + 7 * (-rule.n - 1))
+
+
+def holidays(calendar: str, year: int) -> List[int]:
+    """
+    Returns the sorted ordinals of the weekdays that are holidays from the
+    rules of year in calendar. A holiday moved off a weekend can fall in the
+    year before (e.g. New Year's Day observed on December 31st). The table
+    of each year is built once and kept.
+    """
+    return _holidays.get_or_create((calendar, year), lambda: _build_holidays(calendar, year))
+
+
+def _build_holidays(calendar: str, year: int) -> List[int]:
+    """
+    Builds the holiday table of a year on a cache miss.
+    """
+    if calendar not in CALENDARS:
+        raise ValueError('unknown calendar {!r}'.format(calendar))
+    rule, rules = CALENDARS[calendar]
+    days = sorted(_holiday_date(holiday, year).toordinal() for holiday in rules if year >= holiday.since)
+    taken = set()
+    for day in days:
+        weekday = (day - 1) % 7  # date.fromordinal(day).weekday()
+        if weekday >= 5 and rule == NEAREST:
+            day += -1 if weekday == 5 else 1
+        while (day - 1) % 7 >= 5 or day in taken:
+            day += 1
+        taken.add(day)
+    return sorted(taken)
+
+
+def _count(first: int, end: int, calendar: str = None) -> int:
+    """
+    Returns the number of working days in the ordinals first to end
+    (excluded): whole weeks and the weekday table give the weekdays, and the
+    holidays are the difference of the holidays before end and before
+    first, so the time taken doesn't grow with the number of years.
+    """
+    if end <= first:
+        return 0
+    weeks, days = divmod(end - first, 7)
+    count = 5 * weeks + _WORKDAYS[(first - 1) % 7][days]
+    if calendar is not None:
+        count -= _holidays_before(end, calendar) - _holidays_before(first, calendar)
+    return count
+
+
+def _holidays_before(day: int, calendar: str) -> int:
+    """
+    Returns the number of holidays of calendar before the ordinal day,
+    counted from the year its _totals were first made for (so only
+    differences mean anything). A table only holds days of its year and the
+    ones next to it, so the tables of the years around day's are bisected
+    and the earlier ones are counted whole.
+    """
+    year = date.fromordinal(min(day, date.max.toordinal())).year
+    below = max(year - 1, datetime.MINYEAR)
+    count = _table_totals(calendar, below)
+    for near in range(below, min(year + 1, datetime.MAXYEAR) + 1):
+        count += bisect_left(holidays(calendar, near), day)
+    return count
+
+
+def _table_totals(calendar: str, year: int) -> int:
+    """
+    Returns the number of holidays in the tables of the years from the
+    year calendar's _totals were first made for up to year (excluded, and
+    negative if year is earlier), extending the totals to year first. The
+    tables are built for their sizes without keeping them, so long ranges
+    don't push the nearby years out of the cache.
+    """
+    first, totals = _totals.get(calendar, (year, [0]))
+    if year < first:
+        sizes = [len(_build_holidays(calendar, earlier)) for earlier in range(year, first)]
+        before = list(itertools.accumulate(sizes, initial=0))
+        # the earlier years count back from the first year's total, so
+        # totals already returned keep their meaning
+        totals = [totals[0] - before[-1] + total for total in before[:-1]] + totals
+        first = year
+    while first + len(totals) - 1 < year:
+        totals.append(totals[-1] + len(_build_holidays(calendar, first + len(totals) - 1)))
+    _totals[calendar] = (first, totals)
+    return totals[year - first]
+
+
+def _ordinal(value: Any) -> int:
+    if not isinstance(value, date):
+        raise TypeError('expected a date')
+    return value.toordinal()
+
+
+def workdays(start: date, end: date, calendar: str = None) -> int:
+    """
+    Returns the number of working days from start up to but not including
+    end (negative if end is before start). Working days are Monday to
+    Friday, except the holidays of calendar (one of CALENDARS) if given.
+    """
+    first, end = _ordinal(start), _ordinal(end)
+    if end < first:
+        return -_count(end, first, calendar)
+    return _count(first, end, calendar)
+
+
+def add_workdays(start: date, n: Any, calendar: str = None) -> date:
+    """
+    Returns the date n working days after start (before it if n is
+    negative), keeping the time of day of a time. The answer is found by
+    bisection on workdays(), so it takes no longer for a large n.
+    """
+    count = as_integer(n)
+    if count is None:
+        raise ValueError('the number of working days must be a whole number')
+    first = _ordinal(start)
+    if count == 0:
+        return start
+
+    # the first day after start that ends count working days, or the last
+    # day before it that starts them
+    def enough(day: int) -> bool:
+        if count > 0:
+            return _count(first + 1, day + 1, calendar) >= count
+        return _count(day, first, calendar) >= -count
+
+    step = abs(count) * 7 // 5 + 7
+    low, high = (first, first + step) if count > 0 else (first - step, first)
+    while count > 0 and not enough(high):
+        low, high = high, high + step
+    while count < 0 and not enough(low):
+        low, high = low - step, low
+    while high - low > 1:
+        middle = (low + high) // 2
+        if enough(middle) == (count > 0):
+            high = middle
+        else:
+            low = middle
+    day = high if count > 0 else low
+    return start + timedelta(days=day - first)
@@ -0,0 +1,31 @@
+class CalculuxError(Exception):
+    """
+    Base class for all errors raised by the Calculux engine.
+    """
+
+
+class ParseError(CalculuxError, SyntaxError):
+    """
+    Raised when the text on the display is not a valid Calculux expression.
+    Subclasses SyntaxError so code that guards eval() keeps working.
+    """
+
+
+class ResourceLimitError(CalculuxError, ArithmeticError):
+    """
+    Raised instead of computing a result that would take too long or use too
+    much memory, such as 9^9^9.
+    """
+
+
+class EvaluationTimeout(ResourceLimitError):
+    """
+    Raised when an evaluation is cancelled for running too long.
+    """
+
+
+class WorkerError(CalculuxError):
+    """
+    Raised when the process evaluating an expression fails unexpectedly,
+    rather than with one of the errors evaluations give.
+    """
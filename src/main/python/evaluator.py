@@ -0,0 +1,711 @@
+# python built-in imports
+import argparse
+import decimal
+from decimal import Decimal
+from fractions import Fraction
+import math
+import sys
+from typing import Any, Callable, Iterable, Iterator
+
+# calculux imports
+import calculus
+from calculus import IntegrationError
+import dates
+from dates import CALENDARS, TEMPORAL
+from errors import EvaluationTimeout, ParseError, ResourceLimitError, WorkerError
+from expression import CACHE_SIZE, INTEGRATE, POWER, RECALL, Expression, ExpressionCache, compile_expression, normalize
+from optimizer import simplify
+import functions
+from history import History, parse_result
+import metrics
+import precision
+from precision import AUTO, FLOAT, FLOAT_DIGITS, FRACTION, MODES, Inexact, round_significant
+import radix
+from radix import BASES, WORD_SIZES, as_integer
+from stats import Stream, Summary
+from units import UnitError
+from worksheet import DefinitionError, Worksheet, parse_definition
+
+# errors that make an expression evaluate to an error message instead of
+# raising
+EVALUATION_ERRORS = (SyntaxError, ArithmeticError, ValueError, TypeError, NameError, MemoryError, RecursionError,
+                     WorkerError)
+
+# shown instead of a result when an expression can't be evaluated
+ERROR = 'ERROR'
+
+# the category shown after ERROR for each kind of error, the first class
+# that matches is used
+ERROR_CATEGORIES = (
+    (UnitError, 'units'),
+    (SyntaxError, 'syntax'),
+    (EvaluationTimeout, 'timeout'),
+    (ResourceLimitError, 'too large'),
+    (ZeroDivisionError, 'divide by 0'),
+    (OverflowError, 'overflow'),
+    (decimal.Overflow, 'overflow'),
+    (MemoryError, 'memory'),
+    (RecursionError, 'nesting'),
+    (Inexact, 'inexact'),
+    (IntegrationError, 'no convergence'),
+    (DefinitionError, 'definition'),
+    (ValueError, 'domain'),
+    (decimal.InvalidOperation, 'domain'),
+    (TypeError, 'type'),
+    (NameError, 'undefined'),
+    (ArithmeticError, 'math')
+)
+
+# number of decimal places results are rounded to when no number of
+# significant figures is set
+PLACES = 5
+
+# significant figures used by the decimal modes when none are set (the
+# decimal module's default precision)
+DIGITS = 28
+
+# the variable each value of a column is bound to (see
+# Evaluator.evaluate_column), and the stream of its values (see
+# Evaluator.aggregate)
+COLUMN = 'x'
+
+
+def round_result(result: Any, digits: int = None) -> Any:
+    """
+    Rounds a result to PLACES decimal places, or to digits significant
+    figures if given, dropping the imaginary part of complex results that
+    are real. Dates, times and durations are returned unchanged.
+    """
+    if digits is None:
+        def rounded(x): return round(x, PLACES)
+    else:
+        def rounded(x): return round_significant(x, digits)
+
+    if isinstance(result, TEMPORAL):
+        return result
+    if isinstance(result, complex):
+        if result.imag == 0:
+            # return a real number if imag part is 0
+            return rounded(result.real)
+        return complex(rounded(result.real), rounded(result.imag))
+    return rounded(result)
+
+
+def wrap_result(result: Any, word_size: int = None) -> Any:
+    """
+    Wraps a whole number result around to a signed word of word_size bits
+    (see radix.wrap). Other results, and all results without a word size,
+    are returned unchanged.
+    """
+    n = None if word_size is None else as_integer(result)
+    return result if n is None else radix.wrap(n, word_size)
+
+
+def format_result(result: Any, base: int = 10, word_size: int = None) -> str:
+    """
+    Formats a rounded result for the display: complex numbers are printed
+    without parentheses, exponents use E, fractions are shown as n/d and
+    decimals without trailing zeros.
+    Integers are shown in base, as literals that can be typed back in (see
+    radix.format_integer), and so are whole numbers in bases other than 10.
+    Anything else is shown in base 10. Dates, times and durations are shown
+    as literals (see dates.format_temporal).
+    """
+    if isinstance(result, TEMPORAL):
+        return dates.format_temporal(result)
+    if isinstance(result, complex):
+        text = str(result).strip('()')  # remove the parentheses
+    elif isinstance(result, int) or (base != 10 and as_integer(result) is not None):
+        text = radix.format_integer(as_integer(result), base, word_size)
+    elif isinstance(result, Decimal):
+        text = str(precision.trim_zeros(result))
+    else:
+        text = str(result)
+    return text.replace('e', 'E')
+
+
+def error_text(error: BaseException) -> str:
+    """
+    Returns the text displayed for an error, e.g. 'ERROR: divide by 0'.
+    """
+    for kind, category in ERROR_CATEGORIES:
+        if isinstance(error, kind):
+            return '{}: {}'.format(ERROR, category)
+    return ERROR
+
+
+class Evaluator:
+    """
+    Evaluates Calculux expressions without any GUI. Holds the same state the
+    calculator window keeps: memory, the previous result and the rad/deg
+    setting, along with a cache of compiled expressions.
+
+    precision selects how numbers are represented (see precision.MODES) and
+    digits the number of significant figures results are rounded to. With
+    the default float precision and no digits, results are rounded to PLACES
+    decimal places.
+
+    Every result is recorded in history, which is an in-memory History
+    unless one is given (e.g. one backed by a log file). PRV[n] refers to
+    the nth previous result.
+
+    Results are displayed in base (2 to 36), and numbers typed without a
+    prefix are read in it (ff is 255 in base 16). With a word_size (8, 16, 32 or
+    64 bits), whole number results wrap around to a signed word of that many
+    bits, and negative results are shown in two's complement in bases other
+    than 10.
+
+    workdays() and workday() skip the holidays of calendar (one of
+    dates.CALENDARS) as well as weekends, if it is given.
+
+    Expressions can use the variables and functions defined on worksheet
+    (a new one unless given), and definitions typed as expressions (a = 3.2,
+    f(x) = x^2 + sin(x)) are made on it. Definitions are computed with
+    floats whatever the precision.
+    """
+
+    def __init__(self, use_radians: bool = True, cache_size: int = CACHE_SIZE,
+                 precision: str = FLOAT, digits: int = None, history: History = None,
+                 base: int = 10, word_size: int = None, calendar: str = None, worksheet: Worksheet = None):
+        if precision not in MODES:
+            raise ValueError('precision must be one of {}, not {!r}'.format(MODES, precision))
+        if base not in BASES:
+            raise ValueError('base must be from {} to {}, not {!r}'.format(BASES.start, BASES.stop - 1, base))
+        if word_size is not None and word_size not in WORD_SIZES:
+            raise ValueError('word_size must be one of {}, not {!r}'.format(WORD_SIZES, word_size))
+        if calendar is not None and calendar not in CALENDARS:
+            raise ValueError('calendar must be one of {}, not {!r}'.format(tuple(CALENDARS), calendar))
+        self.memory = 0
+        self.use_radians = use_radians  # true for radians and false for degrees
+        self.precision = precision
+        self.digits = digits
+        self.base = base
+        self.word_size = word_size
+        self.calendar = calendar
+        self.history = History() if history is None else history
+        self.previous_result = self.history.recall(0) if len(self.history) > 0 else 0
+        self.worksheet = Worksheet() if worksheet is None else worksheet
+        self.expression_cache = ExpressionCache(cache_size)
+        self.namespaces = self.build_namespaces()
+        return
+
+    def build_namespaces(self) -> dict:
+        """
+        Returns the radians and degrees namespaces, keyed on use_radians.
+        """
+        namespaces = {True: functions.namespace(True), False: functions.namespace(False)}
+        for namespace in namespaces.values():
+            namespace[RECALL] = self.recall
+            namespace[POWER] = functions.power
+            namespace[INTEGRATE] = calculus.integrate
+            namespace['workdays'] = self.workdays
+            namespace['workday'] = self.workday
+        return namespaces
+
+    def __getstate__(self) -> dict:
+        """
+        Drops the compiled expressions and namespaces when pickling, since code
+        objects can't be pickled. They are rebuilt on unpickling so evaluators
+        can be sent to worker processes.
+        """
+        state = self.__dict__.copy()
+        state['expression_cache'] = self.expression_cache.maxsize
+        del state['namespaces']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.expression_cache = ExpressionCache(state['expression_cache'])
+        self.namespaces = self.build_namespaces()
+        return
+
+    def bindings(self) -> dict:
+        """
+        Returns the namespace for the current rad/deg setting, with the
+        previous result and memory bound to PRV and M and the worksheet
+        attached.
+        """
+        namespace = self.namespaces[self.use_radians]
+        namespace['PRV'] = self.previous_result
+        namespace['M'] = self.memory
+        self.worksheet.attach(namespace)
+        return namespace
+
+    def precise_bindings(self) -> dict:
+        """
+        Returns the bindings for precision.evaluate_precise: PRV, M, PRV[n]
+        and the worksheet variables.
+        """
+        self.bindings()
+        bindings = {'PRV': self.previous_result, 'M': self.memory, RECALL: self.recall}
+        bindings.update(self.worksheet.variable_values())
+        return bindings
+
+    def float_bindings(self) -> dict:
+        """
+        Returns bindings() with a precise previous result converted to a
+        float, for evaluating with floats.
+        """
+        namespace = self.bindings()
+        if isinstance(self.previous_result, (Decimal, Fraction)):
+            namespace['PRV'] = float(self.previous_result)
+        return namespace
+
+    def uses_floats(self) -> bool:
+        """
+        Returns whether expressions are evaluated with floats, which is the
+        case in AUTO mode as long as floats have enough significant figures
+        (and for results, such as complex ones, that only floats represent).
+        """
+        if self.precision == AUTO:
+            return self.digits is None or self.digits <= FLOAT_DIGITS
+        return self.precision == FLOAT
+
+    def compute(self, expression: str) -> Any:
+        """
+        Evaluates the expression and returns the rounded result, which also
+        becomes the previous result. A definition's result is the variable's
+        value, and for a function or a removed definition None is returned
+        and nothing is recorded. Errors are raised to the caller.
+        """
+        definition = parse_definition(expression)
+        worksheet = self.worksheet
+        if definition is not None:
+            value = self.define(*definition)
+            if value is None or definition[1] is not None:
+                return None
+            result = round_result(value, self.digits)
+        elif self.uses_floats():
+            compiled = self.expression_cache.compile(expression, worksheet.variables, worksheet.functions, self.base)
+            result = round_result(compiled(self.float_bindings()), self.digits)
+        else:
+            digits = self.digits or DIGITS
+            bindings = self.precise_bindings()
+            try:
+                result = precision.evaluate_precise(expression, self.precision, digits, bindings, self.use_radians,
+                                                    worksheet.variables, worksheet.functions, self.base)
+            except Inexact:
+                if self.precision != AUTO:
+                    raise
+                # e.g. a complex result, which only floats represent
+                compiled = self.expression_cache.compile(expression, worksheet.variables, worksheet.functions,
+                                                         self.base)
+                result = round_result(compiled(self.float_bindings()), min(digits, FLOAT_DIGITS))
+            else:
+                if self.precision != FRACTION:
+                    # exact results in AUTO mode are shown as decimals too
+                    result = round_significant(result, digits)
+        result = wrap_result(result, self.word_size)
+        self.record(expression, result)
+        return result
+
+    def record(self, expression: str, result: Any, text: str = None) -> None:
+        """
+        Makes result the previous result and records it in the history,
+        displayed as text (or as format() shows it, if not given).
+        """
+        self.previous_result = result
+        self.history.append(expression, self.format(result) if text is None else text)
+        return
+
+    def define(self, name: str, params: Any, formula: str) -> Any:
+        """
+        Makes a definition on the worksheet (see Worksheet.define).
+        """
+        self.bindings()
+        return self.worksheet.define(name, params, formula, self.base)
+
+    def format(self, result: Any) -> str:
+        """
+        Returns the display text for a result in the display base, wrapped
+        to the word size.
+        """
+        return format_result(wrap_result(result, self.word_size), self.base, self.word_size)
+
+    def evaluate(self, expression: str) -> str:
+        """
+        Evaluates the expression and returns the text to display, which is
+        an error message (see error_text) if it could not be evaluated. A
+        function definition or a removal is shown as typed.
+        """
+        try:
+            result = self.compute(expression)
+        except EVALUATION_ERRORS as error:
+            return error_text(error)
+        if result is None:
+            return normalize(expression)
+        return self.history[0].result
+
+    def preview(self, expression: str, tree: Any = None) -> Callable[[], str]:
+        """
+        Returns a function that evaluates the expression (already parsed into
+        tree, if given) and returns the text to display, or '' if it can't
+        be evaluated. Nothing is recorded, so the previous result and history
+        are unchanged. Memory, the previous result and the other settings
+        are read now, so the function can be called later from another
+        thread. In float mode, an expression that doesn't parse raises
+        ParseError here rather than in the function.
+        """
+        digits, base, word_size = self.digits, self.base, self.word_size
+        variables, functions = self.worksheet.variables, self.worksheet.functions
+        namespace = dict(self.float_bindings())
+        if self.uses_floats():
+            if tree is None:
+                compiled = self.expression_cache.compile(expression, variables, functions, base)
+            else:
+                compiled = Expression(expression, simplify(tree))
+
+            def compute():
+                result = wrap_result(round_result(compiled(namespace), digits), word_size)
+                return format_result(result, base, word_size)
+        else:
+            digits = digits or DIGITS
+            bindings = self.precise_bindings()
+            mode, radians = self.precision, self.use_radians
+
+            def compute():
+                try:
+                    result = precision.evaluate_precise(expression, mode, digits, bindings, radians, variables,
+                                                        functions, base)
+                except Inexact:
+                    if mode != AUTO:
+                        raise
+                    compiled = compile_expression(expression, variables, functions=functions, base=base)
+                    result = round_result(compiled(namespace), min(digits, FLOAT_DIGITS))
+                else:
+                    if mode != FRACTION:
+                        result = round_significant(result, digits)
+                return format_result(wrap_result(result, word_size), base, word_size)
+
+        def evaluate():
+            try:
+                return compute()
+            except EVALUATION_ERRORS:
+                return ''
+        return evaluate
+
+    def recall(self, n: int) -> Any:
+        """
+        Returns the nth previous result (PRV[n]). PRV[0] is the same as PRV.
+        """
+        if isinstance(n, complex):
+            n = n.real
+        if n != int(n):
+            raise ValueError('PRV[n] needs an integer n')
+        if n == 0:
+            value = self.previous_result
+        else:
+            try:
+                value = self.history.recall(int(n))
+            except IndexError:
+                raise ValueError('there is no result PRV[{}]'.format(int(n)))
+        if self.uses_floats() and isinstance(value, (Decimal, Fraction)):
+            value = float(value)
+        return value
+
+    def workdays(self, start: Any, end: Any) -> int:
+        """
+        Returns the number of working days from start up to end (see
+        dates.workdays).
+        """
+        return dates.workdays(start, end, self.calendar)
+
+    def workday(self, start: Any, n: Any) -> Any:
+        """
+        Returns the date n working days after start (see dates.add_workdays).
+        """
+        return dates.add_workdays(start, n, self.calendar)
+
+    def evaluate_column(self, expression: str, values: Iterable[str], variable: str = COLUMN) -> Iterator[str]:
+        """
+        Evaluates the expression for each value of a column, such as the
+        dates in a file, yielding the display text for each one ('' for a
+        blank value). Each value is written as a result would be displayed
+        (a number, date, time or duration) and is bound to variable. The
+        expression is parsed and compiled once and evaluated with floats,
+        and nothing is recorded in the history. Raises ParseError if the
+        expression doesn't parse.
+        """
+        worksheet = self.worksheet
+        compiled = compile_expression(expression, worksheet.variables | {variable}, functions=worksheet.functions,
+                                      base=self.base)
+        namespace = dict(self.bindings())
+        if isinstance(self.previous_result, (Decimal, Fraction)):
+            namespace['PRV'] = float(self.previous_result)
+        for value in values:
+            value = value.strip()
+            if not value:
+                yield ''
+                continue
+            try:
+                namespace[variable] = parse_result(value)
+                result = wrap_result(round_result(compiled(namespace), self.digits), self.word_size)
+            except EVALUATION_ERRORS as error:
+                yield error_text(error)
+                continue
+            yield self.format(result)
+
+    def evaluate_array(self, expression: str, values: Iterable, variable: str = COLUMN) -> Any:
+        """
+        Evaluates the expression once over a whole array of numbers with
+        NumPy, bound to variable (see vectorized.evaluate_compiled), with
+        this evaluator's angle setting, base, worksheet, PRV, PRV[n], memory
+        and calendar. Returns the array of unrounded results. Needs numpy
+        (requirements/extras.txt). Raises ParseError if the expression
+        doesn't parse.
+        """
+        # imported here so the calculator runs without numpy
+        import vectorized
+        worksheet = self.worksheet
+        compiled = self.expression_cache.compile(expression, worksheet.variables | {variable}, worksheet.functions,
+                                                 self.base)
+        bindings = vectorized.namespace(self.use_radians, self.float_bindings())
+        return vectorized.evaluate_compiled(compiled, bindings, values, variable)
+
+    def evaluate_column_array(self, expression: str, values: Iterable[str], variable: str = COLUMN) -> Iterator[str]:
+        """
+        Evaluates the expression for each value of a column as
+        evaluate_column does, but over all of them at once with
+        evaluate_array, which is much faster for long columns. The values
+        must be numbers, the results are floats (3.0 rather than 3), and a
+        result that is undefined for some value (1/x for 0) is nan or inf
+        rather than an error. An error that isn't for any one value, such as
+        a date function given the column, is shown on every line. Raises
+        ParseError if the expression doesn't parse.
+        """
+        # the display text of the lines that don't have a result ('' for a
+        # blank value), and nan in their place in the array
+        texts = []
+        numbers = []
+        for value in values:
+            value = value.strip()
+            text, number = '', math.nan
+            if value:
+                try:
+                    number = parse_result(value)
+                    if isinstance(number, TEMPORAL):
+                        raise TypeError('expected a number, not {!r}'.format(value))
+                    text, number = None, complex(number) if isinstance(number, complex) else float(number)
+                except EVALUATION_ERRORS as error:
+                    text, number = error_text(error), math.nan
+            texts.append(text)
+            numbers.append(number)
+        try:
+            results = self.evaluate_array(expression, numbers, variable).tolist()
+        except ParseError:
+            raise
+        except EVALUATION_ERRORS as error:
+            results = [error] * len(numbers)
+        for text, result in zip(texts, results):
+            if text is not None:
+                yield text
+            elif isinstance(result, BaseException):
+                yield error_text(result)
+            else:
+                yield self.format(wrap_result(round_result(result, self.digits), self.word_size))
+
+    def aggregate(self, expression: str, values: Iterable[str], variable: str = COLUMN,
+                  reader: Callable[[Iterable[str]], Summary] = None) -> str:
+        """
+        Evaluates the expression once with variable bound to the stream of
+        numbers in values (see stats.Stream), such as a column of a file, and
+        returns the display text. The aggregate functions read the stream in
+        a single pass without keeping it in memory, e.g. for mean(x) or
+        max(x) - min(x). reader summarizes the values instead of
+        stats.summarize_lines if given, e.g. in parallel. The expression is
+        evaluated with floats and nothing is recorded in the history.
+        Raises ParseError if the expression doesn't parse.
+        """
+        worksheet = self.worksheet
+        compiled = compile_expression(expression, worksheet.variables | {variable}, functions=worksheet.functions,
+                                      base=self.base)
+        namespace = dict(self.bindings())
+        if isinstance(self.previous_result, (Decimal, Fraction)):
+            namespace['PRV'] = float(self.previous_result)
+        namespace[variable] = Stream(values, reader)
+        try:
+            result = wrap_result(round_result(compiled(namespace), self.digits), self.word_size)
+        except EVALUATION_ERRORS as error:
+            return error_text(error)
+        return self.format(result)
+
+    def evaluate_many(self, expressions: Iterable[str]) -> Iterator[str]:
+        """
+        Evaluates each expression in turn, yielding the display text for each
+        one. PRV refers to the result of the previous expression.
+        """
+        for expression in expressions:
+            yield self.evaluate(expression)
+
+    def memory_clear(self) -> None:
+        """
+        Clears the value stored in memory.
+        """
+        self.memory = 0
+        return
+
+    def memory_add(self, value: float) -> None:
+        """
+        Adds (as in sum) value to memory. Raises TypeError for a date, time
+        or duration, which memory can't hold.
+        """
+        if isinstance(value, TEMPORAL):
+            raise TypeError('memory holds numbers, not {!r}'.format(value))
+        self.memory += value
+        return
+
+    def memory_subtract(self, value: float) -> None:
+        """
+        Subtracts value from memory. Raises TypeError for a date, time or
+        duration.
+        """
+        if isinstance(value, TEMPORAL):
+            raise TypeError('memory holds numbers, not {!r}'.format(value))
+        self.memory -= value
+        return
+
+
+def use_radians(mode: str) -> bool:
+    """
+    Converts a mode name ('rad' or 'deg') to the use_radians setting.
+    """
+    if mode not in ('rad', 'deg'):
+        raise ValueError("mode must be 'rad' or 'deg', not {!r}".format(mode))
+    return mode == 'rad'
+
+
+# shared evaluators for evaluate() so repeated calls reuse compiled expressions
+_evaluators = {}
+
+
+def evaluate(expression: str, mode: str = 'rad') -> str:
+    """
+    Evaluates a single expression and returns the text the calculator would
+    display for it.
+    """
+    radians = use_radians(mode)
+    if radians not in _evaluators:
+        _evaluators[radians] = Evaluator(radians)
+    return _evaluators[radians].evaluate(expression)
+
+
+def evaluate_many(expressions: Iterable[str], mode: str = 'rad') -> Iterator[str]:
+    """
+    Evaluates expressions in order with a fresh evaluator, so PRV chains from
+    one expression to the next.
+    """
+    return Evaluator(use_radians(mode)).evaluate_many(expressions)
+
+
+def main(argv=None) -> int:
+    """
+    Command line entry point. Reads one expression per line from a file or
+    stdin and writes one result per line to stdout. Blank lines are echoed so
+    output lines stay aligned with input lines.
+    """
+    parser = argparse.ArgumentParser(description='Evaluate Calculux expressions, one per line.')
+    parser.add_argument('file', nargs='?', type=argparse.FileType('r'), default=sys.stdin,
+                        help='file of expressions (default: stdin)')
+    parser.add_argument('--mode', choices=('rad', 'deg'), default='rad',
+                        help='angle unit for trigonometric functions')
+    parser.add_argument('--precision', choices=MODES, default=FLOAT,
+                        help='number representation (default: float)')
+    parser.add_argument('--digits', type=int, default=None,
+                        help='significant figures to round results to')
+    parser.add_argument('--base', type=int, choices=BASES, default=10, metavar='BASE',
+                        help='base results are shown in, from 2 to 36 (default: 10)')
+    parser.add_argument('--word-size', type=int, choices=WORD_SIZES, default=None,
+                        help='wrap whole number results around to a signed word of this many bits')
+    parser.add_argument('--calendar', choices=tuple(CALENDARS), default=None,
+                        help='holidays skipped by workdays() and workday() as well as weekends')
+    parser.add_argument('--column', metavar='EXPRESSION', default=None,
+                        help='evaluate EXPRESSION for each input line instead, with the line bound to {} '
+                             '(e.g. "{} + 90d" for a file of dates)'.format(COLUMN, COLUMN))
+    parser.add_argument('--vectorize', action='store_true',
+                        help='with --column, evaluate EXPRESSION over the whole column at once with NumPy, which is '
+                             'much faster for long columns of numbers (results are floats, and nan or inf where '
+                             'they are undefined)')
+    parser.add_argument('--aggregate', metavar='EXPRESSION', default=None,
+                        help='evaluate EXPRESSION once instead, with the input lines (one number each) bound to {} as '
+                             'a stream for the aggregate functions (e.g. "mean({})" or "percentile({}, 99)")'.format(
+                                 COLUMN, COLUMN, COLUMN))
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of worker processes (default: 1, no pool)')
+    parser.add_argument('--chunksize', type=int, default=1000,
+                        help='expressions sent to a worker at a time when --jobs > 1')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='cancel evaluations that take longer than this many seconds')
+    parser.add_argument('--memory-limit', type=int, default=None,
+                        help='megabytes of memory an evaluation may use (with --timeout)')
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help='time each stage of evaluation and write the timings to PATH, as JSON if it '
+                             'ends in .json and in the Prometheus text format otherwise (not with --jobs)')
+    args = parser.parse_args(argv)
+    if args.timeout is not None and args.jobs > 1:
+        parser.error('--timeout can only be used with --jobs 1')
+    if args.metrics is not None and args.jobs > 1:
+        parser.error('--metrics can only be used with --jobs 1')
+    if args.column is not None and (args.jobs > 1 or args.timeout is not None):
+        parser.error('--column can not be used with --jobs or --timeout')
+    if args.vectorize and args.column is None:
+        parser.error('--vectorize can only be used with --column')
+    if args.aggregate is not None and (args.column is not None or args.timeout is not None):
+        parser.error('--aggregate can not be used with --column or --timeout')
+    if args.metrics is not None:
+        metrics.registry.enable()
+
+    evaluator = Evaluator(use_radians(args.mode), precision=args.precision, digits=args.digits,
+                          base=args.base, word_size=args.word_size, calendar=args.calendar)
+    with args.file:
+        if args.column is not None:
+            evaluate_column = evaluator.evaluate_column_array if args.vectorize else evaluator.evaluate_column
+            try:
+                for result in evaluate_column(args.column, args.file):
+                    sys.stdout.write(result + '\n')
+            except SyntaxError as error:
+                parser.error('--column: {}'.format(error))
+        elif args.aggregate is not None:
+            reader = None
+            if args.jobs > 1:
+                # the partial summaries of chunks of the column are merged
+                from parallel import summarize_parallel
+
+                def reader(lines):
+                    return summarize_parallel(lines, args.jobs, args.chunksize)
+            try:
+                sys.stdout.write(evaluator.aggregate(args.aggregate, args.file, reader=reader) + '\n')
+            except SyntaxError as error:
+                parser.error('--aggregate: {}'.format(error))
+        elif args.jobs > 1:
+            # imported here so the single process path doesn't load the pool
+            from parallel import ThroughputSummary, evaluate_parallel
+            summary = ThroughputSummary()
+            for result in evaluate_parallel(args.file, evaluator, args.jobs, args.chunksize, summary):
+                sys.stdout.write(result + '\n')
+            sys.stderr.write(summary.report() + '\n')
+        else:
+            runner = evaluator
+            if args.timeout is not None:
+                # imported here so evaluations without limits run in process
+                from sandbox import Sandbox
+                memory_limit = None if args.memory_limit is None else args.memory_limit << 20
+                runner = Sandbox(evaluator, args.timeout, memory_limit)
+            for line in args.file:
+                expression = line.strip()
+                result = runner.evaluate(expression) if expression else ''
+                sys.stdout.write(result + '\n')
+
+    if args.metrics is not None:
+        metrics.registry.export(args.metrics)
+    return 0
+
+
+# the stages of evaluation timed when metrics are enabled
+metrics.register(ExpressionCache, 'compile', 'parse')
+metrics.register(Expression, '__call__', 'eval')
+metrics.register(precision, 'evaluate_precise', 'eval')
+metrics.register(sys.modules[__name__], 'format_result', 'format')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,711 @@
+# python built-in imports
+import ast
+import re
+from types import CodeType
+from typing import Any, Iterable, List, Sequence, Tuple
+
+# calculux imports
+from cache import LRUCache
+from calculus import derivative, substitute
+import dates
+from dates import DURATION_PATTERN, IN, MOMENT_PATTERN, SHOW_IN, invalid_date
+from errors import ParseError
+from nodes import BinOp, Call, Integral, Name, Number, Text, UnaryOp
+from optimizer import simplify
+import radix
+from radix import DIGITS, MARK
+import units
+from units import CONVERT
+
+
+# names that must be followed by an argument list
+FUNCTIONS = frozenset({
+    'sin', 'asin', 'cos', 'acos', 'tan', 'atan',
+    'ln', 'log', 'log10', 'sqrt', 'abs', 'fact', 'mod', 'x_rt',
+    'radians', 'degrees', 'd', 'int', 'workdays', 'workday',
+    'sum', 'mean', 'stdev', 'min', 'max', 'median', 'percentile'
+})
+
+# names that stand for a value, either a constant or a binding supplied at
+# evaluation time
+CONSTANTS = frozenset({'pi', 'e', 'j', 'PRV', 'M'})
+
+# the scientific notation operator (2E3 == 2*10^3)
+EXPONENT = 'E'
+
+# PRV[n] is parsed as a call to this function, which returns the nth previous
+# result (it isn't a name the user can type)
+RECALL = 'recall'
+
+# x^y is compiled to a call to this function, which refuses integer powers
+# too large to compute, unless an operand is a float or complex literal
+POWER = 'power'
+
+# int(expr, x, a, b) is compiled to a call to this function with a lambda
+# that evaluates expr at a list of points, named POINTS
+INTEGRATE = 'integrate'
+POINTS = '_points'
+
+# the bitwise operators, loosest first, and the functions they are parsed
+# into. They are looser than + and - as in Python, but ^ is already the
+# power, so exclusive or is written xor
+BITWISE_LEVELS = (('|',), ('xor',), ('&',), ('<<', '>>'))
+BITWISE = {
+    '|': 'bit_or', 'xor': 'bit_xor', '&': 'bit_and',
+    '<<': 'shift_left', '>>': 'shift_right', '~': 'bit_not'
+}
+XOR = 'xor'
+LOOSE = frozenset(op for level in BITWISE_LEVELS for op in level)
+
+# default number of compiled expressions kept by an ExpressionCache
+CACHE_SIZE = 256
+
+_TOKEN_PATTERN = (
+    r'\s*(?:(?P<number>0[xX][0-9A-Fa-f]+|0[oO][0-7]+|0[bB][01]+|\d+#[0-9A-Za-z]+|'
+    + '{}' + DURATION_PATTERN + r'|\d+\.?\d*|\.\d+)'
+    r'|(?P<word>[A-Za-z_][A-Za-z_0-9]*)|(?P<op><<|>>|[-+*/^(),\[\]&|~]))'
+)
+_TOKEN = re.compile(_TOKEN_PATTERN.format(MOMENT_PATTERN + '|'))
+# the same without date and time literals, for text shaped like a date that
+# doesn't exist
+_ARITHMETIC = re.compile(_TOKEN_PATTERN.format(''))
+_DIGITS = re.compile(r'\d+')
+
+# names that keep their meaning in bases whose digits they are made of
+# (PRV in base 36), unlike the constants e, pi and j
+STATE = frozenset({'PRV', 'M'})
+
+
+def tokenize(text: str, start: int = 0) -> List[Tuple[str, str, int]]:
+    """
+    Splits the display text from position start into (kind, text, position)
+    tuples where kind is one of 'number', 'word' or 'op'. Date, time and
+    duration literals are numbers, unless the date doesn't exist (1234-56-78
+    is a subtraction). Words are resolved by the parser since the keypad
+    lets names run together (e.g. 2E3j).
+    """
+    tokens = []
+    pos = start
+    end = len(text.rstrip())
+    while pos < end:
+        match = _TOKEN.match(text, pos)
+        if match is not None and match.lastgroup == 'number' and invalid_date(match.group('number')):
+            match = _ARITHMETIC.match(text, pos)
+        if match is None:
+            raise ParseError('unexpected character {!r}'.format(text[pos]))
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind), match.start(kind)))
+        pos = match.end()
+    return tokens
+
+
+def read_base(tokens: Sequence[Tuple[str, str, int]], base: int,
+              names: Iterable[str] = ()) -> List[Tuple[str, str, int]]:
+    """
+    Returns the tokens with the numbers written in base read as such: each
+    run of adjacent number and word tokens made only of the base's digits
+    becomes a base#digits literal, e.g. ff or 1f in base 16. The letters
+    that are digits take precedence over the constants (e in base 16), but
+    not over PRV, M, names (variables and functions) or a word followed by
+    '(' (a call), and prefixed literals (0b101 in base 16) keep their own
+    base.
+    """
+    digits = DIGITS[:base]
+    names = STATE | frozenset(names)
+
+    def is_digits(i):
+        kind, text, _ = tokens[i]
+        if kind == 'word' and (text in names or i + 1 < len(tokens) and tokens[i+1][1] == '('):
+            return False
+        if kind == 'number' and text[:2].lower() in ('0x', '0o', '0b'):
+            return False
+        # decimal digits that aren't digits of a smaller base are refused by
+        # radix.parse_literal rather than read in base 10
+        if kind == 'number' and text.isdigit():
+            return True
+        return kind in ('number', 'word') and all(c in digits for c in text.upper())
+
+    result = []
+    i = 0
+    while i < len(tokens):
+        if not is_digits(i):
+            result.append(tokens[i])
+            i += 1
+            continue
+        start = tokens[i][2]
+        text = tokens[i][1]
+        i += 1
+        while i < len(tokens) and tokens[i][2] == start + len(text) and is_digits(i):
+            text += tokens[i][1]
+            i += 1
+        result.append(('number', '{}{}{}'.format(base, MARK, text), start))
+    return result
+
+
+class Parser:
+    """
+    Recursive descent parser for the calculator grammar:
+
+        input   := bits | bits? unit 'to' unit | bits 'in' (unit | zone)
+        bits    := xor ('|' xor)*
+        xor     := and ('xor' and)*
+        and     := shift ('&' shift)*
+        shift   := sum (('<<' | '>>') sum)*
+        sum     := term (('+' | '-') term)*
+        term    := unary (('*' | '/') unary | 'E' unary | 'j')*
+        unary   := ('+' | '-' | '~') unary | power
+        power   := primary ('^' unary)?
+        primary := number | name | function '(' bits (',' bits)* ')' | '(' bits ')'
+                 | user_function '(' bits (',' bits)* ')'
+                 | 'PRV' '[' bits ']'
+                 | 'd' '(' bits ',' variable (',' bits)? ')'
+                 | 'int' '(' bits ',' variable ',' bits ',' bits ')'
+
+    The precedences match what the old string substitution produced for
+    Python's eval(): 'E' expanded to '*10**' and 'j' to '*1j'. Bitwise
+    operators are parsed into calls (see BITWISE), like PRV[n]. Units are
+    parsed by units.UnitTable, and a conversion becomes a multiplication of
+    the value (1 if there is none) by the conversion factor. Date, time and
+    duration literals are numbers parsed by dates.literal, and 'in' shows a
+    duration in a unit of time or a time in a time zone (see dates.show_in).
+    Names in functions are accepted as user functions (see worksheet), and
+    numbers without a prefix are read in base (see read_base).
+    """
+
+    def __init__(self, text: str, variables: Iterable[str] = (), tokens: Iterable[Tuple[str, str, int]] = None,
+                 functions: Iterable[str] = (), base: int = 10):
+        self.tokens = tokenize(text) if tokens is None else list(tokens)
+        self.pos = 0
+        self.variables = frozenset(variables)
+        self.functions = frozenset(functions)
+        self.base = base
+        if base != 10:
+            self.tokens = read_base(self.tokens, base, self.variables | self.functions)
+        self.vocabulary = FUNCTIONS | CONSTANTS | self.variables | self.functions | {EXPONENT, XOR}
+        self.bound = self.variables  # variables that have a value here
+        return
+
+    def parse(self) -> Any:
+        """
+        Parses the whole token stream and returns the root node.
+        """
+        if not self.tokens:
+            raise ParseError('empty expression')
+        for i, (kind, text, _) in enumerate(self.tokens):
+            if kind == 'word' and text == CONVERT:
+                return self.conversion(i)
+        for i, (kind, text, _) in enumerate(self.tokens):
+            if kind == 'word' and text == IN:
+                value = Parser('', self.variables, self.tokens[:i], self.functions, self.base).parse()
+                return Call(SHOW_IN, (value, dates.target(self.tokens[i+1:])))
+        node = self.bits()
+        if self.pos < len(self.tokens):
+            raise ParseError('unexpected {!r}'.format(self.tokens[self.pos][1]))
+        return node
+
+    def conversion(self, to: int) -> Any:
+        """
+        Parses 'value unit to unit', where tokens[to] is the 'to'.
+        """
+        start = units.find_unit(self.tokens[:to], self.vocabulary - FUNCTIONS - self.functions)
+        value = Number(1)
+        if start > 0:
+            value = Parser('', self.variables, self.tokens[:start], self.functions, self.base).parse()
+        return units.convert(value, self.tokens[start:to], self.tokens[to+1:])
+
+    def peek(self) -> Tuple[str, str, int]:
+        """
+        Returns the next token without consuming it, splitting words that
+        are made of several names run together.
+        """
+        if self.pos >= len(self.tokens):
+            return ('end', '', -1)
+        token = self.tokens[self.pos]
+        if token[0] == 'word' and token[1] not in self.vocabulary:
+            self.tokens[self.pos:self.pos+1] = self.split_word(token)
+            token = self.tokens[self.pos]
+        return token
+
+    def next(self) -> Tuple[str, str, int]:
+        """
+        Consumes and returns the next token.
+        """
+        token = self.peek()
+        if token[0] == 'end':
+            raise ParseError('unexpected end of expression')
+        self.pos += 1
+        return token
+
+    def accept(self, kind: str, *texts: str) -> bool:
+        """
+        Consumes the next token if it matches, and reports whether it did.
+        """
+        token = self.peek()
+        if token[0] == kind and token[1] in texts:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind: str, text: str) -> None:
+        """
+        Consumes the next token, which must match.
+        """
+        if not self.accept(kind, text):
+            token = self.peek()
+            found = 'end of expression' if token[0] == 'end' else repr(token[1])
+            raise ParseError('expected {!r} but found {}'.format(text, found))
+        return
+
+    def split_word(self, token: Tuple[str, str, int]) -> List[Tuple[str, str, int]]:
+        """
+        Splits a word such as 'E3j' or 'PRVj' into the names and digits it
+        is made of, always taking the longest name that matches.
+        """
+        _, word, start = token
+        pieces = []
+        i = 0
+        while i < len(word):
+            digits = _DIGITS.match(word, i)
+            if digits is not None:
+                pieces.append(('number', digits.group(), start+i))
+                i = digits.end()
+                continue
+            for name in sorted(self.vocabulary, key=len, reverse=True):
+                if word.startswith(name, i):
+                    pieces.append(('word', name, start+i))
+                    i += len(name)
+                    break
+            else:
+                raise ParseError('unknown name {!r}'.format(word))
+        return pieces
+
+    def bits(self, level: int = 0) -> Any:
+        """
+        Parses the bitwise operators from BITWISE_LEVELS[level] on.
+        """
+        if level == len(BITWISE_LEVELS):
+            return self.sum()
+        node = self.bits(level + 1)
+        while True:
+            text = self.peek()[1]
+            if text in BITWISE_LEVELS[level]:
+                self.pos += 1
+                node = Call(BITWISE[text], (node, self.bits(level + 1)))
+            else:
+                return node
+
+    def sum(self) -> Any:
+        node = self.term()
+        while True:
+            token = self.peek()
+            if token[0] == 'op' and token[1] in '+-':
+                self.pos += 1
+                node = BinOp(token[1], node, self.term())
+            else:
+                return node
+
+    def term(self) -> Any:
+        node = self.unary()
+        while True:
+            token = self.peek()
+            if token[0] == 'op' and token[1] in '*/':
+                self.pos += 1
+                node = BinOp(token[1], node, self.unary())
+            elif token == ('word', EXPONENT, token[2]):
+                self.pos += 1
+                node = BinOp('*', node, BinOp('^', Number(10), self.unary()))
+            elif token == ('word', 'j', token[2]):
+                self.pos += 1
+                node = BinOp('*', node, Name('j'))
+            else:
+                return node
+
+    def unary(self) -> Any:
+        token = self.peek()
+        if token[0] == 'op' and token[1] in '+-':
+            self.pos += 1
+            return UnaryOp(token[1], self.unary())
+        if token[0] == 'op' and token[1] == '~':
+            self.pos += 1
+            return Call(BITWISE['~'], (self.unary(),))
+        return self.power()
+
+    def power(self) -> Any:
+        node = self.primary()
+        if self.accept('op', '^'):
+            node = BinOp('^', node, self.unary())
+        return node
+
+    def primary(self) -> Any:
+        kind, text, _ = self.next()
+        if kind == 'number':
+            if dates.is_literal(text):
+                return dates.literal(text)
+            if '.' in text:
+                return Number(float(text))
+            try:
+                return Number(radix.parse_literal(text))
+            except ValueError as error:
+                raise ParseError(str(error))
+        if kind == 'op' and text == '(':
+            node = self.bits()
+            self.expect('op', ')')
+            return node
+        if kind == 'word' and text in ('d', 'int'):
+            return self.calculus(text)
+        if kind == 'word' and (text in FUNCTIONS or text in self.functions):
+            self.expect('op', '(')
+            args = [self.bits()]
+            while self.accept('op', ','):
+                args.append(self.bits())
+            self.expect('op', ')')
+            return Call(text, tuple(args))
+        if kind == 'word' and text == 'PRV' and self.accept('op', '['):
+            index = self.bits()
+            self.expect('op', ']')
+            return Call(RECALL, (index,))
+        if kind == 'word' and text not in (EXPONENT, XOR):
+            return Name(text)
+        raise ParseError('unexpected {!r}'.format(text))
+
+    def calculus(self, func: str) -> Any:
+        """
+        Parses the arguments of d() or int(). The variable comes after the
+        expression it is used in, so it is found first by scanning ahead for
+        the comma that ends the expression. d(expr, x) is the derivative
+        where x already has a value (e.g. inside int()), d(expr, x, a) is
+        the derivative at x = a.
+        """
+        self.expect('op', '(')
+        var = self.scan_variable()
+        vocabulary, bound = self.vocabulary, self.bound
+        self.vocabulary, self.bound = vocabulary | {var}, bound | {var}
+        try:
+            body = self.bits()
+            self.expect('op', ',')
+            self.next()  # the variable
+        finally:
+            self.vocabulary, self.bound = vocabulary, bound
+
+        if func == 'int':
+            self.expect('op', ',')
+            low = self.bits()
+            self.expect('op', ',')
+            high = self.bits()
+            self.expect('op', ')')
+            return Integral(body, var, low, high)
+
+        slope = derivative(body, var)
+        if self.accept('op', ','):
+            point = self.bits()
+            self.expect('op', ')')
+            return substitute(slope, var, point)
+        self.expect('op', ')')
+        if var not in bound:
+            raise ParseError('{0} has no value here, use d(expr, {0}, a) for the derivative at {0} = a'.format(var))
+        return slope
+
+    def scan_variable(self) -> str:
+        """
+        Returns the name after the first comma at this bracket depth, which
+        must be a new variable name.
+        """
+        depth = 0
+        for i in range(self.pos, len(self.tokens)):
+            kind, text, _ = self.tokens[i]
+            if kind == 'op' and text in '([':
+                depth += 1
+            elif kind == 'op' and text in ')]':
+                depth -= 1
+                if depth < 0:
+                    break
+            elif kind == 'op' and text == ',' and depth == 0:
+                if i + 1 < len(self.tokens) and self.tokens[i+1][0] == 'word':
+                    var = self.tokens[i+1][1]
+                    if var in FUNCTIONS or var in CONSTANTS or var in (EXPONENT, XOR, CONVERT, IN) or var.startswith('_'):
+                        raise ParseError('{!r} can not be used as a variable'.format(var))
+                    return var
+                break
+        raise ParseError('expected a variable after the expression')
+
+
+def parse(text: str, variables: Iterable[str] = (), functions: Iterable[str] = (), base: int = 10) -> Any:
+    """
+    Parses the display text into an expression tree. Names in variables are
+    accepted as free variables and names in functions as functions, in
+    addition to the calculator's own names, and numbers without a prefix
+    are read in base.
+    """
+    return Parser(text, variables, functions=functions, base=base).parse()
+
+
+class IncrementalParser:
+    """
+    Parses text that is edited a little at a time, such as the display while
+    an expression is typed. The tokens and the tree of every complete term
+    of the top level sum are kept between calls, so after an edit only the
+    tokens from the first changed character on are scanned again and only
+    the terms from there on are parsed again. The trees are identical to
+    the ones parse() returns, with the same variable and function names and
+    base.
+    """
+
+    def __init__(self, variables: Iterable[str] = (), functions: Iterable[str] = (), base: int = 10):
+        self.variables = frozenset(variables)
+        self.functions = frozenset(functions)
+        self.base = base
+        # names followed by an argument list, which never end a value
+        self.calls = (FUNCTIONS | self.functions) - self.variables
+        self.text = ''
+        self.tokens = []
+        # (index of the '+' or '-' token after the term, sum of the terms up
+        # to and including it) for each complete top level term
+        self.sums = []
+        return
+
+    def reset(self) -> None:
+        """
+        Forgets the kept state, so the next call parses from scratch.
+        """
+        self.text = ''
+        self.tokens = []
+        self.sums = []
+        return
+
+    def parse(self, text: str) -> Any:
+        """
+        Parses text, reusing what is unchanged since the last call. Raises
+        ParseError as parse() would.
+        """
+        # find how much of the text is unchanged (typing and deleting at the
+        # end are checked for first)
+        if text.startswith(self.text):
+            same = len(self.text)
+        elif self.text.startswith(text):
+            same = len(text)
+        else:
+            same = 0
+            while text[same] == self.text[same]:
+                same += 1
+
+        # keep the tokens that end before the edit (a token that reaches it
+        # could run on, e.g. 12 becoming 123, and so could one that ends a
+        # character before it, e.g. 0 and x becoming 0x1) and scan the rest
+        # again. Edits are usually at the end, so look for the first changed
+        # token from there
+        kept = len(self.tokens)
+        while kept > 0 and self.tokens[kept-1][2] + len(self.tokens[kept-1][1]) >= same - 1:
+            kept -= 1
+        # a date is scanned as subtractions until its day is typed (2026-10-1
+        # becoming 2026-10-18), so the year, month and '-' signs running into
+        # the first token scanned again are scanned again too
+        for _ in range(4):
+            if kept == 0 or kept == len(self.tokens):
+                break
+            kind, token, position = self.tokens[kept-1]
+            if position + len(token) != self.tokens[kept][2] or not (kind == 'number' or token == '-'):
+                break
+            kept -= 1
+        # and a time zone is scanned as words until its ']' is typed, so the
+        # last time before the edit is scanned again with everything after it
+        for i in range(kept - 1, -1, -1):
+            if ':' in self.tokens[i][1]:
+                kept = i
+                break
+        start = self.tokens[kept-1][2] + len(self.tokens[kept-1][1]) if kept > 0 else 0
+        try:
+            self.tokens[kept:] = tokenize(text, start)
+        except ParseError:
+            self.reset()
+            raise
+        self.text = text
+
+        # keep the sums whose terms and following operator are unchanged
+        while self.sums and self.sums[-1][0] >= kept:
+            self.sums.pop()
+        if not self.tokens:
+            raise ParseError('empty expression')
+
+        # a conversion applies to the whole value and bitwise operators are
+        # looser than the top level sum, so then there are no terms to keep
+        if any(text in LOOSE or text in (CONVERT, IN) for _, text, _ in self.tokens):
+            self.sums = []
+            return Parser('', self.variables, self.tokens, self.functions, self.base).parse()
+
+        # parse the remaining terms, one per top level '+' or '-'
+        first = self.sums[-1][0] + 1 if self.sums else 0
+        for end in self.split(first):
+            self.sums.append((end, self.join(first, end)))
+            first = end + 1
+        return self.join(first, len(self.tokens))
+
+    def join(self, first: int, end: int) -> Any:
+        """
+        Parses the term in tokens[first:end] and adds it to the kept sum.
+        """
+        node = Parser('', self.variables, self.tokens[first:end], self.functions, self.base).parse()
+        if not self.sums:
+            return node
+        op = self.tokens[first-1][1]
+        return BinOp(op, self.sums[-1][1], node)
+
+    def split(self, first: int) -> List[int]:
+        """
+        Returns the indices of the binary '+' and '-' tokens outside of any
+        brackets from tokens[first] on. A sign is only taken as binary when
+        it follows something that ends a value, otherwise it is left in the
+        term (where the parser resolves it), so a term is never split wrong.
+        """
+        ends = []
+        depth = 0
+        previous = None
+        for i in range(first, len(self.tokens)):
+            kind, text, _ = self.tokens[i]
+            if kind == 'op' and text in '([':
+                depth += 1
+            elif kind == 'op' and text in ')]':
+                depth -= 1
+            elif kind == 'op' and text in '+-' and depth == 0 and self.ends_value(previous):
+                ends.append(i)
+            previous = self.tokens[i]
+        return ends
+
+    def ends_value(self, token: Tuple[str, str, int]) -> bool:
+        """
+        Returns whether a token can be the last one of a value.
+        """
+        if token is None:
+            return False
+        kind, text, _ = token
+        if kind == 'op':
+            return text in ')]'
+        if kind == 'word':
+            return text not in self.calls and not text.endswith(EXPONENT)
+        return True
+
+
+_OPERATORS = {'+': ast.Add, '-': ast.Sub, '*': ast.Mult, '/': ast.Div, '^': ast.Pow}
+_UNARY_OPERATORS = {'+': ast.UAdd, '-': ast.USub}
+
+
+# every generated node is given the same location, which is cheaper than
+# ast.fix_missing_locations walking the tree after it is built
+_LOCATION = {'lineno': 1, 'col_offset': 0, 'end_lineno': 1, 'end_col_offset': 0}
+
+
+def _inexact(node: Any) -> bool:
+    """
+    Returns whether node is a float or complex literal.
+    """
+    return isinstance(node, Number) and isinstance(node.value, (float, complex))
+
+
+def to_python(node: Any) -> ast.expr:
+    """
+    Translates an expression tree into the equivalent Python AST.
+    """
+    if isinstance(node, (Number, Text)):
+        return ast.Constant(node.value, **_LOCATION)
+    if isinstance(node, Name):
+        return ast.Name(node.id, ast.Load(), **_LOCATION)
+    if isinstance(node, UnaryOp):
+        return ast.UnaryOp(_UNARY_OPERATORS[node.op](), to_python(node.operand), **_LOCATION)
+    if isinstance(node, BinOp) and node.op == '^' and not _inexact(node.left) and not _inexact(node.right):
+        func = ast.Name(POWER, ast.Load(), **_LOCATION)
+        return ast.Call(func, [to_python(node.left), to_python(node.right)], [], **_LOCATION)
+    if isinstance(node, BinOp):
+        return ast.BinOp(to_python(node.left), _OPERATORS[node.op](), to_python(node.right), **_LOCATION)
+    if isinstance(node, Call):
+        func = ast.Name(node.func, ast.Load(), **_LOCATION)
+        return ast.Call(func, [to_python(arg) for arg in node.args], [], **_LOCATION)
+    if isinstance(node, Integral):
+        # integrate(lambda _points: [body for var in _points], low, high)
+        loop = ast.comprehension(ast.Name(node.var, ast.Store(), **_LOCATION),
+                                 ast.Name(POINTS, ast.Load(), **_LOCATION), [], 0)
+        arguments = ast.arguments([], [ast.arg(POINTS, **_LOCATION)], None, [], [], None, [])
+        batch = ast.Lambda(arguments, ast.ListComp(to_python(node.body), [loop], **_LOCATION), **_LOCATION)
+        func = ast.Name(INTEGRATE, ast.Load(), **_LOCATION)
+        return ast.Call(func, [batch, to_python(node.low), to_python(node.high)], [], **_LOCATION)
+    raise TypeError('unknown node {!r}'.format(node))
+
+
+class Expression:
+    """
+    A display expression that has been parsed and compiled to bytecode once,
+    and can then be evaluated any number of times against a namespace that
+    binds the calculator functions and values such as PRV and M.
+    """
+    __slots__ = ('text', 'tree', 'code')
+
+    def __init__(self, text: str, tree: Any):
+        self.text = text
+        self.tree = tree
+        source = ast.Expression(to_python(tree))
+        self.code = compile(source, '<calculux>', 'eval')
+        return
+
+    def __call__(self, namespace: dict) -> Any:
+        """
+        Evaluates the compiled expression. The namespace is used as the
+        globals, so it should map '__builtins__' to an empty dict.
+        """
+        return eval(self.code, namespace)
+
+    def __repr__(self) -> str:
+        return 'Expression({!r})'.format(self.text)
+
+
+def compile_function(tree: Any, params: Sequence[str]) -> CodeType:
+    """
+    Compiles an expression tree into the code of a lambda taking params,
+    which evaluates to a Python function when run against a namespace.
+    """
+    arguments = ast.arguments([], [ast.arg(param, **_LOCATION) for param in params], None, [], [], None, [])
+    source = ast.Expression(ast.Lambda(arguments, to_python(tree), **_LOCATION))
+    return compile(source, '<calculux>', 'eval')
+
+
+def compile_expression(text: str, variables: Iterable[str] = (), optimize: bool = True,
+                       functions: Iterable[str] = (), base: int = 10) -> Expression:
+    """
+    Parses and compiles the display text into a reusable Expression (see
+    parse). Unless optimize is false, the tree is simplified first (see
+    optimizer.simplify) so constant parts are computed once rather than on
+    every evaluation.
+    """
+    tree = parse(text, variables, functions, base)
+    if optimize:
+        tree = simplify(tree)
+    return Expression(text, tree)
+
+
+def normalize(text: str) -> str:
+    """
+    Strips and collapses whitespace so trivially different display strings
+    share one compiled expression.
+    """
+    return ' '.join(text.split())
+
+
+class ExpressionCache(LRUCache):
+    """
+    LRU cache of compiled expressions keyed on the normalized display text,
+    the names of the worksheet variables and functions and the input base,
+    which change how text parses (so evaluators with different worksheets
+    or bases can share a cache). Values that change between evaluations (PRV, M, the rad/deg
+    mode) are bindings in the evaluation namespace, so cached code is always
+    reusable.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        super().__init__(maxsize)
+        return
+
+    def compile(self, text: str, variables: Iterable[str] = (), functions: Iterable[str] = (),
+                base: int = 10) -> Expression:
+        """
+        Returns the compiled expression for text, compiling it on a miss
+        with the given variable and function names and base.
+        """
+        key = (normalize(text), frozenset(variables), frozenset(functions), base)
+        return self.get_or_create(key, lambda: compile_expression(key[0], variables, functions=functions, base=base))
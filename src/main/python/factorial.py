@@ -0,0 +1,109 @@
+# python built-in imports
+import cmath
+import itertools
+import math
+import operator
+from typing import Union
+
+# calculux imports
+from limits import check_factorial
+
+# n! is looked up directly for n up to SMALL_LIMIT (170! is the largest
+# factorial that fits in a float)
+SMALL_LIMIT = 170
+
+# n! for SMALL_LIMIT < n <= MEMO_LIMIT is built from the nearest memoized
+# checkpoint, one every CHECKPOINT_SPACING values of n
+MEMO_LIMIT = 20000
+CHECKPOINT_SPACING = 256
+
+# coefficients for the Lanczos approximation of gamma (g = 7, n = 9)
+LANCZOS_G = 7
+LANCZOS_COEFFICIENTS = (
+    0.99999999999980993,
+    676.5203681218851,
+    -1259.1392167224028,
+    771.32342877765313,
+    -176.61502916214059,
+    12.507343278686905,
+    -0.13857109526572012,
+    9.9843695780195716e-6,
+    1.5056327351493116e-7
+)
+
+_table = list(itertools.accumulate(range(1, SMALL_LIMIT+1), operator.mul, initial=1))
+_checkpoints = [1]  # _checkpoints[k] == (k*CHECKPOINT_SPACING)!
+
+
+def range_product(low: int, high: int) -> int:
+    """
+    Returns the product of the integers from low to high inclusive, by
+    binary splitting so the big multiplications are between operands of
+    similar size.
+    """
+    if low > high:
+        return 1
+    if high - low < 8:
+        product = low
+        for i in range(low+1, high+1):
+            product *= i
+        return product
+    middle = (low + high) // 2
+    return range_product(low, middle) * range_product(middle+1, high)
+
+
+def int_factorial(n: int) -> int:
+    """
+    Returns n! exactly for a non-negative integer n.
+    """
+    if n < 0:
+        raise ValueError('factorial is not defined for negative integers')
+    if n <= SMALL_LIMIT:
+        return _table[n]
+    if n > MEMO_LIMIT:
+        check_factorial(n)
+        # CPython's math.factorial splits the product into odd parts and
+        # multiplies them by binary splitting in C, which beats anything
+        # written in Python for very large n
+        return math.factorial(n)
+
+    # extend the memoized checkpoints up to the one below n
+    k = n // CHECKPOINT_SPACING
+    while len(_checkpoints) <= k:
+        i = len(_checkpoints)
+        low = (i-1) * CHECKPOINT_SPACING + 1
+        _checkpoints.append(_checkpoints[-1] * range_product(low, i * CHECKPOINT_SPACING))
+
+    return _checkpoints[k] * range_product(k * CHECKPOINT_SPACING + 1, n)
+
+
+def gamma(z: complex) -> complex:
+    """
+    Returns the gamma function of a complex number using the Lanczos
+    approximation, with the reflection formula for Re(z) < 0.5.
+    """
+    if z.real < 0.5:
+        return cmath.pi / (cmath.sin(cmath.pi * z) * gamma(1 - z))
+    z -= 1
+    x = LANCZOS_COEFFICIENTS[0]
+    for i, coefficient in enumerate(LANCZOS_COEFFICIENTS[1:], start=1):
+        x += coefficient / (z + i)
+    t = z + LANCZOS_G + 0.5
+    return cmath.sqrt(2 * cmath.pi) * t ** (z + 0.5) * cmath.exp(-t) * x
+
+
+def factorial(x: Union[int, float, complex]) -> Union[int, float, complex]:
+    """
+    Returns the factorial of x. Integers (including floats and complex
+    numbers with integer values) give the exact integer result, other real
+    numbers use math.gamma and complex numbers the Lanczos approximation.
+    """
+    if isinstance(x, complex):
+        if x.imag != 0:
+            return gamma(x + 1)
+        x = x.real
+    if isinstance(x, float):
+        if not x.is_integer():
+            return math.gamma(x + 1)
+        x = int(x)
+    return int_factorial(x)
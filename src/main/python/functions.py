@@ -0,0 +1,182 @@
+# python built-in imports
+from math import radians, degrees
+import cmath  # sin, asin, cos, acos, tan, atan
+from cmath import sqrt, log, log10, pi, e
+from typing import Any
+
+# calculux imports
+from calculus import ANGLE
+from dates import DURATION, MOMENT, SHOW_IN, add_workdays, duration, moment, show_in, workdays
+from factorial import factorial
+from limits import check_power, check_shift
+from radix import as_integer
+from stats import maximum, mean, median, minimum, percentile, stdev, total
+
+
+def ln(x: float) -> float:
+    """
+    Returns the natural logarithm of input x.
+    """
+    return log(x, e)
+
+
+def x_rt(x: float, expr: float) -> float:
+    """
+    Returns the xth root of input expression.
+    """
+    return expr ** (1.0/x)
+
+
+def power(x: float, y: float) -> float:
+    """
+    Returns x to the power of y, refusing exact integer powers too large to
+    compute (see limits.check_power).
+    """
+    check_power(x, y)
+    return x ** y
+
+
+def mod(expr: int, x: int):
+    """
+    Returns the modulo of the input expression by x.
+    """
+    return expr % x
+
+
+def integer(x: Any) -> int:
+    """
+    Returns x as an int for the bitwise operators, which only take whole
+    numbers.
+    """
+    n = as_integer(x)
+    if n is None:
+        raise TypeError('bitwise operators need integers, not {!r}'.format(x))
+    return n
+
+
+def bit_and(x: Any, y: Any) -> int:
+    """
+    Returns x & y.
+    """
+    return integer(x) & integer(y)
+
+
+def bit_or(x: Any, y: Any) -> int:
+    """
+    Returns x | y.
+    """
+    return integer(x) | integer(y)
+
+
+def bit_xor(x: Any, y: Any) -> int:
+    """
+    Returns x xor y.
+    """
+    return integer(x) ^ integer(y)
+
+
+def bit_not(x: Any) -> int:
+    """
+    Returns ~x, which is -x-1 (all bits flipped in two's complement).
+    """
+    return ~integer(x)
+
+
+def shift_left(x: Any, y: Any) -> int:
+    """
+    Returns x << y, refusing results too large to compute (see
+    limits.check_shift).
+    """
+    x, y = integer(x), integer(y)
+    check_shift(x, y)
+    return x << y
+
+
+def shift_right(x: Any, y: Any) -> int:
+    """
+    Returns x >> y.
+    """
+    return integer(x) >> integer(y)
+
+
+def sin_deg(x) -> complex:
+    """
+    Returns the sin of an input in degrees.
+    """
+    return cmath.sin(radians(x))
+
+
+def asin_deg(x) -> complex:
+    """
+    Returns the asin of the input in degrees.
+    """
+    return degrees(cmath.asin(x))
+
+
+def cos_deg(x) -> complex:
+    """
+    Returns the cos of an input in degrees.
+    """
+    return cmath.cos(radians(x))
+
+
+def acos_deg(x) -> complex:
+    """
+    Returns the acos of the input in degrees.
+    """
+    return degrees(cmath.acos(x))
+
+
+def tan_deg(x) -> complex:
+    """
+    Returns the tan of an input in degrees.
+    """
+    return cmath.tan(radians(x))
+
+
+def atan_deg(x) -> complex:
+    """
+    Returns the atan of the input in degrees.
+    """
+    return degrees(cmath.atan(x))
+
+
+# functions and constants that do not depend on the rad/deg setting
+COMMON = {
+    'ln': ln, 'log': log, 'log10': log10,
+    'sqrt': sqrt, 'abs': abs,
+    'fact': factorial, 'mod': mod, 'x_rt': x_rt,
+    'radians': radians, 'degrees': degrees,
+    'bit_and': bit_and, 'bit_or': bit_or, 'bit_xor': bit_xor, 'bit_not': bit_not,
+    'shift_left': shift_left, 'shift_right': shift_right,
+    'workdays': workdays, 'workday': add_workdays,
+    'sum': total, 'mean': mean, 'stdev': stdev, 'min': minimum, 'max': maximum,
+    'median': median, 'percentile': percentile,
+    MOMENT: moment, DURATION: duration, SHOW_IN: show_in,
+    'pi': pi, 'e': e, 'j': 1j
+}
+
+RADIANS = {
+    'sin': cmath.sin, 'asin': cmath.asin,
+    'cos': cmath.cos, 'acos': cmath.acos,
+    'tan': cmath.tan, 'atan': cmath.atan,
+    ANGLE: 1
+}
+
+DEGREES = {
+    'sin': sin_deg, 'asin': asin_deg,
+    'cos': cos_deg, 'acos': acos_deg,
+    'tan': tan_deg, 'atan': atan_deg,
+    ANGLE: pi / 180
+}
+
+
+def namespace(use_radians: bool = True) -> dict:
+    """
+    Returns a new namespace binding every calculator function and constant,
+    with the trigonometric functions working in radians or degrees.
+    """
+    bindings = {'__builtins__': {}}
+    bindings.update(COMMON)
+    bindings.update(RADIANS if use_radians else DEGREES)
+    return bindings
@@ -0,0 +1,308 @@
+# python built-in imports
+import bisect
+from collections import deque
+from decimal import Decimal
+from fractions import Fraction
+import itertools
+import logging
+import mmap
+import os
+import time
+from typing import Any, Iterable, Iterator, List
+
+# calculux imports
+from dates import parse_temporal
+from radix import MARK, PREFIXES, from_digits, parse_literal
+
+# number of entries kept in memory by default
+MAXLEN = 1000
+
+# substring search looks up expressions by their 3 character substrings
+NGRAM = 3
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryEntry:
+    """
+    One evaluation: the expression, the displayed result and when it was
+    evaluated (seconds since the epoch).
+    """
+    __slots__ = ('expression', 'result', 'timestamp')
+
+    def __init__(self, expression: str, result: str, timestamp: float):
+        self.expression = expression
+        self.result = result
+        self.timestamp = timestamp
+        return
+
+    def __repr__(self) -> str:
+        return 'HistoryEntry({!r}, {!r}, {!r})'.format(self.expression, self.result, self.timestamp)
+
+    def encode(self) -> bytes:
+        """
+        Returns the entry as a line of the history log.
+        """
+        return '{:.3f}\t{}\t{}\n'.format(self.timestamp, self.expression, self.result).encode()
+
+    @classmethod
+    def decode(cls, line: bytes) -> 'HistoryEntry':
+        """
+        Creates an entry from a line of the history log.
+        """
+        timestamp, expression, result = line.decode().rstrip('\n').split('\t')
+        return cls(expression, result, float(timestamp))
+
+
+def decode_lines(lines: Iterable[bytes]) -> Iterator[HistoryEntry]:
+    """
+    Decodes lines of the history log into entries. Blank lines are skipped,
+    and so are malformed ones (e.g. one cut short when the app was killed
+    while writing it), which are logged.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield HistoryEntry.decode(line)
+        except ValueError:  # includes UnicodeDecodeError
+            logger.warning('skipping malformed history line %r', line)
+
+
+def lines_backwards(data: mmap.mmap) -> Iterator[bytes]:
+    """
+    Yields the lines of a mapped file from the last to the first.
+    """
+    end = len(data)
+    while end > 0:
+        start = data.rfind(b'\n', 0, end - 1) + 1
+        yield data[start:end]
+        end = start
+
+
+def parse_result(text: str) -> Any:
+    """
+    Converts a displayed result back to a number, so results loaded from the
+    log can be used with PRV[n]. Dates, times and durations are converted
+    back too.
+    """
+    temporal = parse_temporal(text)
+    if temporal is not None:
+        return temporal
+    sign = -1 if text.startswith('-') else 1
+    digits = text.lstrip('-')
+    if digits[:2] in PREFIXES.values() or MARK in digits:
+        # an integer shown in another base
+        return sign * parse_literal(digits)
+    if digits.isdigit():
+        # integers of any length, int() refuses more than a few thousand digits
+        return sign * from_digits(digits)
+    text = text.replace('E', 'e')
+    if '/' in text:
+        return Fraction(text)
+    if 'j' in text:
+        return complex(text)
+    # keep decimals with more digits than a float can hold exact
+    if sum(c.isdigit() for c in text.split('e')[0]) > 15:
+        return Decimal(text)
+    return float(text)
+
+
+class SearchIndex:
+    """
+    Index of the distinct expressions in the history: a sorted list for
+    prefix search and a map from every 3 character substring to the
+    expressions containing it for substring search. The substring map is
+    only built the first time it is needed.
+    """
+
+    def __init__(self, expressions: Iterable[str] = ()):
+        self.known = set(expressions)
+        self.expressions = sorted(self.known)  # sorted distinct expressions
+        self.ngrams = None  # substring -> set of expressions
+        return
+
+    def add(self, expression: str) -> None:
+        """
+        Adds an expression to the index if it isn't already there.
+        """
+        if expression in self.known:
+            return
+        self.known.add(expression)
+        bisect.insort(self.expressions, expression)
+        if self.ngrams is not None:
+            self.add_ngrams(expression)
+        return
+
+    def add_ngrams(self, expression: str) -> None:
+        """
+        Adds an expression to the substring map.
+        """
+        for i in range(len(expression) - NGRAM + 1):
+            self.ngrams.setdefault(expression[i:i+NGRAM], set()).add(expression)
+        return
+
+    def prefix(self, prefix: str) -> List[str]:
+        """
+        Returns the expressions starting with prefix, in sorted order.
+        """
+        start = bisect.bisect_left(self.expressions, prefix)
+        matches = []
+        for expression in self.expressions[start:]:
+            if not expression.startswith(prefix):
+                break
+            matches.append(expression)
+        return matches
+
+    def substring(self, text: str) -> List[str]:
+        """
+        Returns the expressions containing text, in sorted order.
+        """
+        if len(text) < NGRAM:
+            return [expression for expression in self.expressions if text in expression]
+        if self.ngrams is None:
+            self.ngrams = {}
+            for expression in self.expressions:
+                self.add_ngrams(expression)
+        candidates = None
+        for i in range(len(text) - NGRAM + 1):
+            postings = self.ngrams.get(text[i:i+NGRAM], set())
+            candidates = postings if candidates is None else candidates & postings
+            if not candidates:
+                return []
+        return sorted(expression for expression in candidates if text in expression)
+
+
+class History:
+    """
+    The most recent evaluations, kept in a ring buffer of at most maxlen
+    entries. If a path is given, every entry is also appended to a log file
+    there and the last maxlen entries of an existing log are loaded at
+    startup. The whole log is only read when it is first searched.
+    """
+
+    def __init__(self, maxlen: int = MAXLEN, path: str = None):
+        self.entries = deque(maxlen=maxlen)
+        self.path = path
+        self.log = None
+        self.index = None
+        if path is not None and os.path.exists(path):
+            self.entries.extend(self.read_tail(maxlen))
+        return
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, n: int) -> HistoryEntry:
+        """
+        Returns the nth most recent entry (0 is the latest).
+        """
+        if n < 0 or n >= len(self.entries):
+            raise IndexError('history only has {} entries'.format(len(self.entries)))
+        return self.entries[-1-n]
+
+    def __iter__(self) -> Iterator[HistoryEntry]:
+        """
+        Iterates over the entries from most to least recent.
+        """
+        return reversed(self.entries)
+
+    def __getstate__(self) -> dict:
+        """
+        Pickles only the entries in memory, so copies (e.g. in worker
+        processes) don't write to the log.
+        """
+        return {'entries': self.entries, 'path': None, 'log': None, 'index': None}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        return
+
+    def mapped(self) -> mmap.mmap:
+        """
+        Returns the log file memory mapped for reading, or None if it is
+        empty or doesn't exist.
+        """
+        if self.path is None or not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return None
+        with open(self.path, 'rb') as log:
+            return mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read_tail(self, count: int) -> List[HistoryEntry]:
+        """
+        Reads the last count entries of the log, scanning backwards from the
+        end of the mapped file so the time taken doesn't grow with the size
+        of the log. Malformed lines are skipped (see decode_lines).
+        """
+        data = self.mapped()
+        if data is None:
+            return []
+        with data:
+            entries = list(itertools.islice(decode_lines(lines_backwards(data)), count))
+        entries.reverse()
+        return entries
+
+    def append(self, expression: str, result: str, timestamp: float = None) -> HistoryEntry:
+        """
+        Records an evaluation, appending it to the log if there is one.
+        """
+        entry = HistoryEntry(expression, result, time.time() if timestamp is None else timestamp)
+        self.entries.append(entry)
+        if self.path is not None:
+            if self.log is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self.log = open(self.path, 'a+b')
+                # end a line cut short (e.g. when the app was killed while
+                # writing it), so it doesn't run into this entry
+                if self.log.tell() > 0:
+                    self.log.seek(-1, os.SEEK_END)
+                    if self.log.read(1) != b'\n':
+                        self.log.write(b'\n')
+            self.log.write(entry.encode())
+            self.log.flush()
+        if self.index is not None:
+            self.index.add(expression)
+        return entry
+
+    def recall(self, n: int) -> Any:
+        """
+        Returns the result of the nth most recent entry as a number.
+        """
+        return parse_result(self[n].result)
+
+    def search_index(self) -> SearchIndex:
+        """
+        Returns the search index, building it from the whole log (or the
+        entries in memory if there is no log) the first time. The log is
+        decoded a line at a time, skipping malformed lines.
+        """
+        if self.index is None:
+            data = self.mapped()
+            if data is None:
+                self.index = SearchIndex(entry.expression for entry in self.entries)
+            else:
+                with data:
+                    lines = iter(data.readline, b'')
+                    self.index = SearchIndex(entry.expression for entry in decode_lines(lines))
+        return self.index
+
+    def search_prefix(self, prefix: str) -> List[str]:
+        """
+        Returns the distinct past expressions starting with prefix.
+        """
+        return self.search_index().prefix(prefix)
+
+    def search(self, text: str) -> List[str]:
+        """
+        Returns the distinct past expressions containing text.
+        """
+        return self.search_index().substring(text)
+
+    def close(self) -> None:
+        """
+        Closes the log file.
+        """
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        return
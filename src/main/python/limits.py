@@ -0,0 +1,56 @@
+# python built-in imports
+from fractions import Fraction
+import math
+from typing import Any
+
+# calculux imports
+from errors import ResourceLimitError
+
+# exact results are refused if they would have more than this many bits
+# (about 630,000 decimal digits), which keeps any single power or factorial
+# well under a second
+MAX_BITS = 1 << 21
+
+
+def _bits(value: Any) -> int:
+    """
+    Returns the size in bits of an integer or of the larger part of a
+    fraction.
+    """
+    if isinstance(value, Fraction):
+        return max(value.numerator.bit_length(), value.denominator.bit_length())
+    return value.bit_length()
+
+
+def check_power(base: Any, exponent: Any) -> None:
+    """
+    Raises ResourceLimitError if base^exponent is an exact power (integer or
+    fraction base, integer exponent) with more than MAX_BITS bits. Float
+    powers overflow by themselves, and so do integers to negative powers, so
+    they are never refused.
+    """
+    if not isinstance(base, (int, Fraction)) or type(exponent) is not int:
+        return
+    if isinstance(base, int) and exponent < 0:
+        return
+    if abs(exponent) * _bits(base) > MAX_BITS and _bits(base) > 1:
+        raise ResourceLimitError('power has more than {} bits'.format(MAX_BITS))
+    return
+
+
+def check_shift(value: int, count: int) -> None:
+    """
+    Raises ResourceLimitError if value << count has more than MAX_BITS bits.
+    """
+    if value != 0 and count > 0 and value.bit_length() + count > MAX_BITS:
+        raise ResourceLimitError('shift has more than {} bits'.format(MAX_BITS))
+    return
+
+
+def check_factorial(n: int) -> None:
+    """
+    Raises ResourceLimitError if n! has more than MAX_BITS bits.
+    """
+    if n > 1 and math.lgamma(n + 1) / math.log(2) > MAX_BITS:
+        raise ResourceLimitError('factorial has more than {} bits'.format(MAX_BITS))
+    return
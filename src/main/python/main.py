@@ -3,17 +3,65 @@ from fbs_runtime.application_context.PyQt5 import ApplicationContext
 from fbs_runtime.platform import is_mac
 
 # python built-in imports
+import multiprocessing
+import os
+import string
 import sys
 from dataclasses import dataclass
-from typing import Callable, Any
-from math import radians, degrees
-import cmath  # sin, asin, cos, acos, tan, atan
-from cmath import sqrt, log, log10, pi, e
+from typing import Callable, Any, TYPE_CHECKING
+
+# calculux imports (the evaluator and the math behind it are imported when
+# first used, after the window is up)
+import metrics
+from startup import load_stylesheet, timer, timing_enabled
+if TYPE_CHECKING:
+    from evaluator import Evaluator
+    from sandbox import PreviewSandbox, Sandbox
 
 # PyQt5 imports
 import PyQt5.QtWidgets as qw
 from PyQt5.QtGui import QKeyEvent
-from PyQt5.QtCore import Qt, QEvent, QObject
+from PyQt5.QtCore import Qt, QEvent, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+timer.mark('imports')
+
+# where the history of evaluations is saved between sessions
+HISTORY_PATH = os.path.join(os.path.expanduser('~'), '.calculux', 'history.log')
+
+# milliseconds typing has to pause for before the preview is evaluated
+PREVIEW_DELAY = 150
+
+# characters without a key on the keypad that are typed straight onto the
+# display: letters (hex digits, units, xor), base#digits, the bitwise
+# operators and the separators of times and time zones
+TYPED_CHARACTERS = frozenset(string.ascii_letters + '#&|~<> :_[]')
+
+# entries of the base and word size menus
+BASE_MENU = (('Decimal', 10), ('Hexadecimal', 16), ('Octal', 8), ('Binary', 2))
+WORD_SIZE_MENU = (('Unbounded', None), ('8 Bit', 8), ('16 Bit', 16), ('32 Bit', 32), ('64 Bit', 64))
+
+# the keypad, one entry per key: (key, row, col, label_1, connection_1,
+# label_2, hidden_2, connection_2, label_3, hidden_3, connection_3), with
+# connections given as the names of Calculux methods so the table is built
+# once at import instead of for every window
+BUTTON_LAYOUT = (
+    (Qt.Key_0, 4, 0, '0', None, 'pi', '', None, 'e', '', None),
+    (Qt.Key_1, 3, 0, '1', None, 'tan', '(', None, 'atan', '(', None),
+    (Qt.Key_2, 3, 1, '2', None, '(', '', None, ')', '', None),
+    (Qt.Key_3, 3, 2, '3', None, 'PRV', '', None, ' ', '', 'noAction'),
+    (Qt.Key_4, 2, 0, '4', None, 'cos', '(', None, 'acos', '(', None),
+    (Qt.Key_5, 2, 1, '5', None, 'MC', '', 'memory_clear', 'M', '', None),
+    (Qt.Key_6, 2, 2, '6', None, 'M+', '', 'memory_add', 'M-', '', 'memory_subtract'),
+    (Qt.Key_7, 1, 0, '7', None, 'sin', '(', None, 'asin', '(', None),
+    (Qt.Key_8, 1, 1, '8', None, 'log10', '(', None, 'ln', '(', None),
+    (Qt.Key_9, 1, 2, '9', None, 'log', '(', None, ',', '', None),
+    (Qt.Key_Period, 4, 1, '.', None, 'E', '', None, '^2', '', None),
+    (Qt.Key_Asterisk, 1, 3, '*', None, 'fact', '(', None, '^', '', None),
+    (Qt.Key_Slash, 2, 3, '/', None, 'mod', '(', None, 'rad', '', 'set_rad_deg'),
+    (Qt.Key_Plus, 3, 3, '+', None, 'sqrt', '(', None, 'x_rt', '(', None),
+    (Qt.Key_Minus, 4, 3, '-', None, 'abs', '(', None, 'j', '', None),
+    (Qt.Key_Equal, 4, 2, '=', 'evaluate', 'C', '', 'clear', 'D', '', 'delete')
+)
 
 
 @dataclass
@@ -47,12 +95,57 @@ class Button:
     grid: qw.QGridLayout = None
 
 
+class PreviewSignals(QObject):
+    """
+    Carries preview results from the thread pool back to the GUI thread.
+    """
+    finished = pyqtSignal(int, str)
+
+
+class PreviewTask(QRunnable):
+    """
+    Evaluates a preview off the GUI thread. The generation is sent back
+    with the result so results of outdated previews can be ignored, and a
+    preview that is already out of date when its turn comes (current()
+    returns a later generation) isn't evaluated at all.
+    """
+
+    def __init__(self, generation: int, compute: Callable[[], str], signals: PreviewSignals,
+                 current: Callable[[], int]):
+        super().__init__()
+        self.generation = generation
+        self.compute = compute
+        self.signals = signals
+        self.current = current
+        return
+
+    def run(self) -> None:
+        if self.current() == self.generation:
+            self.signals.finished.emit(self.generation, self.compute())
+        return
+
+
+class BackgroundTask(QRunnable):
+    """
+    Runs work in the thread pool, off the GUI thread.
+    """
+
+    def __init__(self, work: Callable[[], Any]):
+        super().__init__()
+        self.work = work
+        return
+
+    def run(self) -> None:
+        self.work()
+        return
+
+
 class Calculux(qw.QMainWindow):
     """
     Creates and runs the user interface.
     """
 
-    def __init__(self, appctxt):
+    def __init__(self, appctxt, expression_cache_size: int = None, history_path: str = HISTORY_PATH):
         super().__init__()
 
         # hold the reference to fbs ApplicationContext to access runtime variables
@@ -68,19 +161,9 @@ class Calculux(qw.QMainWindow):
         self.centralWidget.setObjectName('centralWidget')
         self.setCentralWidget(self.centralWidget)
 
-        # add the about menu (for macs)
-        self.aboutAction = qw.QAction()
-        self.aboutAction.setMenuRole(qw.QAction.AboutRole)
-        self.aboutAction.triggered.connect(self.showAboutWindow)
-        self.mainMenuBar = qw.QMenuBar()
-        self.mainMenu = qw.QMenu()
-        self.mainMenuBar.addMenu(self.mainMenu)
-        self.mainMenu.addAction(self.aboutAction)
-        self.setMenuBar(self.mainMenuBar)
-
-        # load in the style sheet
-        with open(self.appctxt.get_resource('stylesheet.qss'), 'r') as stylesheet:
-            self.setStyleSheet(stylesheet.read())
+        # load in the style sheet (minified, and cached between launches)
+        self.setStyleSheet(load_stylesheet(self.appctxt.get_resource('stylesheet.qss')))
+        timer.mark('stylesheet')
 
         # create the layout and assign it to the central widget
         self.grid = qw.QGridLayout()
@@ -90,23 +173,13 @@ class Calculux(qw.QMainWindow):
 
         # create dictionary to hold all Button references and define the 3
         # functionalities of each button
+        def connection(name: str) -> Callable:
+            return None if name is None else getattr(self, name)
         self.buttons = {
-            Qt.Key_0: Button(4, 0, '0', None, 'pi', '', None, 'e', '', None),
-            Qt.Key_1: Button(3, 0, '1', None, 'tan', '(', None, 'atan', '(', None),
-            Qt.Key_2: Button(3, 1, '2', None, '(', '', None, ')', '', None),
-            Qt.Key_3: Button(3, 2, '3', None, 'PRV', '', None, ' ', '', self.noAction),
-            Qt.Key_4: Button(2, 0, '4', None, 'cos', '(', None, 'acos', '(', None),
-            Qt.Key_5: Button(2, 1, '5', None, 'MC', '', self.memory_clear, 'M', '', None),
-            Qt.Key_6: Button(2, 2, '6', None, 'M+', '', self.memory_add, 'M-', '', self.memory_subtract),
-            Qt.Key_7: Button(1, 0, '7', None, 'sin', '(', None, 'asin', '(', None),
-            Qt.Key_8: Button(1, 1, '8', None, 'log10', '(', None, 'ln', '(', None),
-            Qt.Key_9: Button(1, 2, '9', None, 'log', '(', None, ',', '', None),
-            Qt.Key_Period: Button(4, 1, '.', None, 'E', '', None, '^2', '', None),
-            Qt.Key_Asterisk: Button(1, 3, '*', None, 'fact', '(', None, '^', '', None),
-            Qt.Key_Slash: Button(2, 3, '/', None, 'mod', '(', None, 'rad', '', self.set_rad_deg),
-            Qt.Key_Plus: Button(3, 3, '+', None, 'sqrt', '(', None, 'x_rt', '(', None),
-            Qt.Key_Minus: Button(4, 3, '-', None, 'abs', '(', None, 'j', '', None),
-            Qt.Key_Equal: Button(4, 2, '=', self.evaluate, 'C', '', self.clear, 'D', '', self.delete)
+            key: Button(row, col, label_1, connection(connection_1), label_2, hidden_2, connection(connection_2),
+                        label_3, hidden_3, connection(connection_3))
+            for key, row, col, label_1, connection_1, label_2, hidden_2, connection_2, label_3, hidden_3, connection_3
+            in BUTTON_LAYOUT
         }
 
         # define key translations when multiple keys perform the same function
@@ -134,7 +207,17 @@ class Calculux(qw.QMainWindow):
         self.display.setReadOnly(True)
         self.display.setMinimumHeight(60)
         self.display.installEventFilter(self)
-        self.grid.addWidget(self.display, 0, 0, 1, 4)
+
+        # create the preview of the result below the display, and put both
+        # in the grid
+        self.preview = qw.QLabel()
+        self.preview.setObjectName('preview')
+        self.preview.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        self.displayLayout = qw.QVBoxLayout()
+        self.displayLayout.setSpacing(0)
+        self.displayLayout.addWidget(self.display)
+        self.displayLayout.addWidget(self.preview)
+        self.grid.addLayout(self.displayLayout, 0, 0, 1, 4)
 
         # create the buttons
         for button in self.buttons.values():
@@ -153,22 +236,194 @@ class Calculux(qw.QMainWindow):
             # add the third function if applicable
             if len(button.label_3) > 0:
                 button.ref_3 = self.createButtonFunctionality(button.grid, button.label_3, button.connection_3, 'THIRD', button.hidden_3)
-
-        # initialize memory and previous result variables
-        self.memory = 0
-        self.previous_result = ''
+        timer.mark('buttons')
+
+        # all the math is done by the evaluator, which also holds memory, the
+        # history of results, the rad/deg setting and the compiled expression
+        # cache. It is created when first needed (see finishStartup)
+        self.expression_cache_size = expression_cache_size
+        self.history_path = history_path
+        self._evaluator = None
+        self._sandbox = None
+        self._previewSandbox = None
         self.last_operation_was_evaluate = False
 
-        # initialize configuration variables
-        self.use_radians = True  # true for radians and false for degrees
+        # the preview is parsed on every edit (see updatePreview) but only
+        # evaluated once typing pauses, in a worker process of its own (see
+        # startPreview)
+        self.previewParser = None
+        self.previewNames = None  # the worksheet names and base previewParser knows
+        self.previewTree = None
+        self.previewGeneration = 0
+        self.previewTimer = QTimer(self)
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.setInterval(PREVIEW_DELAY)
+        self.previewTimer.timeout.connect(self.startPreview)
+        self.previewSignals = PreviewSignals()
+        self.previewSignals.finished.connect(self.showPreview)
+
+        # the menu and the evaluator are left until the event loop is running,
+        # so they don't hold up the window appearing
+        QTimer.singleShot(0, self.finishStartup)
+
+        return
+
+    def finishStartup(self) -> None:
+        """
+        Does the start up work that isn't needed to show the window: creates
+        the menu, then the evaluator (importing the math modules), and starts
+        the process evaluations run in from the thread pool, since waiting for
+        it would hold up the first key press. An evaluation made before it is
+        ready waits for it. Prints the startup timing breakdown if it was
+        asked for.
+        """
+        timer.mark('event loop')
+        self.createMenu()
+        timer.mark('menu')
+        self.evaluator  # creating it imports the math modules
+        timer.mark('evaluator')
+        self.sandbox  # made here so the thread pool doesn't make a second one
+        self.previewSandbox
+        QThreadPool.globalInstance().start(BackgroundTask(self.startSandbox))
+        timer.mark('sandbox')
+        if timing_enabled():
+            print(timer.report(), file=sys.stderr)
+        return
 
+    def startSandbox(self) -> None:
+        """
+        Starts the worker processes of the sandboxes. If one fails, the next
+        evaluation (or preview) tries again.
+        """
+        for sandbox in (self.sandbox, self.previewSandbox):
+            try:
+                sandbox.start()
+            except (EOFError, OSError):
+                sandbox.stop()
         return
 
+    def createMenu(self) -> None:
+        """
+        Adds the about menu (for macs).
+        """
+        self.aboutAction = qw.QAction()
+        self.aboutAction.setMenuRole(qw.QAction.AboutRole)
+        self.aboutAction.triggered.connect(self.showAboutWindow)
+        self.mainMenuBar = qw.QMenuBar()
+        self.mainMenu = qw.QMenu()
+        self.mainMenuBar.addMenu(self.mainMenu)
+        self.mainMenu.addAction(self.aboutAction)
+
+        # add the menu for recording and exporting stage timings
+        self.metricsMenu = self.mainMenuBar.addMenu('Metrics')
+        self.recordAction = self.metricsMenu.addAction('Record Timings')
+        self.recordAction.setCheckable(True)
+        self.recordAction.setChecked(metrics.registry.enabled)
+        self.recordAction.toggled.connect(self.recordTimings)
+        self.exportAction = self.metricsMenu.addAction('Export Timings...')
+        self.exportAction.triggered.connect(self.exportTimings)
+
+        # add the menus for the base results are shown in and the word size
+        # whole numbers wrap around to
+        self.baseMenu, self.baseGroup = self.createChoiceMenu('Base', BASE_MENU, 10, self.setBase)
+        self.wordSizeMenu, self.wordSizeGroup = self.createChoiceMenu('Word Size', WORD_SIZE_MENU, None,
+                                                                      self.setWordSize)
+
+        self.setMenuBar(self.mainMenuBar)
+        return
+
+    def createChoiceMenu(self, title: str, choices: tuple, checked: Any,
+                         connection: Callable[[Any], None]) -> tuple:
+        """
+        Adds a menu of (label, value) choices of which one is checked at a
+        time, calling connection with the value of the chosen one. Returns
+        the menu and its action group.
+        """
+        menu = self.mainMenuBar.addMenu(title)
+        group = qw.QActionGroup(self)
+        for label, value in choices:
+            action = menu.addAction(label)
+            action.setCheckable(True)
+            action.setChecked(value == checked)
+            action.setData(value)
+            group.addAction(action)
+        group.triggered.connect(lambda action: connection(action.data()))
+        return menu, group
+
+    def recordTimings(self, record: bool) -> None:
+        """
+        Starts or stops timing each stage of handling a key press and
+        evaluating (see metrics.Registry).
+        """
+        if record:
+            metrics.registry.enable()
+        else:
+            metrics.registry.disable()
+        return
+
+    def exportTimings(self) -> None:
+        """
+        Asks where to save the recorded timings and writes them there, as
+        JSON or in the Prometheus text format depending on the extension.
+        """
+        path, _ = qw.QFileDialog.getSaveFileName(self, 'Export Timings', 'calculux-timings.prom',
+                                                 'Prometheus text (*.prom *.txt);;JSON (*.json)')
+        if path:
+            metrics.registry.export(path)
+        return
+
+    @property
+    def evaluator(self) -> 'Evaluator':
+        """
+        The evaluator, created the first time it is used.
+        """
+        if self._evaluator is None:
+            from evaluator import Evaluator
+            from history import History
+            from units import DATA_ENV
+            # the unit tables are read when a conversion is first typed,
+            # possibly by the sandbox's worker process, which inherits this
+            os.environ.setdefault(DATA_ENV, self.appctxt.get_resource('units.json'))
+            options = {} if self.expression_cache_size is None else {'cache_size': self.expression_cache_size}
+            self._evaluator = Evaluator(history=History(path=self.history_path), **options)
+        return self._evaluator
+
+    @property
+    def sandbox(self) -> 'Sandbox':
+        """
+        Runs evaluations for the evaluator in a separate process, so ones
+        that run too long or use too much memory can be cancelled.
+        """
+        if self._sandbox is None:
+            from sandbox import Sandbox
+            self._sandbox = Sandbox(self.evaluator)
+        return self._sandbox
+
+    @property
+    def previewSandbox(self) -> 'PreviewSandbox':
+        """
+        Runs previews in another process, so they can't hold up key presses
+        and can be stopped when they are out of date.
+        """
+        if self._previewSandbox is None:
+            from sandbox import PreviewSandbox
+            self._previewSandbox = PreviewSandbox(self.evaluator)
+        return self._previewSandbox
+
     def keyPressEvent(self, orig_event: QKeyEvent) -> None:
         """
         Re-definition of QWidget.keyPressEvent(). This function is called by Qt
         every time a key press is registered in the MainWindow / centralWidget.
         """
+        # letters and symbols without a key are typed as they are, and in
+        # bases above 10 the letters that are digits take precedence over
+        # their shortcuts
+        text = orig_event.text()
+        if text in TYPED_CHARACTERS and not orig_event.modifiers() & (Qt.AltModifier | Qt.ControlModifier):
+            if orig_event.key() not in self.keyTranslations or self.isDigit(text):
+                self.insert(text)
+                return
+
         # check if this key needs to be translated
         if orig_event.key() in self.keyTranslations:
             # get the translated event
@@ -286,6 +541,7 @@ class Calculux(qw.QMainWindow):
 
         # instert the number/operator
         self.display.setText(self.display.text() + text)
+        self.updatePreview()
 
         return
 
@@ -296,116 +552,133 @@ class Calculux(qw.QMainWindow):
         expression = self.display.text()
 
         # check that there is something to evaluate
-        if len(expression) > 0 and expression != 'ERROR':
-            # parse the operation to a valid python math string
-            expression = self.parse(expression)
-
-            try:
-                # attempt to evaluate the expression
-                result = eval(expression)
-            except SyntaxError:
-                # user probably entered an invalid math string
-                self.display.setText('ERROR')
-            else:
-                # if the string was able to be evaluated
-                # check if result is complex number
-                if isinstance(result, complex):
-                    if result.imag == 0:
-                        # return a real number if imag part is 0
-                        result = str(round(result.real, 5))
-                    else:
-                        # pretty print the complex number
-                        result = complex(round(result.real, 5), round(result.imag, 5))
-                        result = str(result)[1:-1]  # remove the parentheses
-                else:
-                    result = str(round(result, 5))
-
-                # prepare the result and display it
-                result = result.replace('e', 'E')
-                self.display.setText(result)
-
-                self.previous_result = result
+        if len(expression) > 0 and not expression.startswith('ERROR'):
+            self.display.setText(self.sandbox.evaluate(expression))
 
         self.last_operation_was_evaluate = True
+        self.clearPreview()
 
         return
 
-    def parse(self, expression: str) -> str:
-        """
-        Performs a series of string substitutions to manipulate the text from
-        the display, into a string that can be properly evaluated with the
-        eval() function.
-        """
-        expression = expression.replace('fact', 'self.factorial')
-        expression = expression.replace('asin', 'as_place')  # so sin replacement doesn't mangle asin
-        expression = expression.replace('sin', 'self.sin')
-        expression = expression.replace('as_place', 'self.asin')
-        expression = expression.replace('acos', 'ac_place')  # so cos replacement doesn't mangle acos
-        expression = expression.replace('cos', 'self.cos')
-        expression = expression.replace('ac_place', 'self.acos')
-        expression = expression.replace('atan', 'at_place')  # so tan replacement doesn't mangle atan
-        expression = expression.replace('tan', 'self.tan')
-        expression = expression.replace('at_place', 'self.atan')
-        expression = expression.replace('PRV', self.previous_result)
-        expression = expression.replace('ln', 'self.ln')
-        expression = expression.replace('E', '*10**')
-        expression = expression.replace('^', '**')
-        expression = expression.replace('x_rt', 'self.x_rt')
-        expression = expression.replace('mod', 'self.mod')
-        expression = expression.replace('M', str(self.memory_get()))
-        expression = expression.replace('j', '*1j')
-        return expression
+    def updatePreview(self) -> None:
+        """
+        Parses the display after an edit, reusing the parse of the text
+        before it, and schedules the preview to be evaluated once typing
+        pauses. The preview is cleared while the display doesn't parse.
+        """
+        # defined names and the base change how the display parses, so the
+        # parser is made again when they change
+        worksheet = self.evaluator.worksheet
+        names = (worksheet.variables, worksheet.functions, self.evaluator.base)
+        if self.previewParser is None or self.previewNames != names:
+            from expression import IncrementalParser
+            self.previewParser = IncrementalParser(*names)
+            self.previewNames = names
+
+        self.cancelPreview()
+        try:
+            self.previewTree = self.previewParser.parse(self.display.text())
+        except SyntaxError:
+            self.previewTree = None
+            self.preview.setText('')
+            self.previewTimer.stop()
+        else:
+            self.previewTimer.start()
+        return
 
-    def clear(self) -> None:
+    def startPreview(self) -> None:
         """
-        Clears the display.
+        Evaluates the parsed display in the preview sandbox, waiting for it
+        in the thread pool, so slow expressions (even ones that hold the
+        interpreter, like big integer arithmetic) don't hold up key presses.
         """
-        self.display.setText('')
+        if self.previewTree is None:
+            return
+        sandbox = self.previewSandbox
+        request = sandbox.request(self.display.text())
+        task = PreviewTask(self.previewGeneration, lambda: sandbox.preview(request), self.previewSignals,
+                           lambda: self.previewGeneration)
+        QThreadPool.globalInstance().start(task)
         return
 
-    def delete(self) -> None:
+    def showPreview(self, generation: int, text: str) -> None:
         """
-        Deleted the right-most character on the display.
+        Shows a preview result, unless the display has changed since it was
+        started.
         """
-        self.display.setText(self.display.text()[:-1])
+        if generation == self.previewGeneration:
+            self.preview.setText(text)
         return
 
-    def noAction(self) -> None:
+    def clearPreview(self) -> None:
         """
-        Does nothing. Used as the connection for empty buttons so they can still
-        be properly created like the other ones.
+        Clears the preview and drops any preview still being evaluated.
+        """
+        self.cancelPreview()
+        self.previewTree = None
+        self.previewTimer.stop()
+        self.preview.setText('')
+        return
+
+    def cancelPreview(self) -> None:
+        """
+        Makes any preview started so far out of date, stopping the one being
+        evaluated.
         """
+        self.previewGeneration += 1
+        if self._previewSandbox is not None:
+            self._previewSandbox.cancel()
         return
 
-    def ln(self, x: float) -> float:
+    @property
+    def memory(self) -> float:
+        """
+        The value stored in memory, held by the evaluator.
+        """
+        return self.evaluator.memory
+
+    @property
+    def previous_result(self) -> Any:
         """
-        Returns the natural logarithm of input x.
+        The result of the last evaluation, which PRV refers to.
         """
-        return log(x, e)
+        return self.evaluator.previous_result
 
-    def x_rt(self, x: float, expr: float) -> float:
+    @property
+    def use_radians(self) -> bool:
         """
-        Returns the xth root of input expression.
+        True for radians and false for degrees.
         """
-        return expr ** (1.0/x)
+        return self.evaluator.use_radians
 
-    def mod(self, expr: int, x: int):
+    def clear(self) -> None:
+        """
+        Clears the display.
+        """
+        self.display.setText('')
+        self.clearPreview()
+        return
+
+    def delete(self) -> None:
         """
-        Returns the modulo of the input expression by x.
+        Deleted the right-most character on the display.
         """
-        return expr % x
+        self.display.setText(self.display.text()[:-1])
+        self.updatePreview()
+        return
 
-    def factorial(self, x: int) -> int:
+    def noAction(self) -> None:
         """
-        Returns the factorial of x.
+        Does nothing. Used as the connection for empty buttons so they can still
+        be properly created like the other ones.
         """
-        return factorial(x)
+        return
 
     def memory_clear(self) -> None:
         """
         Clears the value stored in memory.
         """
-        self.memory = 0
+        self.evaluator.memory_clear()
         return
 
     def memory_get(self) -> float:
@@ -419,8 +692,8 @@ class Calculux(qw.QMainWindow):
         Adds (as in sum) the result of the display to memory.
         """
         self.evaluate()
-        if self.display.text() != 'ERROR':
-            self.memory += float(self.display.text())
+        if self.displaysResult():
+            self.updateMemory(self.evaluator.memory_add)
         return
 
     def memory_subtract(self) -> None:
@@ -428,86 +701,98 @@ class Calculux(qw.QMainWindow):
         Subtracts the result of the display from memory.
         """
         self.evaluate()
-        if self.display.text() != 'ERROR':
-            self.memory -= float(self.display.text())
+        if self.displaysResult():
+            self.updateMemory(self.evaluator.memory_subtract)
         return
 
-    def set_rad_deg(self) -> None:
+    def updateMemory(self, update: Callable[[Any], None]) -> None:
         """
-        Changes settings between radians and degrees. If the expression on the
-        screen was the result of an evaluation, the value on the screen is also
-        converted between radians and degrees.
+        Adds the previous result to or subtracts it from memory with update.
+        A result memory can't hold, such as a date, leaves memory unchanged
+        and shows the error instead.
         """
-        self.use_radians = not self.use_radians
-
-        if self.use_radians:
-            self.buttons[Qt.Key_Slash].ref_3.setText('rad')  # change button text
-            if self.last_operation_was_evaluate:
-                # convert value on display from degrees to radians
-                self.display.setText('radians('+self.display.text()+')')
-                self.evaluate()
-        else:
-            self.buttons[Qt.Key_Slash].ref_3.setText('deg')  # chnage button text
-            if self.last_operation_was_evaluate:
-                # convert value on display from radians to degrees
-                self.display.setText('degrees('+self.display.text()+')')
-                self.evaluate()
-
+        from evaluator import EVALUATION_ERRORS, error_text
+        try:
+            update(self.previous_result)
+        except EVALUATION_ERRORS as error:
+            self.display.setText(error_text(error))
         return
 
-    def sin(self, x) -> complex:
+    def displaysResult(self) -> bool:
         """
-        Returns the sin of the input, handles input in radians and degrees.
+        Returns whether the display shows the result of an evaluation, as
+        opposed to an expression, an error or nothing.
         """
-        if self.use_radians:
-            return cmath.sin(x)
-        else:
-            return cmath.sin(radians(x))
+        text = self.display.text()
+        return self.last_operation_was_evaluate and len(text) > 0 and not text.startswith('ERROR')
 
-    def asin(self, x) -> complex:
+    def displaysPreviousResult(self) -> bool:
         """
-        Returns the asin of the input, handles output in radians and degrees.
+        Returns whether the display shows the previous result as the current
+        settings format it (not e.g. a function definition shown as typed).
         """
-        if self.use_radians:
-            return cmath.asin(x)
-        else:
-            return degrees(cmath.asin(x))
+        return self.displaysResult() and self.display.text() == self.evaluator.format(self.evaluator.previous_result)
 
-    def cos(self, x) -> complex:
+    def isDigit(self, text: str) -> bool:
         """
-        Returns the cos of the input, handles input in radians and degrees.
+        Returns whether a typed letter is a digit in the base results are
+        shown in.
         """
-        if self.use_radians:
-            return cmath.cos(x)
-        else:
-            return cmath.cos(radians(x))
+        from radix import DIGITS
+        return DIGITS.find(text.upper()) in range(10, self.evaluator.base)
 
-    def acos(self, x) -> complex:
+    def setBase(self, base: int) -> None:
         """
-        Returns the acos of the input, handles output in radians and degrees.
+        Changes the base results are shown in. If the screen shows the
+        previous result, it is shown in the new base. It isn't evaluated
+        again, since the new base would read its digits differently, and
+        nothing is added to the history.
         """
-        if self.use_radians:
-            return cmath.acos(x)
-        else:
-            return degrees(cmath.acos(x))
+        showing = self.displaysPreviousResult()
+        self.evaluator.base = base
+        if showing:
+            self.display.setText(self.evaluator.format(self.evaluator.previous_result))
+        return
 
-    def tan(self, x) -> complex:
+    def setWordSize(self, word_size: int) -> None:
         """
-        Returns the tan of the input, handles input in radians and degrees.
+        Changes the word size whole number results wrap around to (None for
+        no wrapping). If the screen shows the previous result, it is shown
+        wrapped to the new size, without adding to the history.
         """
-        if self.use_radians:
-            return cmath.tan(x)
-        else:
-            return cmath.tan(radians(x))
+        showing = self.displaysPreviousResult()
+        self.evaluator.word_size = word_size
+        if showing:
+            self.display.setText(self.evaluator.format(self.evaluator.previous_result))
+        return
 
-    def atan(self, x) -> complex:
+    def set_rad_deg(self) -> None:
         """
-        Returns the atan of the input, handles output in radians and degrees.
+        Changes settings between radians and degrees. If the expression on the
+        screen was the result of an evaluation, the value on the screen is also
+        converted between radians and degrees.
         """
+        self.evaluator.use_radians = not self.evaluator.use_radians
+
         if self.use_radians:
-            return cmath.atan(x)
+            self.buttons[Qt.Key_Slash].ref_3.setText('rad')  # change button text
+            if self.displaysResult():
+                # convert value on display from degrees to radians
+                self.display.setText('radians('+self.display.text()+')')
+                self.evaluate()
         else:
-            return degrees(cmath.atan(x))
+            self.buttons[Qt.Key_Slash].ref_3.setText('deg')  # chnage button text
+            if self.displaysResult():
+                # convert value on display from radians to degrees
+                self.display.setText('degrees('+self.display.text()+')')
+                self.evaluate()
+
+        return
+
+
+# the stages of handling input timed when metrics are enabled
+metrics.register(Calculux, 'keyPressEvent', 'key')
+metrics.register(Calculux, 'insert', 'insert')
 
 
 class AboutWindow(qw.QWidget):
@@ -538,9 +823,14 @@ class AboutWindow(qw.QWidget):
 
 
 def main():
+    multiprocessing.freeze_support()  # the sandbox process of a frozen app
+    if metrics.requested():
+        metrics.registry.enable()
     appctxt = ApplicationContext()  # needed for fbs
+    timer.mark('application context')
     view = Calculux(appctxt)  # create the main window
     view.show()  # show the main window
+    timer.mark('show')
     exit_code = appctxt.app.exec_()  # needed for fbs
     sys.exit(exit_code)  # exit the app
 
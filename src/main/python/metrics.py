@@ -0,0 +1,252 @@
+# python built-in imports
+import bisect
+import functools
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+# upper bounds (in seconds) of the histogram buckets, roughly three per
+# decade from a microsecond to ten seconds, plus one for anything slower
+BOUNDS = (
+    1e-6, 2.5e-6, 5e-6,
+    1e-5, 2.5e-5, 5e-5,
+    1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3,
+    1e-2, 2.5e-2, 5e-2,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0
+)
+
+# pass this to the calculator or set the environment variable to record
+# timings from the start
+ENABLE_FLAG = '--metrics'
+ENABLE_ENV = 'CALCULUX_METRICS'
+
+# name of the Prometheus metric the stage timings are exported as
+METRIC = 'calculux_stage_seconds'
+
+
+class Histogram:
+    """
+    Counts of observed durations in the fixed BOUNDS buckets, with their sum
+    and count. Memory use doesn't grow with the number of observations, and
+    histograms from different processes can be merged.
+    """
+
+    def __init__(self):
+        self.clear()
+        return
+
+    def clear(self) -> None:
+        """
+        Discards all observations.
+        """
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        return
+
+    def copy(self) -> 'Histogram':
+        """
+        Returns a copy of the histogram.
+        """
+        histogram = Histogram()
+        histogram.merge(self)
+        return histogram
+
+    def observe(self, seconds: float) -> None:
+        """
+        Records one duration.
+        """
+        self.counts[bisect.bisect_left(BOUNDS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        return
+
+    def merge(self, other: 'Histogram') -> None:
+        """
+        Adds the observations of another histogram to this one.
+        """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+        return
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """
+        Returns (upper bound, observations at or below it) for every bucket,
+        the last bound being '+Inf'.
+        """
+        total = 0
+        buckets = []
+        for bound, count in zip([repr(bound) for bound in BOUNDS] + ['+Inf'], self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+
+class Registry:
+    """
+    Holds a histogram per stage and the methods and functions that are timed
+    for each stage. Timing is off by default: while it is off the original
+    functions are in place, so there is no cost at all. enable() swaps in
+    timed wrappers and disable() puts the originals back.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}  # stage -> Histogram
+        self.targets = []  # (owner, attribute name, stage)
+        self.originals = {}  # (owner, attribute name) -> original function
+        return
+
+    def register(self, owner: Any, name: str, stage: str) -> None:
+        """
+        Times owner.name (a method of a class or a function of a module)
+        under stage whenever timing is enabled.
+        """
+        self.targets.append((owner, name, stage))
+        if self.enabled:
+            self.wrap(owner, name, stage)
+        return
+
+    def wrap(self, owner: Any, name: str, stage: str) -> None:
+        """
+        Replaces owner.name with a wrapper that times each call.
+        """
+        original = getattr(owner, name)
+        histogram = self.histogram(stage)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        self.originals[(owner, name)] = original
+        setattr(owner, name, timed)
+        return
+
+    def histogram(self, stage: str) -> Histogram:
+        """
+        Returns the histogram of a stage, creating it if needed.
+        """
+        if stage not in self.histograms:
+            self.histograms[stage] = Histogram()
+        return self.histograms[stage]
+
+    def enable(self) -> None:
+        """
+        Starts timing every registered stage.
+        """
+        if not self.enabled:
+            self.enabled = True
+            for owner, name, stage in self.targets:
+                self.wrap(owner, name, stage)
+        return
+
+    def disable(self) -> None:
+        """
+        Stops timing and restores the original functions. Recorded timings
+        are kept.
+        """
+        if self.enabled:
+            self.enabled = False
+            for (owner, name), original in self.originals.items():
+                setattr(owner, name, original)
+            self.originals.clear()
+        return
+
+    def take(self) -> Dict[str, Histogram]:
+        """
+        Returns copies of the histograms that have observations and clears
+        them, so a worker process can send what it recorded since the last
+        call.
+        """
+        taken = {}
+        for stage, histogram in self.histograms.items():
+            if histogram.count > 0:
+                taken[stage] = histogram.copy()
+                histogram.clear()
+        return taken
+
+    def merge(self, histograms: Dict[str, Histogram]) -> None:
+        """
+        Adds histograms taken from another registry to this one.
+        """
+        for stage, histogram in histograms.items():
+            self.histogram(stage).merge(histogram)
+        return
+
+    def reset(self) -> None:
+        """
+        Discards all recorded timings.
+        """
+        for histogram in self.histograms.values():
+            histogram.clear()
+        return
+
+    def to_json(self) -> str:
+        """
+        Returns the timings as JSON: for each stage, the count, the sum in
+        seconds and the bucket bounds with the number of observations in
+        each.
+        """
+        return json.dumps({
+            stage: {
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'bounds': list(BOUNDS),
+                'counts': histogram.counts
+            }
+            for stage, histogram in sorted(self.histograms.items())
+        }, indent=4)
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the timings in the Prometheus text exposition format, as one
+        histogram labelled by stage.
+        """
+        lines = [
+            '# HELP {} Time spent in each stage of evaluation.'.format(METRIC),
+            '# TYPE {} histogram'.format(METRIC)
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            for bound, count in histogram.cumulative():
+                lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(METRIC, stage, bound, count))
+            lines.append('{}_sum{{stage="{}"}} {!r}'.format(METRIC, stage, histogram.sum))
+            lines.append('{}_count{{stage="{}"}} {}'.format(METRIC, stage, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str) -> None:
+        """
+        Writes the timings to path, as JSON if it ends in .json and in the
+        Prometheus text format otherwise.
+        """
+        with open(path, 'w') as output:
+            output.write(self.to_json() if path.endswith('.json') else self.to_prometheus())
+        return
+
+
+# the registry for this process
+registry = Registry()
+
+
+def requested() -> bool:
+    """
+    Returns whether timings should be recorded from the start.
+    """
+    return ENABLE_FLAG in sys.argv or bool(os.environ.get(ENABLE_ENV))
+
+
+def register(owner: Any, name: str, stage: str) -> None:
+    """
+    Times owner.name under stage in the process registry when timing is
+    enabled (see Registry.register).
+    """
+    registry.register(owner, name, stage)
+    return
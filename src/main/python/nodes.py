@@ -0,0 +1,66 @@
+# python built-in imports
+from dataclasses import dataclass
+from typing import Any, Tuple
+
+
+@dataclass(frozen=True)
+class Number:
+    """
+    A numeric literal.
+    """
+    value: Any
+
+
+@dataclass(frozen=True)
+class Text:
+    """
+    A literal string argument, such as a date literal or a time zone name.
+    """
+    value: str
+
+
+@dataclass(frozen=True)
+class Name:
+    """
+    A constant or a value bound at evaluation time (PRV, M, ...).
+    """
+    id: str
+
+
+@dataclass(frozen=True)
+class UnaryOp:
+    """
+    A prefix + or -.
+    """
+    op: str
+    operand: Any
+
+
+@dataclass(frozen=True)
+class BinOp:
+    """
+    One of the arithmetic operators + - * / ^.
+    """
+    op: str
+    left: Any
+    right: Any
+
+
+@dataclass(frozen=True)
+class Call:
+    """
+    A call to one of the calculator functions.
+    """
+    func: str
+    args: Tuple[Any, ...]
+
+
+@dataclass(frozen=True)
+class Integral:
+    """
+    The definite integral of body over var from low to high.
+    """
+    body: Any
+    var: str
+    low: Any
+    high: Any
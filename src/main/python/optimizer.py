@@ -0,0 +1,171 @@
+# python built-in imports
+import math
+import operator
+from typing import Any
+
+# calculux imports
+from nodes import BinOp, Call, Integral, Name, Number, UnaryOp
+from factorial import MEMO_LIMIT
+import functions
+
+# values of the names that never change
+CONSTANTS = {'pi': functions.COMMON['pi'], 'e': functions.COMMON['e'], 'j': functions.COMMON['j']}
+
+# functions whose result depends only on their arguments, so calls with
+# constant arguments can be computed ahead of time (the trigonometric
+# functions are not here since they depend on the rad/deg setting)
+PURE_FUNCTIONS = {
+    name: functions.COMMON[name]
+    for name in ('ln', 'log', 'log10', 'sqrt', 'abs', 'fact', 'mod', 'x_rt', 'radians', 'degrees',
+                 'bit_and', 'bit_or', 'bit_xor', 'bit_not', 'shift_left', 'shift_right',
+                 'sum', 'mean', 'stdev', 'min', 'max', 'median', 'percentile')
+}
+
+# integer powers are only folded if the result has at most this many bits, so
+# optimizing something like 9^9^9 can't hang
+FOLD_BITS = 1 << 16
+
+_OPERATORS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv, '^': operator.pow}
+
+# errors that leave a subtree unfolded, so they are raised when the
+# expression is evaluated as they would be without optimization
+_FOLD_ERRORS = (ArithmeticError, ValueError, TypeError)
+
+
+def is_constant(node: Any, value: Any = None) -> bool:
+    """
+    Returns whether node is a number (equal to value if one is given). Only
+    integers count as identities, since x*1.0 turns an integer x into a
+    float.
+    """
+    if not isinstance(node, Number):
+        return False
+    if value is None:
+        return True
+    return type(node.value) is int and node.value == value
+
+
+def _too_large(base: Any, exponent: Any) -> bool:
+    """
+    Returns whether base^exponent is an integer power too large to fold.
+    """
+    if type(base) is not int or type(exponent) is not int or exponent <= 0 or abs(base) < 2:
+        return False
+    return exponent * abs(base).bit_length() > FOLD_BITS
+
+
+def fold(func: Any, *args: Any) -> Any:
+    """
+    Returns Number(func(*args)), or None if the call raised.
+    """
+    try:
+        return Number(func(*args))
+    except _FOLD_ERRORS:
+        return None
+
+
+def simplify(node: Any) -> Any:
+    """
+    Returns an equivalent expression tree with constant subtrees computed
+    ahead of time, identity operations removed (x+0, x*1, x^1, --x, ...),
+    x^2 of a single value turned into x*x and x_rt with a constant index
+    turned into a power (or sqrt for square roots). Only the parts that
+    depend on PRV, M, free variables or the rad/deg setting are left to be
+    computed on evaluation.
+    """
+    if isinstance(node, Name):
+        if node.id in CONSTANTS:
+            return Number(CONSTANTS[node.id])
+        return node
+
+    if isinstance(node, UnaryOp):
+        operand = simplify(node.operand)
+        if node.op == '+':
+            return operand
+        if isinstance(operand, Number):
+            return fold(operator.neg, operand.value) or UnaryOp('-', operand)
+        if isinstance(operand, UnaryOp) and operand.op == '-':
+            return operand.operand
+        return UnaryOp('-', operand)
+
+    if isinstance(node, BinOp):
+        return _simplify_binop(node.op, simplify(node.left), simplify(node.right))
+
+    if isinstance(node, Call):
+        return _simplify_call(node.func, tuple(simplify(arg) for arg in node.args))
+
+    if isinstance(node, Integral):
+        return Integral(simplify(node.body), node.var, simplify(node.low), simplify(node.high))
+
+    return node
+
+
+def _simplify_binop(op: str, left: Any, right: Any) -> Any:
+    """
+    Simplifies a binary operation whose operands are already simplified.
+    """
+    if isinstance(left, Number) and isinstance(right, Number):
+        if not (op == '^' and _too_large(left.value, right.value)):
+            folded = fold(_OPERATORS[op], left.value, right.value)
+            if folded is not None:
+                return folded
+
+    if op == '+':
+        if is_constant(right, 0):
+            return left
+        if is_constant(left, 0):
+            return right
+    elif op == '-':
+        if is_constant(right, 0):
+            return left
+        if is_constant(left, 0):
+            return UnaryOp('-', right)
+    elif op == '*':
+        if is_constant(right, 1):
+            return left
+        if is_constant(left, 1):
+            return right
+    elif op == '/':
+        if is_constant(right, 1):
+            return left
+    elif op == '^':
+        if is_constant(right, 1):
+            return left
+        if is_constant(right, 2) and isinstance(left, Name):
+            # a single multiplication is cheaper than a call to pow
+            return BinOp('*', left, left)
+
+    return BinOp(op, left, right)
+
+
+def _simplify_call(func: str, args: tuple) -> Any:
+    """
+    Simplifies a function call whose arguments are already simplified.
+    """
+    if func in PURE_FUNCTIONS and all(isinstance(arg, Number) for arg in args):
+        values = [arg.value for arg in args]
+        if not (func == 'fact' and _fact_too_large(values[0])):
+            folded = fold(PURE_FUNCTIONS[func], *values)
+            if folded is not None:
+                return folded
+
+    if func == 'x_rt' and len(args) == 2 and isinstance(args[0], Number):
+        # x_rt(x, expr) == expr ^ (1/x), and sqrt is exact for squares
+        index, radicand = args
+        if is_constant(index, 2):
+            return Call('sqrt', (radicand,))
+        exponent = fold(lambda x: 1.0/x, index.value)
+        if exponent is not None:
+            return _simplify_binop('^', radicand, exponent)
+
+    return Call(func, args)
+
+
+def _fact_too_large(x: Any) -> bool:
+    """
+    Returns whether fact(x) would take too long to compute ahead of time.
+    """
+    try:
+        return abs(x) > MEMO_LIMIT or math.isnan(abs(x))
+    except TypeError:
+        return False
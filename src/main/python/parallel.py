@@ -0,0 +1,207 @@
+# python built-in imports
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+import time
+from typing import Any, Iterable, Iterator, List, Set, Tuple
+
+# calculux imports
+from errors import ParseError
+from evaluator import EVALUATION_ERRORS, Evaluator, error_text
+from expression import tokenize
+from stats import Summary, summarize_lines
+from worksheet import parse_definition
+
+# default number of expressions sent to a worker at a time
+CHUNKSIZE = 1000
+
+# the evaluator owned by this worker process, set by _init_worker
+_evaluator = None
+
+
+def _init_worker(evaluator: Evaluator) -> None:
+    """
+    Runs once in every worker process to install that worker's own copy of
+    the evaluator (memory, rad/deg setting, ...).
+    """
+    global _evaluator
+    _evaluator = evaluator
+    return
+
+
+def _evaluate(expression: str) -> Tuple[str, Any]:
+    """
+    Evaluates an expression in a worker process and returns the text to
+    display and the result, which is None if there was an error.
+    """
+    try:
+        result = _evaluator.compute(expression)
+    except EVALUATION_ERRORS as error:
+        return error_text(error), None
+    return _evaluator.history[0].result, result
+
+
+def _evaluate_chunk(chunk: List[str]) -> Tuple[int, List[Tuple[str, Any]], float]:
+    """
+    Evaluates a chunk of expressions in a worker process and returns the
+    worker's pid, the text and result of each one (see _evaluate, blank
+    expressions give ('', None)) and the time spent.
+    """
+    start = time.perf_counter()
+    results = [_evaluate(expression) if expression else ('', None) for expression in chunk]
+    return os.getpid(), results, time.perf_counter() - start
+
+
+def uses_state(expression: str, names: Set[str]) -> bool:
+    """
+    Returns whether the expression is a definition or may use the state
+    earlier expressions leave behind: PRV, PRV[n] or one of names (the
+    worksheet's). Words are checked for the names anywhere in them, since
+    names can run together (e.g. PRVj), so this can only err towards true.
+    """
+    if parse_definition(expression) is not None:
+        return True
+    try:
+        tokens = tokenize(expression)
+    except ParseError:
+        return False
+    for kind, text, _ in tokens:
+        if kind == 'word' and ('PRV' in text or any(name in text for name in names)):
+            return True
+    return False
+
+
+class ThroughputSummary:
+    """
+    Collects how many expressions each worker evaluated and how long it
+    spent doing so.
+    """
+
+    def __init__(self):
+        self.workers = {}  # pid -> [chunks, expressions, seconds]
+        return
+
+    def record(self, pid: int, expressions: int, seconds: float) -> None:
+        """
+        Records one chunk evaluated by the worker with the given pid.
+        """
+        totals = self.workers.setdefault(pid, [0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += expressions
+        totals[2] += seconds
+        return
+
+    def report(self) -> str:
+        """
+        Returns one line per worker with its chunk count, expression count and
+        expressions per second.
+        """
+        lines = []
+        for pid, (chunks, expressions, seconds) in sorted(self.workers.items()):
+            rate = expressions / seconds if seconds > 0 else float('inf')
+            lines.append('worker {}: {} expressions in {} chunks, {:.3f}s ({:.0f}/s)'.format(
+                pid, expressions, chunks, seconds, rate))
+        return '\n'.join(lines)
+
+
+def chunks(expressions: Iterable[str], chunksize: int) -> Iterator[List[str]]:
+    """
+    Groups stripped expressions into lists of at most chunksize.
+    """
+    iterator = (expression.strip() for expression in expressions)
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def evaluate_parallel(expressions: Iterable[str], evaluator: Evaluator = None, workers: int = None,
+                      chunksize: int = CHUNKSIZE, summary: ThroughputSummary = None) -> Iterator[str]:
+    """
+    Evaluates expressions across a pool of worker processes, yielding the
+    results in input order. Each worker gets its own copy of evaluator (a
+    default Evaluator if none is given). Blank expressions give blank results.
+
+    The results are the ones evaluator.evaluate_many would give, whatever the
+    chunk size and number of workers: expressions that use state (see
+    uses_state) are evaluated by evaluator itself, in input order, and the
+    results the workers send back are recorded in its history and as its
+    previous result on the way. Only the others are evaluated in parallel,
+    so an input of expressions that each use PRV runs at the speed of a
+    single process.
+
+    Only a few chunks per worker are in flight at a time, so arbitrarily large
+    inputs are streamed rather than read into memory.
+    """
+    if chunksize < 1:
+        raise ValueError('chunksize must be at least 1')
+    if evaluator is None:
+        evaluator = Evaluator()
+    if summary is None:
+        summary = ThroughputSummary()
+    workers = workers or os.cpu_count() or 1
+
+    # the names defined so far, including by expressions that are yet to be
+    # evaluated (so definitions that are later removed are still counted)
+    names = set(evaluator.worksheet.variables | evaluator.worksheet.functions)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(evaluator,)) as pool:
+        pending = deque()
+        for chunk in chunks(expressions, chunksize):
+            stateful = []
+            for expression in chunk:
+                stateful.append(uses_state(expression, names))
+                definition = parse_definition(expression)
+                if definition is not None:
+                    names.add(definition[0])
+            sent = ['' if uses else expression for expression, uses in zip(chunk, stateful)]
+            pending.append((chunk, stateful, pool.submit(_evaluate_chunk, sent)))
+            if len(pending) >= 2 * workers:
+                yield from _collect(*pending.popleft(), evaluator, summary)
+        while pending:
+            yield from _collect(*pending.popleft(), evaluator, summary)
+
+    return
+
+
+def summarize_parallel(lines: Iterable[str], workers: int = None, chunksize: int = CHUNKSIZE) -> Summary:
+    """
+    Returns the summary of the numbers in lines, one per line (see
+    stats.summarize_lines), summarizing chunks across a pool of worker
+    processes and merging their summaries in input order. Like
+    evaluate_parallel, only a few chunks per worker are in flight at a time.
+    """
+    if chunksize < 1:
+        raise ValueError('chunksize must be at least 1')
+    workers = workers or os.cpu_count() or 1
+
+    summary = Summary()
+    first_line = 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks(lines, chunksize):
+            pending.append(pool.submit(summarize_lines, chunk, first_line))
+            first_line += len(chunk)
+            if len(pending) >= 2 * workers:
+                summary.merge(pending.popleft().result())
+        while pending:
+            summary.merge(pending.popleft().result())
+    return summary
+
+
+def _collect(chunk: List[str], stateful: List[bool], future, evaluator: Evaluator,
+             summary: ThroughputSummary) -> Iterator[str]:
+    """
+    Waits for a chunk to finish, records it in the summary and yields its
+    results, evaluating the expressions that use state with evaluator.
+    """
+    pid, results, seconds = future.result()
+    summary.record(pid, len(results) - sum(stateful), seconds)
+    for expression, uses, (text, result) in zip(chunk, stateful, results):
+        if uses:
+            yield evaluator.evaluate(expression)
+            continue
+        if result is not None:
+            evaluator.record(expression, result, text)
+        yield text
@@ -0,0 +1,452 @@
+# python built-in imports
+import decimal
+from decimal import Decimal
+from fractions import Fraction
+import math
+from typing import Any
+
+# calculux imports
+from cache import LRUCache
+from calculus import ANGLE
+from errors import CalculuxError
+from expression import BITWISE, CACHE_SIZE, RECALL, normalize, parse
+from factorial import int_factorial
+import functions
+from limits import check_power
+from nodes import BinOp, Call, Integral, Name, Number, Text, UnaryOp
+import stats
+
+# precision modes
+FLOAT = 'float'          # IEEE doubles, the fastest
+DECIMAL = 'decimal'      # decimal.Decimal with a set number of significant figures
+FRACTION = 'fraction'    # exact fractions.Fraction, only for rational expressions
+AUTO = 'auto'            # the cheapest of the above that gives the requested digits (floats if none can)
+MODES = (FLOAT, DECIMAL, FRACTION, AUTO)
+
+# significant figures a double can always represent, AUTO uses floats for up
+# to this many digits
+FLOAT_DIGITS = 15
+
+# extra digits carried through decimal calculations so the final rounding to
+# the requested significant figures is correct
+GUARD_DIGITS = 5
+
+# the functions the bitwise operators are parsed into, which are exact for
+# any whole number
+_BITWISE = frozenset(BITWISE.values())
+
+
+class Inexact(CalculuxError, ValueError):
+    """
+    Raised when an expression can't be represented in the requested mode,
+    e.g. sin() with exact fractions or a complex result with decimals.
+    """
+
+
+def _fraction(value: Any) -> Fraction:
+    """
+    Converts a literal or bound value to an exact Fraction.
+    """
+    if isinstance(value, (Fraction, int)):
+        return Fraction(value)
+    if isinstance(value, Decimal):
+        return Fraction(value)
+    if isinstance(value, float):
+        # repr() gives the shortest string that round trips, i.e. the literal
+        # that was typed, so 0.1 becomes 1/10 and not the binary approximation
+        return Fraction(repr(value))
+    raise Inexact('{!r} is not a rational number'.format(value))
+
+
+def _integer_root(value: int, n: int) -> int:
+    """
+    Returns the exact integer nth root of a non-negative value, or raises
+    Inexact if value isn't a perfect nth power.
+    """
+    root = round(value ** (1.0/n)) if value < 2**1000 else _newton_root(value, n)
+    for candidate in (root - 1, root, root + 1):
+        if candidate >= 0 and candidate ** n == value:
+            return candidate
+    raise Inexact('root is irrational')
+
+
+def _newton_root(value: int, n: int) -> int:
+    """
+    Returns floor(value ** (1/n)) for big integers by Newton's method.
+    """
+    x = 1 << -(-value.bit_length() // n)
+    while True:
+        y = ((n - 1) * x + value // x ** (n - 1)) // n
+        if y >= x:
+            return x
+        x = y
+
+
+class FractionArithmetic:
+    """
+    Evaluates expression trees exactly with fractions. Anything that can
+    produce an irrational or complex number raises Inexact.
+    """
+
+    def __init__(self, bindings: dict):
+        self.bindings = bindings
+        return
+
+    def number(self, value: Any) -> Fraction:
+        """
+        Converts a literal to a Fraction.
+        """
+        return _fraction(value)
+
+    def name(self, name: str) -> Fraction:
+        """
+        Looks up a bound name (PRV, M, ...).
+        """
+        if name in self.bindings:
+            return _fraction(self.bindings[name])
+        raise Inexact('{} is not rational'.format(name))
+
+    def power(self, base: Fraction, exponent: Fraction) -> Fraction:
+        """
+        Returns base^exponent, which is only rational for perfect powers.
+        """
+        if exponent.denominator == 1:
+            check_power(base, exponent.numerator)
+            return base ** exponent.numerator
+        return self.root(exponent.denominator, base) ** exponent.numerator
+
+    def root(self, n: Fraction, x: Fraction) -> Fraction:
+        """
+        Returns the exact nth root of x.
+        """
+        if n.denominator != 1 or n < 1 or x < 0:
+            raise Inexact('root is irrational')
+        n = int(n)
+        return Fraction(_integer_root(x.numerator, n), _integer_root(x.denominator, n))
+
+    def call(self, func: str, args: list) -> Fraction:
+        """
+        Calls one of the calculator functions.
+        """
+        if func == RECALL:
+            return self.number(self.bindings[RECALL](int(*args)))
+        if func == 'abs':
+            return abs(*args)
+        if func == 'mod':
+            return args[0] % args[1]
+        if func == 'fact':
+            if args[0].denominator != 1:
+                raise Inexact('factorial of a fraction is irrational')
+            return Fraction(int_factorial(int(args[0])))
+        if func == 'sqrt':
+            return self.root(Fraction(2), *args)
+        if func == 'x_rt':
+            return self.root(*args)
+        if func in _BITWISE:
+            return Fraction(functions.COMMON[func](*args))
+        if func == 'stdev':
+            return self.root(Fraction(2), stats.variance(args))
+        if func in stats.AGGREGATES:
+            return stats.exact(func, args)
+        raise Inexact('{}() is irrational'.format(func))
+
+
+class DecimalArithmetic:
+    """
+    Evaluates expression trees with decimals to a set number of significant
+    figures (plus guard digits). Complex results raise Inexact.
+    """
+
+    def __init__(self, bindings: dict, digits: int, use_radians: bool = True):
+        self.bindings = bindings
+        self.use_radians = use_radians
+        self.context = decimal.Context(prec=digits + GUARD_DIGITS, traps=[
+            decimal.InvalidOperation, decimal.DivisionByZero, decimal.Overflow])
+        return
+
+    def number(self, value: Any) -> Decimal:
+        """
+        Converts a literal or bound value to a Decimal.
+        """
+        if isinstance(value, Fraction):
+            return self.context.divide(Decimal(value.numerator), Decimal(value.denominator))
+        if isinstance(value, float):
+            return Decimal(repr(value))
+        if isinstance(value, (int, Decimal)):
+            return Decimal(value)
+        raise Inexact('{!r} is not a real number'.format(value))
+
+    def name(self, name: str) -> Decimal:
+        """
+        Returns pi, e, or a bound name (PRV, M, ...).
+        """
+        if name == 'pi':
+            return self.pi()
+        if name == 'e':
+            return self.context.exp(Decimal(1))
+        if name == ANGLE:
+            return Decimal(1) if self.use_radians else self.pi() / 180
+        if name in self.bindings:
+            return self.number(self.bindings[name])
+        raise Inexact('{} is not a real number'.format(name))
+
+    def power(self, base: Decimal, exponent: Decimal) -> Decimal:
+        """
+        Returns base^exponent.
+        """
+        if base < 0 and exponent != exponent.to_integral_value():
+            raise Inexact('result is complex')
+        return self.context.power(base, exponent)
+
+    def pi(self) -> Decimal:
+        """
+        Computes pi to the context precision (recipe from the decimal docs).
+        """
+        with decimal.localcontext(self.context) as context:
+            context.prec += 2
+            three = Decimal(3)
+            lasts, t, s, n, na, d, da = 0, three, 3, 1, 0, 0, 24
+            while s != lasts:
+                lasts = s
+                n, na = n+na, na+8
+                d, da = d+da, da+32
+                t = (t * n) / d
+                s += t
+        return self.context.plus(s)
+
+    def sin(self, x: Decimal) -> Decimal:
+        """
+        Computes sin(x) by its Taylor series (recipe from the decimal docs).
+        """
+        with decimal.localcontext(self.context) as context:
+            context.prec += 2
+            x = x % (2 * self.pi())
+            i, lasts, s, fact, num, sign = 1, 0, x, 1, x, 1
+            while s != lasts:
+                lasts = s
+                i += 2
+                fact *= i * (i-1)
+                num *= x * x
+                sign *= -1
+                s += num / fact * sign
+        return self.context.plus(s)
+
+    def cos(self, x: Decimal) -> Decimal:
+        """
+        Computes cos(x) by its Taylor series (recipe from the decimal docs).
+        """
+        with decimal.localcontext(self.context) as context:
+            context.prec += 2
+            x = x % (2 * self.pi())
+            i, lasts, s, fact, num, sign = 0, 0, 1, 1, 1, 1
+            while s != lasts:
+                lasts = s
+                i += 2
+                fact *= i * (i-1)
+                num *= x * x
+                sign *= -1
+                s += num / fact * sign
+        return self.context.plus(s)
+
+    def atan(self, x: Decimal) -> Decimal:
+        """
+        Computes atan(x) by its Taylor series after argument reduction.
+        """
+        with decimal.localcontext(self.context) as context:
+            context.prec += 2
+            # halve the angle until the series converges quickly
+            # (atan(x) == 2 atan(x / (1 + sqrt(1 + x^2))))
+            doublings = 0
+            while abs(x) > Decimal('0.1'):
+                x = x / (1 + (1 + x * x).sqrt())
+                doublings += 1
+            i, lasts, s, num, sign = 1, 0, x, x, 1
+            while s != lasts:
+                lasts = s
+                i += 2
+                num *= x * x
+                sign *= -1
+                s += num / i * sign
+            s *= 2 ** doublings
+        return self.context.plus(s)
+
+    def asin(self, x: Decimal) -> Decimal:
+        """
+        Computes asin(x) from atan(x / sqrt(1 - x^2)).
+        """
+        if abs(x) > 1:
+            raise Inexact('result is complex')
+        if abs(x) == 1:
+            return x * self.pi() / 2
+        return self.atan(x / self.context.sqrt(1 - x * x))
+
+    def trig(self, func: str, x: Decimal) -> Decimal:
+        """
+        Evaluates one of the trigonometric functions in radians or degrees.
+        """
+        degrees = self.pi() / 180
+        if func in ('sin', 'cos', 'tan') and not self.use_radians:
+            x = x * degrees
+        if func == 'sin':
+            result = self.sin(x)
+        elif func == 'cos':
+            result = self.cos(x)
+        elif func == 'tan':
+            result = self.sin(x) / self.cos(x)
+        elif func == 'asin':
+            result = self.asin(x)
+        elif func == 'acos':
+            result = self.pi() / 2 - self.asin(x)
+        else:
+            result = self.atan(x)
+        if func in ('asin', 'acos', 'atan') and not self.use_radians:
+            result = result / degrees
+        return self.context.plus(result)
+
+    def call(self, func: str, args: list) -> Decimal:
+        """
+        Calls one of the calculator functions.
+        """
+        context = self.context
+        if func == RECALL:
+            return self.number(self.bindings[RECALL](int(*args)))
+        if func in ('sin', 'cos', 'tan', 'asin', 'acos', 'atan'):
+            return self.trig(func, *args)
+        if func in ('ln', 'log', 'log10', 'sqrt') and args[0] < 0:
+            raise Inexact('result is complex')
+        if func == 'ln':
+            return context.ln(*args)
+        if func == 'log':
+            if len(args) == 1:
+                return context.ln(args[0])
+            return context.divide(context.ln(args[0]), context.ln(args[1]))
+        if func == 'log10':
+            return context.log10(*args)
+        if func == 'sqrt':
+            return context.sqrt(*args)
+        if func == 'abs':
+            return context.abs(*args)
+        if func == 'mod':
+            # Python's % semantics (sign of the divisor), not Decimal's (sign
+            # of the dividend)
+            x, y = args
+            remainder = context.remainder(x, y)
+            if remainder != 0 and (remainder < 0) != (y < 0):
+                remainder = context.add(remainder, y)
+            return remainder
+        if func == 'x_rt':
+            return self.power(args[1], context.divide(Decimal(1), args[0]))
+        if func == 'fact':
+            if args[0] != args[0].to_integral_value():
+                raise Inexact('factorial of a non-integer needs the gamma function')
+            return context.plus(Decimal(int_factorial(int(args[0]))))
+        if func == 'radians':
+            return context.multiply(args[0], self.pi() / 180)
+        if func == 'degrees':
+            return context.divide(args[0], self.pi() / 180)
+        if func in _BITWISE:
+            return context.plus(Decimal(functions.COMMON[func](*args)))
+        if func == 'stdev':
+            return context.sqrt(stats.variance(args))
+        if func in stats.AGGREGATES:
+            return context.plus(stats.exact(func, args))
+        raise Inexact('{}() is not supported with decimals'.format(func))
+
+
+def interpret(node: Any, arithmetic: Any) -> Any:
+    """
+    Evaluates an expression tree with the given arithmetic.
+    """
+    if isinstance(node, Number):
+        return arithmetic.number(node.value)
+    if isinstance(node, Name):
+        return arithmetic.name(node.id)
+    if isinstance(node, UnaryOp):
+        operand = interpret(node.operand, arithmetic)
+        return -operand if node.op == '-' else operand
+    if isinstance(node, BinOp):
+        left = interpret(node.left, arithmetic)
+        right = interpret(node.right, arithmetic)
+        if node.op == '+':
+            return left + right
+        if node.op == '-':
+            return left - right
+        if node.op == '*':
+            return left * right
+        if node.op == '/':
+            return left / right
+        return arithmetic.power(left, right)
+    if isinstance(node, Call):
+        return arithmetic.call(node.func, [interpret(arg, arithmetic) for arg in node.args])
+    if isinstance(node, Integral):
+        raise Inexact('integrals are computed with floats')
+    if isinstance(node, Text):
+        raise Inexact('dates and times are computed with floats')
+    raise TypeError('unknown node {!r}'.format(node))
+
+
+# unoptimized trees keyed on the normalized text, the worksheet names and base,
+# since the optimizer folds constants with floats
+_trees = LRUCache(CACHE_SIZE)
+
+
+def evaluate_precise(expression: str, mode: str, digits: int, bindings: dict, use_radians: bool = True,
+                     variables: frozenset = frozenset(), functions: frozenset = frozenset(), base: int = 10) -> Any:
+    """
+    Evaluates the expression as an exact Fraction (FRACTION), as a Decimal
+    rounded to digits significant figures (DECIMAL), or as a Fraction if the
+    expression is rational and otherwise a Decimal (AUTO). Floating point
+    evaluation is done by the Evaluator. The names of worksheet variables
+    (whose values are in bindings) and functions are accepted, but calls to
+    worksheet functions raise Inexact. Numbers without a prefix are read in
+    base.
+    """
+    key = normalize(expression)
+    tree = _trees.get_or_create((key, variables, functions, base), lambda: parse(key, variables, functions, base))
+
+    if mode in (FRACTION, AUTO):
+        try:
+            return interpret(tree, FractionArithmetic(bindings))
+        except Inexact:
+            if mode == FRACTION:
+                raise
+
+    arithmetic = DecimalArithmetic(bindings, digits, use_radians)
+    with decimal.localcontext(arithmetic.context):
+        result = interpret(tree, arithmetic)
+    return decimal.Context(prec=digits).plus(result)
+
+
+def trim_zeros(value: Decimal) -> Decimal:
+    """
+    Returns value without trailing zeros in its digits, e.g. 0.010 as 0.01,
+    1.00E+30 as 1E+30 and 100.0 as 100 (which Decimal.normalize() would make
+    1E+2).
+    """
+    _, digits, exponent = value.as_tuple()
+    if not isinstance(exponent, int) or exponent == 0:
+        return value
+    # a context as precise as value, so nothing is rounded
+    context = decimal.Context(prec=len(digits))
+    trimmed = value.normalize(context)
+    if exponent > 0:
+        return trimmed
+    if trimmed.as_tuple().exponent > 0:
+        return value.quantize(Decimal(1), context=context)
+    return trimmed
+
+
+def round_significant(value: Any, digits: int) -> Any:
+    """
+    Rounds a real number to digits significant figures.
+    """
+    if isinstance(value, Fraction):
+        value = DecimalArithmetic({}, digits).number(value)
+    if isinstance(value, Decimal):
+        return decimal.Context(prec=digits).plus(value)
+    if value == 0 or not math.isfinite(value):
+        return value
+    magnitude = math.floor(math.log10(abs(value)))
+    if isinstance(value, int) and magnitude < digits:
+        return value
+    return round(value, digits - 1 - magnitude)
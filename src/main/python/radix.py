@@ -0,0 +1,194 @@
+# python built-in imports
+import decimal
+from decimal import Decimal
+from typing import Any, Dict, List
+
+# digit characters for bases up to 36
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# prefixes of integer literals in the common bases (0x1F, 0o17, 0b101). Any
+# other base is written base#digits, e.g. 36#ZZ
+PREFIXES = {16: '0x', 8: '0o', 2: '0b'}
+MARK = '#'
+
+# the bases the display can show
+BASES = range(2, len(DIGITS) + 1)
+
+# word sizes integers can be wrapped to, in bits
+WORD_SIZES = (8, 16, 32, 64)
+
+# integers up to this many bits are converted with the built in functions,
+# larger ones are split in halves recursively
+CUTOFF = 2048
+
+# digits of a string converted to an integer in one go, well below the
+# interpreter's limit on int(str) for bases that aren't powers of 2
+CHUNK = 1000
+
+# decimal arithmetic that is exact however long the numbers get
+_EXACT = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN,
+                         traps=[decimal.Inexact])
+
+
+def _power_of_two(base: int) -> bool:
+    return base & (base - 1) == 0
+
+
+def to_digits(n: int, base: int = 10) -> str:
+    """
+    Returns the digits of n in base, with a '-' if it is negative. Built in
+    conversions are used where they are linear (bases that are powers of 2)
+    or the number is small. Otherwise the number is split recursively into
+    high and low halves: in base 10 the halves are recombined as Decimals,
+    whose multiplication is subquadratic, and in other bases the number is
+    divided by precomputed powers of the base. Either way there is no limit
+    on the number of digits and huge results don't take quadratic time.
+    """
+    if n < 0:
+        return '-' + to_digits(-n, base)
+    if base == 16:
+        return format(n, 'X')
+    if base == 8:
+        return format(n, 'o')
+    if base == 2:
+        return format(n, 'b')
+    if base == 10:
+        return format(_to_decimal(n, n.bit_length(), {}), 'f') if n.bit_length() > CUTOFF else str(n)
+
+    # powers[k] == base^(2^k), up to about the square root of n
+    powers = [base]
+    while powers[-1].bit_length() * 2 <= n.bit_length() + 1:
+        powers.append(powers[-1] * powers[-1])
+    pieces = []
+    _split_digits(n, base, powers, len(powers) - 1, 0, pieces)
+    return ''.join(pieces)
+
+
+def _to_decimal(n: int, bits: int, powers: Dict[int, Decimal]) -> Decimal:
+    """
+    Converts a non-negative integer of at most bits bits to an exact Decimal
+    by converting its high and low halves and combining them. powers caches
+    the powers of 2 used.
+    """
+    if bits <= CUTOFF:
+        return Decimal(n)
+    half = bits >> 1
+    high = n >> half
+    low = n - (high << half)
+    if half not in powers:
+        powers[half] = _EXACT.power(2, half)
+    high = _to_decimal(high, bits - half, powers)
+    return _EXACT.add(_EXACT.multiply(high, powers[half]), _to_decimal(low, half, powers))
+
+
+def _split_digits(n: int, base: int, powers: List[int], k: int, width: int, pieces: List[str]) -> None:
+    """
+    Appends the digits of n to pieces, padded with zeros to width digits,
+    dividing by powers[k] (base^(2^k)) to split it into halves.
+    """
+    if n.bit_length() <= CUTOFF or k < 0:
+        digits = []
+        while n:
+            n, digit = divmod(n, base)
+            digits.append(DIGITS[digit])
+        text = ''.join(reversed(digits)) or ('0' if width == 0 else '')
+        pieces.append(text.rjust(width, '0'))
+        return
+    high, low = divmod(n, powers[k])
+    half = 1 << k
+    if high or width:
+        _split_digits(high, base, powers, k - 1, max(width - half, 0), pieces)
+        _split_digits(low, base, powers, k - 1, half, pieces)
+    else:
+        _split_digits(low, base, powers, k - 1, 0, pieces)
+    return
+
+
+def from_digits(digits: str, base: int = 10) -> int:
+    """
+    Returns the integer written with the given digits in base. Long strings
+    are split in halves and recombined with a multiplication (which is
+    subquadratic), so there is no limit on the number of digits.
+    """
+    if _power_of_two(base) or len(digits) <= CHUNK:
+        return int(digits, base)
+    return _join_digits(digits, base, {})
+
+
+def _join_digits(digits: str, base: int, powers: Dict[int, int]) -> int:
+    """
+    Converts the high and low halves of digits and combines them. powers
+    caches the powers of the base used.
+    """
+    if len(digits) <= CHUNK:
+        return int(digits, base)
+    half = len(digits) // 2
+    if half not in powers:
+        powers[half] = base ** half
+    return _join_digits(digits[:-half], base, powers) * powers[half] + _join_digits(digits[-half:], base, powers)
+
+
+def parse_literal(text: str) -> int:
+    """
+    Returns the value of an integer literal: decimal digits, a prefixed
+    literal such as 0xFF or base#digits. Raises ValueError if a digit is
+    too large for the base.
+    """
+    if MARK in text:
+        base, digits = text.split(MARK)
+        base = int(base)
+        if base not in BASES:
+            raise ValueError('bases go from {} to {}'.format(BASES.start, BASES.stop - 1))
+    elif text[:2].lower() in ('0x', '0o', '0b'):
+        base = {'x': 16, 'o': 8, 'b': 2}[text[1].lower()]
+        digits = text[2:]
+    else:
+        base, digits = 10, text
+    for digit in digits:
+        if DIGITS.find(digit.upper()) not in range(base):
+            raise ValueError('{!r} is not a digit in base {}'.format(digit, base))
+    return from_digits(digits, base)
+
+
+def wrap(n: int, word_size: int) -> int:
+    """
+    Wraps an integer to a signed two's complement word of word_size bits.
+    """
+    half = 1 << (word_size - 1)
+    return ((n + half) & ((half << 1) - 1)) - half
+
+
+def format_integer(n: int, base: int = 10, word_size: int = None) -> str:
+    """
+    Formats an integer in base as a literal that can be typed back in (e.g.
+    0xFF or 3#120). With a word size, negative numbers are shown in two's
+    complement in every base but 10.
+    """
+    if base == 10:
+        return to_digits(n)
+    sign = ''
+    if n < 0:
+        if word_size is not None:
+            n += 1 << word_size
+        else:
+            sign, n = '-', -n
+    prefix = PREFIXES.get(base, '{}{}'.format(base, MARK))
+    return sign + prefix + to_digits(n, base)
+
+
+def as_integer(value: Any) -> Any:
+    """
+    Returns value as an int if it is a whole real number, otherwise None.
+    """
+    if isinstance(value, complex):
+        if value.imag != 0:
+            return None
+        value = value.real
+    if isinstance(value, int):
+        return value
+    try:
+        if value == int(value):
+            return int(value)
+    except (ValueError, OverflowError, TypeError):
+        pass
+    return None
@@ -0,0 +1,293 @@
+# python built-in imports
+import multiprocessing
+from multiprocessing.connection import Connection
+import pickle
+import threading
+from typing import Any, Tuple
+
+# calculux imports
+from errors import EvaluationTimeout, WorkerError
+from evaluator import EVALUATION_ERRORS, Evaluator, error_text
+from expression import normalize
+import metrics
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# seconds an evaluation may run before it is cancelled
+TIMEOUT = 3.0
+
+# seconds a preview may run before it is given up on
+PREVIEW_TIMEOUT = 1.0
+
+# bytes of memory the worker process may use (None for no limit), only
+# enforced where the resource module can limit the address space
+MEMORY_LIMIT = 1 << 31
+
+# the evaluator state sent to the worker with every expression
+SETTINGS = ('memory', 'previous_result', 'use_radians', 'precision', 'digits', 'base', 'word_size', 'calendar')
+
+# workers are started fresh rather than forked, since forking a process
+# that runs Qt threads isn't safe
+_context = multiprocessing.get_context('spawn')
+
+
+def _limit_memory(memory_limit: int) -> None:
+    """
+    Limits the address space of the current process, if the platform allows.
+    """
+    if memory_limit is None or resource is None:
+        return
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            memory_limit = min(memory_limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+    except (ValueError, OSError):
+        pass  # e.g. macOS doesn't support RLIMIT_AS
+    return
+
+
+def _serve(connection: Connection, evaluator: Evaluator, memory_limit: int) -> None:
+    """
+    Worker process loop: receives the expression to evaluate with the
+    evaluator's SETTINGS (and its worksheet and history, pickled, if the
+    worker doesn't have them yet), and sends back (True, result, timings,
+    worksheet) or (False, error, timings, worksheet), where timings are the
+    stage histograms recorded if metrics are enabled and worksheet is a copy
+    of the worksheet if the expression changed it, or None. A preview is
+    sent back as (True, text, timings, None), changing nothing (see
+    Evaluator.preview). Sends None first, once it is ready.
+    """
+    _limit_memory(memory_limit)
+    connection.send(None)
+    while True:
+        try:
+            expression, settings, state, timed, preview = connection.recv()
+        except EOFError:
+            return
+        if state is not None:
+            evaluator.worksheet, evaluator.history = pickle.loads(state)
+        if timed:
+            metrics.registry.enable()
+        else:
+            metrics.registry.disable()
+        for name, value in zip(SETTINGS, settings):
+            setattr(evaluator, name, value)
+        if preview:
+            try:
+                text = evaluator.preview(expression)()
+            except EVALUATION_ERRORS:
+                text = ''
+            connection.send((True, text, metrics.registry.take() if timed else None, None))
+            continue
+        version = evaluator.worksheet.version
+        try:
+            response = (True, evaluator.compute(expression))
+        except EVALUATION_ERRORS as error:
+            response = (False, error)
+        except Exception as error:
+            # anything else is a bug, which shouldn't take the worker down
+            response = (False, WorkerError(repr(error)))
+        worksheet = evaluator.worksheet if evaluator.worksheet.version != version else None
+        try:
+            connection.send(response + (metrics.registry.take() if timed else None, worksheet))
+        except Exception as error:  # e.g. an error that can't be pickled
+            connection.send((False, WorkerError(repr(error)), None, None))
+
+
+class Sandbox:
+    """
+    Evaluates expressions for an evaluator in a worker process, so an
+    evaluation that takes longer than timeout seconds can be cancelled (by
+    killing the worker, which is then restarted) and one that needs more
+    than memory_limit bytes fails instead of taking the whole machine's
+    memory. The evaluator keeps all the state: its memory, previous result,
+    rad/deg setting and precision are sent with every expression and
+    results are recorded in its history as Evaluator.evaluate would.
+    Definitions are made on the worker's copy of the worksheet, which is
+    sent back to replace the evaluator's whenever it changes (so a worker
+    that is restarted starts from the last definitions that succeeded).
+
+    A sandbox can be attached to another evaluator between evaluations, so
+    a few workers can serve many evaluators (e.g. the server's sessions).
+    """
+
+    def __init__(self, evaluator: Evaluator, timeout: float = TIMEOUT, memory_limit: int = MEMORY_LIMIT):
+        self.evaluator = evaluator
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.process = None
+        self.connection = None
+        self.attached = False  # true if the worker has another evaluator's worksheet
+        # held while the worker is started or evaluating, so it can be
+        # started from another thread (e.g. in the background at start up)
+        self.lock = threading.RLock()
+        return
+
+    def attach(self, evaluator: Evaluator) -> None:
+        """
+        Makes the sandbox evaluate for evaluator from now on. Its worksheet
+        and history are sent to the worker with the next expression.
+        """
+        if evaluator is not self.evaluator:
+            self.evaluator = evaluator
+            self.attached = True
+        return
+
+    def start(self) -> None:
+        """
+        Starts the worker process if it isn't running, and waits for it to be
+        ready so its start up doesn't count towards the timeout. An
+        evaluation waits for a start in another thread to finish.
+        """
+        with self.lock:
+            if self.process is not None and self.process.is_alive():
+                return
+            self.stop()
+            self.connection, child = _context.Pipe()
+            self.process = _context.Process(target=_serve, args=(child, self.evaluator, self.memory_limit),
+                                            daemon=True)
+            self.process.start()
+            child.close()
+            self.connection.recv()
+            self.attached = False
+        return
+
+    def stop(self) -> None:
+        """
+        Kills the worker process, if there is one.
+        """
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.connection.close()
+        self.process = None
+        self.connection = None
+        return
+
+    def compute(self, expression: str) -> Any:
+        """
+        Evaluates the expression in the worker and returns the result, which
+        also becomes the previous result (None for function definitions and
+        removals, like Evaluator.compute). Raises EvaluationTimeout if it is
+        cancelled, MemoryError if the worker dies (also while starting) and
+        the evaluation's own errors otherwise.
+        """
+        evaluator = self.evaluator
+        with self.lock:
+            try:
+                self.start()
+                settings = tuple(getattr(evaluator, name) for name in SETTINGS)
+                state = pickle.dumps((evaluator.worksheet, evaluator.history)) if self.attached else None
+                self.connection.send((expression, settings, state, metrics.registry.enabled, False))
+                self.attached = False
+                if not self.connection.poll(self.timeout):
+                    self.stop()
+                    raise EvaluationTimeout('evaluation took longer than {} seconds'.format(self.timeout))
+                succeeded, value, timings, worksheet = self.connection.recv()
+            except (EOFError, BrokenPipeError):
+                self.stop()
+                raise MemoryError('the evaluation process died')
+        if timings:
+            metrics.registry.merge(timings)
+        if worksheet is not None:
+            evaluator.worksheet = worksheet
+        if not succeeded:
+            raise value
+        if value is None:
+            return None
+        evaluator.previous_result = value
+        evaluator.history.append(expression, evaluator.format(value))
+        return value
+
+    def evaluate(self, expression: str) -> str:
+        """
+        Evaluates the expression and returns the text to display, like
+        Evaluator.evaluate.
+        """
+        try:
+            value = self.compute(expression)
+        except EVALUATION_ERRORS as error:
+            return error_text(error)
+        if value is None:
+            return normalize(expression)
+        return self.evaluator.history[0].result
+
+
+class PreviewSandbox(Sandbox):
+    """
+    Evaluates previews (see Evaluator.preview) for an evaluator in a worker
+    process of their own, so a slow one holds up neither the window nor
+    evaluations, and is given up on after timeout seconds. Requests are
+    made with request() on the thread that uses the evaluator, taking a
+    copy of its settings, worksheet and history, and evaluated with
+    preview(), e.g. in a thread pool, which never reads the evaluator. A
+    preview that is out of date is stopped with cancel().
+    """
+
+    def __init__(self, evaluator: Evaluator, timeout: float = PREVIEW_TIMEOUT, memory_limit: int = MEMORY_LIMIT):
+        # the worker starts from a blank evaluator, which isn't changed while
+        # it is copied to a worker, and gets the state with the requests
+        super().__init__(Evaluator(), timeout, memory_limit)
+        self.source = evaluator
+        self.marker = None  # the worksheet, its version and the newest history entry last copied
+        self.state = None  # that worksheet and history, pickled
+        self.version = 0  # counts the copies, so the worker's copy is known
+        self.loaded = None  # the version of the copy the worker has
+        self.busy = False
+        return
+
+    def request(self, expression: str) -> Tuple:
+        """
+        Returns the request to preview the expression with the evaluator's
+        current state. The worksheet and history are only copied again when
+        they have changed.
+        """
+        evaluator = self.source
+        history = evaluator.history
+        marker = (evaluator.worksheet, evaluator.worksheet.version, history[0] if len(history) > 0 else None)
+        if self.marker is None or any(a is not b for a, b in zip(marker, self.marker)):
+            self.marker = marker
+            self.state = pickle.dumps((evaluator.worksheet, history))
+            self.version += 1
+        settings = tuple(getattr(evaluator, name) for name in SETTINGS)
+        return expression, settings, self.version, self.state
+
+    def preview(self, request: Tuple) -> str:
+        """
+        Evaluates a request made by request() and returns the text to
+        display, or '' if it can't be evaluated, takes longer than timeout
+        seconds or is cancelled.
+        """
+        expression, settings, version, state = request
+        with self.lock:
+            self.busy = True
+            try:
+                if self.process is None or not self.process.is_alive():
+                    self.loaded = None
+                self.start()
+                self.connection.send((expression, settings, state if version != self.loaded else None, False, True))
+                if not self.connection.poll(self.timeout):
+                    self.stop()
+                    return ''
+                _, text, _, _ = self.connection.recv()
+                self.loaded = version
+            except (EOFError, OSError):
+                self.stop()
+                return ''
+            finally:
+                self.busy = False
+        return text
+
+    def cancel(self) -> None:
+        """
+        Stops the preview being evaluated, if there is one, by killing the
+        worker. The next preview starts a new one.
+        """
+        process = self.process
+        if self.busy and process is not None:
+            process.kill()
+        return
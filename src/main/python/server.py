@@ -0,0 +1,274 @@
+# python built-in imports
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import math
+import os
+import sys
+from typing import Any
+
+# calculux imports
+from cache import LRUCache
+from evaluator import Evaluator, use_radians
+from expression import CACHE_SIZE
+from history import History
+from precision import FLOAT, MODES
+from sandbox import MEMORY_LIMIT, TIMEOUT, Sandbox
+
+# where the server listens by default
+SOCKET_PATH = os.path.join(os.path.expanduser('~'), '.calculux', 'calculux.sock')
+
+# number of sessions kept, the least recently used one is dropped after that
+SESSIONS = 1024
+
+# number of results each session keeps for PRV[n]
+SESSION_HISTORY = 100
+
+# the session plain text requests and JSON requests without one belong to
+DEFAULT_SESSION = ''
+
+# worker processes evaluating requests, so this many can run at once
+WORKERS = 4
+
+
+class Session:
+    """
+    The evaluator of a session, with the lock that keeps its requests from
+    being evaluated at the same time when several clients use it.
+    """
+    __slots__ = ('evaluator', 'lock')
+
+    def __init__(self, evaluator: Evaluator):
+        self.evaluator = evaluator
+        self.lock = asyncio.Lock()
+        return
+
+
+class Server:
+    """
+    Keeps warm evaluators resident and answers requests on a Unix domain
+    socket. Each line a client sends is one request, answered with one line
+    in the order received, so clients can pipeline as many as they like.
+
+    A request is either an expression as plain text, answered with the
+    display text, or a JSON object:
+
+        {"expression": "PRV*2", "session": "a", "memory": 3, "mode": "deg", "id": 7}
+
+    where everything but the expression is optional. Every session has its
+    own memory, previous result, history and rad/deg setting, like a
+    calculator window; "memory" and "mode" change them before evaluating.
+    The answer is a JSON object with the result and the session's state
+    afterwards (and the id if one was given), or with "error" if the
+    request couldn't be understood.
+
+    Expressions are evaluated in up to workers sandboxes (see
+    sandbox.Sandbox), waited on in threads, so the event loop keeps serving
+    other clients meanwhile and an evaluation that takes longer than timeout
+    seconds is cancelled with ERROR: timeout. Each worker has an expression
+    cache shared by the sessions it serves.
+    """
+
+    def __init__(self, path: str = SOCKET_PATH, sessions: int = SESSIONS, cache_size: int = CACHE_SIZE,
+                 precision: str = FLOAT, digits: int = None, mode: str = 'rad', workers: int = WORKERS,
+                 timeout: float = TIMEOUT, memory_limit: int = MEMORY_LIMIT):
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+        self.path = path
+        self.sessions = LRUCache(sessions)
+        self.cache_size = cache_size
+        self.precision = precision
+        self.digits = digits
+        self.use_radians = use_radians(mode)
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.executor = ThreadPoolExecutor(workers)
+        self.available = asyncio.Semaphore(workers)
+        self.idle = []  # sandboxes not evaluating, least recently used first
+        self.server = None
+        return
+
+    def session(self, name: str) -> Session:
+        """
+        Returns a session, creating it if it's new.
+        """
+        return self.sessions.get_or_create(name, self.create_session)
+
+    def create_session(self) -> Session:
+        """
+        Returns a new session.
+        """
+        evaluator = Evaluator(self.use_radians, self.cache_size, precision=self.precision, digits=self.digits,
+                              history=History(SESSION_HISTORY))
+        return Session(evaluator)
+
+    def sandbox(self, evaluator: Evaluator) -> Sandbox:
+        """
+        Takes an idle sandbox and attaches it to evaluator, preferring one
+        that already evaluates for it so its worksheet isn't sent again.
+        Creates a sandbox if none is idle.
+        """
+        for sandbox in self.idle:
+            if sandbox.evaluator is evaluator:
+                self.idle.remove(sandbox)
+                return sandbox
+        if not self.idle:
+            return Sandbox(evaluator, self.timeout, self.memory_limit)
+        sandbox = self.idle.pop(0)
+        sandbox.attach(evaluator)
+        return sandbox
+
+    async def evaluate(self, evaluator: Evaluator, expression: str) -> str:
+        """
+        Evaluates the expression for evaluator in a sandbox and returns the
+        text to display, waiting for a sandbox if all of them are busy.
+        """
+        async with self.available:
+            sandbox = self.sandbox(evaluator)
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, sandbox.evaluate, expression)
+            finally:
+                self.idle.append(sandbox)
+
+    async def respond(self, line: str) -> str:
+        """
+        Answers one request line.
+        """
+        line = line.strip()
+        if not line.startswith('{'):
+            if not line:
+                return ''
+            session = self.session(DEFAULT_SESSION)
+            async with session.lock:
+                return await self.evaluate(session.evaluator, line)
+
+        try:
+            request = json.loads(line)
+            response = await self.respond_json(request)
+        except (ValueError, TypeError, KeyError) as error:
+            response = {'error': str(error)}
+        return json.dumps(response)
+
+    async def respond_json(self, request: dict) -> dict:
+        """
+        Answers a request given as a JSON object.
+        """
+        expression = request['expression']
+        if not isinstance(expression, str):
+            raise TypeError('expression must be a string')
+        name = str(request.get('session', DEFAULT_SESSION))
+        session = self.session(name)
+        async with session.lock:
+            evaluator = session.evaluator
+            if 'mode' in request:
+                evaluator.use_radians = use_radians(request['mode'])
+            if 'memory' in request:
+                if isinstance(request['memory'], bool) or not isinstance(request['memory'], (int, float)):
+                    raise TypeError('memory must be a number')
+                if isinstance(request['memory'], float) and not math.isfinite(request['memory']):
+                    # it would be answered as Infinity or NaN, which isn't JSON
+                    raise ValueError('memory must be finite')
+                evaluator.memory = request['memory']
+
+            response = {
+                'result': await self.evaluate(evaluator, expression),
+                'session': name,
+                'memory': evaluator.memory,
+                'mode': 'rad' if evaluator.use_radians else 'deg'
+            }
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves one client connection until it is closed.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write((await self.respond(line.decode()) + '\n').encode())
+                # only wait for the client when the write buffer fills up, so
+                # pipelined requests are answered in batches
+                if writer.transport.get_write_buffer_size() > 1 << 16:
+                    await writer.drain()
+            await writer.drain()
+        except (ConnectionError, UnicodeDecodeError):
+            pass
+        finally:
+            writer.close()
+        return
+
+    async def start(self) -> None:
+        """
+        Starts listening on the socket, replacing a stale socket file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.handle, path=self.path)
+        return
+
+    async def serve_forever(self) -> None:
+        """
+        Starts the server and answers requests until cancelled.
+        """
+        await self.start()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.close()
+        return
+
+    def close(self) -> None:
+        """
+        Stops the idle sandboxes' worker processes and the threads.
+        """
+        for sandbox in self.idle:
+            sandbox.stop()
+        self.executor.shutdown(wait=False)
+        return
+
+
+def main(argv: Any = None) -> int:
+    """
+    Command line entry point. Runs the server until interrupted.
+    """
+    parser = argparse.ArgumentParser(description='Serve Calculux evaluations on a Unix domain socket.')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='socket path (default: {})'.format(SOCKET_PATH))
+    parser.add_argument('--sessions', type=int, default=SESSIONS,
+                        help='sessions kept before the least recently used is dropped')
+    parser.add_argument('--mode', choices=('rad', 'deg'), default='rad',
+                        help='angle unit new sessions start with')
+    parser.add_argument('--precision', choices=MODES, default=FLOAT,
+                        help='number representation (default: float)')
+    parser.add_argument('--digits', type=int, default=None,
+                        help='significant figures to round results to')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='worker processes, the number of requests evaluated at once (default: {})'.format(WORKERS))
+    parser.add_argument('--timeout', type=float, default=TIMEOUT,
+                        help='cancel evaluations that take longer than this many seconds (default: {})'.format(TIMEOUT))
+    parser.add_argument('--memory-limit', type=int, default=MEMORY_LIMIT >> 20,
+                        help='megabytes of memory each worker may use')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    server = Server(args.socket, args.sessions, precision=args.precision, digits=args.digits, mode=args.mode,
+                    workers=args.workers, timeout=args.timeout, memory_limit=args.memory_limit << 20)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
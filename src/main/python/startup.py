@@ -0,0 +1,101 @@
+# python built-in imports
+import os
+import re
+import sys
+import time
+from typing import List, Tuple
+
+# where preprocessed resources are cached between launches
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.calculux', 'cache')
+
+# set either of these to print the startup timing breakdown
+TIMING_FLAG = '--startup-timing'
+TIMING_ENV = 'CALCULUX_STARTUP_TIMING'
+
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_SPACE = re.compile(r'\s+')
+_PUNCTUATION_SPACE = re.compile(r'\s*([{};:,>])\s*')
+
+
+class PhaseTimer:
+    """
+    Records how long each phase of start up takes. Phases are marked as they
+    end, and each one is timed from the end of the previous one.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases = []
+        return
+
+    def mark(self, phase: str) -> None:
+        """
+        Ends the current phase and records it under the given name.
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+        return
+
+    def breakdown(self) -> List[Tuple[str, float]]:
+        """
+        Returns (phase, seconds) for every phase marked so far.
+        """
+        return list(self.phases)
+
+    def report(self) -> str:
+        """
+        Returns the breakdown as a table, one phase per line, in milliseconds.
+        """
+        width = max([len(phase) for phase, _ in self.phases] + [5])
+        lines = ['{:<{}} {:8.1f} ms'.format(phase, width, seconds * 1000) for phase, seconds in self.phases]
+        lines.append('{:<{}} {:8.1f} ms'.format('total', width, (self.last - self.start) * 1000))
+        return '\n'.join(lines)
+
+
+def timing_enabled() -> bool:
+    """
+    Returns whether the startup timing breakdown was asked for.
+    """
+    return TIMING_FLAG in sys.argv or bool(os.environ.get(TIMING_ENV))
+
+
+def minify_stylesheet(text: str) -> str:
+    """
+    Strips comments and redundant whitespace from a Qt stylesheet.
+    """
+    text = _COMMENT.sub('', text)
+    text = _SPACE.sub(' ', text)
+    return _PUNCTUATION_SPACE.sub(r'\1', text).strip()
+
+
+def load_stylesheet(path: str, cache_dir: str = CACHE_DIR) -> str:
+    """
+    Returns the minified stylesheet at path. The minified text is cached in
+    cache_dir, keyed on the source's modification time and size, so later
+    launches read the preprocessed copy. Failing to write the cache is not
+    an error.
+    """
+    stat = os.stat(path)
+    name = '{}-{}-{}.qss'.format(os.path.splitext(os.path.basename(path))[0], stat.st_mtime_ns, stat.st_size)
+    cached = os.path.join(cache_dir, name)
+    try:
+        with open(cached, 'r') as stylesheet:
+            return stylesheet.read()
+    except OSError:
+        pass
+
+    with open(path, 'r') as stylesheet:
+        text = minify_stylesheet(stylesheet.read())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cached, 'w') as stylesheet:
+            stylesheet.write(text)
+    except OSError:
+        pass
+    return text
+
+
+# the timer for this process, started when this module is first imported
+timer = PhaseTimer()
@@ -0,0 +1,442 @@
+# python built-in imports
+import math
+from typing import Any, Callable, Iterable, List, Sequence
+
+# the aggregate functions, which take any number of values (percentile()
+# takes the percentile last)
+AGGREGATES = frozenset({'sum', 'mean', 'stdev', 'min', 'max', 'median', 'percentile'})
+
+# items each level of a quantile sketch holds before it is compacted.
+# Sketches of fewer values are exact, and over a million values the rank of
+# a quantile is off by less than 0.1% of the count
+SKETCH_SIZE = 1024
+
+
+def real(value: Any) -> Any:
+    """
+    Returns value without its imaginary part, which must be 0 (the
+    calculator's functions return complex numbers such as sqrt(4) = 2+0j).
+    """
+    if isinstance(value, complex):
+        if value.imag != 0:
+            raise TypeError('aggregates need real numbers, not {!r}'.format(value))
+        return value.real
+    return value
+
+
+class Sum:
+    """
+    A compensated (Kahan) sum, in Neumaier's variant which also stays exact
+    when a value is larger than the running total. The rounding error of
+    each addition is collected in compensation and added back at the end.
+    """
+    __slots__ = ('total', 'compensation')
+
+    def __init__(self):
+        self.total = 0
+        self.compensation = 0
+        return
+
+    def add(self, value: Any) -> None:
+        """
+        Adds a value to the sum.
+        """
+        total = self.total + value
+        if abs(self.total) >= abs(value):
+            self.compensation += (self.total - total) + value
+        else:
+            self.compensation += (value - total) + self.total
+        self.total = total
+        return
+
+    def merge(self, other: 'Sum') -> None:
+        """
+        Adds the values summed by other.
+        """
+        self.add(other.total)
+        self.compensation += other.compensation
+        return
+
+    def value(self) -> Any:
+        """
+        Returns the sum.
+        """
+        if not math.isfinite(self.total):
+            return self.total
+        return self.total + self.compensation
+
+
+class Moments:
+    """
+    The count, mean, sum of squared deviations from the mean, minimum and
+    maximum of a stream of values, updated one value at a time with
+    Welford's algorithm and merged with the parallel formula of Chan et al.,
+    neither of which loses precision to cancellation like summing squares
+    does.
+    """
+    __slots__ = ('count', 'mean', 'squares', 'low', 'high')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.squares = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+        return
+
+    def add(self, value: Any) -> None:
+        """
+        Adds a value.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.squares += delta * (value - self.mean)
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+        return
+
+    def merge(self, other: 'Moments') -> None:
+        """
+        Adds the values counted by other.
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.squares += other.squares + delta * delta * self.count * other.count / count
+        self.count = count
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+        return
+
+    def variance(self) -> float:
+        """
+        Returns the sample variance.
+        """
+        if self.count < 2:
+            raise ValueError('stdev() needs at least two values')
+        return self.squares / (self.count - 1)
+
+
+class Quantiles:
+    """
+    Approximate quantiles of a stream of values in bounded memory, kept in
+    a KLL-style sketch: each item on level h stands for 2^h values. When a
+    level holds size items they are sorted and every other one (the odd and
+    the even ones in turn) moves up a level, so each level halves what the
+    one below it passes up. Sketches merge level by level. The sketch holds
+    fewer than size items per level, on log2(count/size) levels.
+    """
+    __slots__ = ('size', 'levels', 'count', 'odd')
+
+    def __init__(self, size: int = SKETCH_SIZE):
+        if size < 2:
+            raise ValueError('size must be at least 2')
+        self.size = size
+        self.levels = [[]]
+        self.count = 0
+        self.odd = False
+        return
+
+    def add(self, value: Any) -> None:
+        """
+        Adds a value.
+        """
+        self.levels[0].append(value)
+        self.count += 1
+        if len(self.levels[0]) >= self.size:
+            self.compact()
+        return
+
+    def merge(self, other: 'Quantiles') -> None:
+        """
+        Adds the values sketched by other.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in zip(self.levels, other.levels):
+            level.extend(items)
+        self.count += other.count
+        self.compact()
+        return
+
+    def compact(self) -> None:
+        """
+        Moves every other item of each full level up a level. An odd item out
+        (the largest) stays where it is.
+        """
+        for h, level in enumerate(self.levels):
+            if len(level) < self.size:
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append([])
+            level.sort()
+            kept = [level.pop()] if len(level) % 2 else []
+            # alternating between the odd and the even items keeps the
+            # errors from always rounding ranks the same way
+            self.odd = not self.odd
+            self.levels[h+1].extend(level[self.odd::2])
+            self.levels[h] = kept
+        return
+
+    def quantile(self, q: float) -> Any:
+        """
+        Returns the q quantile (0 <= q <= 1), interpolating between the two
+        nearest ranks as numpy.percentile does by default. Exact if no level
+        has been compacted.
+        """
+        if self.count == 0:
+            raise ValueError('no values')
+        items = sorted((value, 1 << h) for h, level in enumerate(self.levels) for value in level)
+        position = q * (self.count - 1)
+        below = math.floor(position)
+        fraction = position - below
+        low = high = None
+        rank = 0
+        for value, weight in items:
+            rank += weight
+            if low is None and rank > below:
+                low = value
+            if rank > below + 1 or fraction == 0 and low is not None:
+                high = value
+                break
+        if high is None:
+            high = low
+        if fraction == 0:
+            return low
+        return low + (high - low) * fraction
+
+
+class Summary:
+    """
+    Everything the aggregate functions need from a stream of values, found
+    in a single pass: a compensated sum, the moments and a quantile sketch.
+    Summaries of parts of a stream can be merged, e.g. ones computed in
+    parallel.
+    """
+    __slots__ = ('total', 'moments', 'quantiles')
+
+    def __init__(self, size: int = SKETCH_SIZE):
+        self.total = Sum()
+        self.moments = Moments()
+        self.quantiles = Quantiles(size)
+        return
+
+    def __len__(self) -> int:
+        return self.moments.count
+
+    def add(self, value: Any) -> None:
+        """
+        Adds a real value.
+        """
+        value = real(value)
+        self.total.add(value)
+        self.moments.add(value)
+        self.quantiles.add(value)
+        return
+
+    def merge(self, other: 'Summary') -> 'Summary':
+        """
+        Adds the values summarized by other and returns this summary.
+        """
+        self.total.merge(other.total)
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+        return self
+
+    def check(self, func: str) -> None:
+        """
+        Raises ValueError if there are no values to aggregate.
+        """
+        if self.moments.count == 0:
+            raise ValueError('{}() of no values'.format(func))
+        return
+
+    def sum(self) -> Any:
+        return self.total.value()
+
+    def mean(self) -> float:
+        self.check('mean')
+        return self.moments.mean
+
+    def stdev(self) -> float:
+        return math.sqrt(self.moments.variance())
+
+    def min(self) -> Any:
+        self.check('min')
+        return self.moments.low
+
+    def max(self) -> Any:
+        self.check('max')
+        return self.moments.high
+
+    def median(self) -> Any:
+        self.check('median')
+        return self.quantiles.quantile(0.5)
+
+    def percentile(self, p: Any) -> Any:
+        self.check('percentile')
+        return self.quantiles.quantile(fraction(p))
+
+
+def summarize_lines(lines: Iterable[str], first_line: int = 1) -> Summary:
+    """
+    Returns the summary of the numbers in lines, one per line. Blank lines
+    are skipped. Raises ValueError for a line that isn't a number.
+    """
+    summary = Summary()
+    for number, line in enumerate(lines, first_line):
+        text = line.strip()
+        if not text:
+            continue
+        try:
+            value = float(text)
+        except ValueError:
+            raise ValueError('line {}: {!r} is not a number'.format(number, text))
+        summary.add(value)
+    return summary
+
+
+class Stream:
+    """
+    A stream of numbers, such as a column read from a file or stdin, that
+    the aggregate functions accept as a value. The lines are read by reader
+    (summarize_lines unless given) the first time an aggregate needs them,
+    so every aggregate of the stream in an expression shares that single
+    pass and the numbers are never held in memory.
+    """
+    __slots__ = ('lines', 'reader', 'summary')
+
+    def __init__(self, lines: Iterable[str], reader: Callable[[Iterable[str]], Summary] = None):
+        self.lines = lines
+        self.reader = reader or summarize_lines
+        self.summary = None
+        return
+
+    def summarize(self) -> Summary:
+        """
+        Returns the summary of the stream, reading it the first time.
+        """
+        if self.summary is None:
+            self.summary = self.reader(self.lines)
+            self.lines = None
+        return self.summary
+
+    def __repr__(self) -> str:
+        return '<stream>'
+
+
+def summarize(values: Sequence[Any]) -> Summary:
+    """
+    Returns the summary of values, where a Stream stands for all of its
+    numbers.
+    """
+    if len(values) == 1 and isinstance(values[0], Stream):
+        return values[0].summarize()
+    summary = Summary()
+    for value in values:
+        if isinstance(value, Stream):
+            summary.merge(value.summarize())
+        else:
+            summary.add(value)
+    return summary
+
+
+def fraction(p: Any) -> Any:
+    """
+    Converts a percentile (0 to 100) to a quantile (0 to 1).
+    """
+    p = real(p)
+    if not 0 <= p <= 100:
+        raise ValueError('percentile must be from 0 to 100, not {!r}'.format(p))
+    return p / 100
+
+
+def total(*values: Any) -> Any:
+    """
+    Returns the sum of the values.
+    """
+    return summarize(values).sum()
+
+
+def mean(*values: Any) -> float:
+    """
+    Returns the mean of the values.
+    """
+    return summarize(values).mean()
+
+
+def stdev(*values: Any) -> float:
+    """
+    Returns the sample standard deviation of the values.
+    """
+    return summarize(values).stdev()
+
+
+def minimum(*values: Any) -> Any:
+    """
+    Returns the smallest of the values.
+    """
+    return summarize(values).min()
+
+
+def maximum(*values: Any) -> Any:
+    """
+    Returns the largest of the values.
+    """
+    return summarize(values).max()
+
+
+def median(*values: Any) -> Any:
+    """
+    Returns the median of the values (approximate for long streams).
+    """
+    return summarize(values).median()
+
+
+def percentile(*args: Any) -> Any:
+    """
+    Returns the pth percentile of the values, where p is the last argument
+    (approximate for long streams).
+    """
+    *values, p = args
+    return summarize(values).percentile(p)
+
+
+def variance(values: List[Any]) -> Any:
+    """
+    Returns the exact sample variance of Fraction or Decimal values (in the
+    current decimal context), for the precise modes.
+    """
+    if len(values) < 2:
+        raise ValueError('stdev() needs at least two values')
+    average = sum(values[1:], values[0]) / len(values)
+    return sum((value - average) ** 2 for value in values) / (len(values) - 1)
+
+
+def exact(func: str, args: List[Any]) -> Any:
+    """
+    Returns one of the AGGREGATES other than stdev (see variance) of
+    Fraction or Decimal values, computed exactly (in the current decimal
+    context), for the precise modes.
+    """
+    values = args[:-1] if func == 'percentile' else args
+    if not values:
+        raise ValueError('{}() of no values'.format(func))
+    if func == 'sum':
+        return sum(values[1:], values[0])
+    if func == 'mean':
+        return sum(values[1:], values[0]) / len(values)
+    if func == 'min':
+        return min(values)
+    if func == 'max':
+        return max(values)
+    q = fraction(args[-1]) if func == 'percentile' else type(values[0])(1) / 2
+    ordered = sorted(values)
+    position = q * (len(ordered) - 1)
+    below = math.floor(position)
+    if below == position:
+        return ordered[below]
+    return ordered[below] + (ordered[below+1] - ordered[below]) * (position - below)
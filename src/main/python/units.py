@@ -0,0 +1,329 @@
+# python built-in imports
+from fractions import Fraction
+import json
+import os
+import re
+from typing import Any, List, NamedTuple, Sequence, Tuple
+
+# calculux imports
+from cache import LRUCache
+from errors import ParseError
+from nodes import BinOp, Number
+
+# the keyword between the quantity and the unit it is converted to, as in
+# 3.2 km/h to m/s
+CONVERT = 'to'
+
+# the unit tables, which are read the first time a conversion is parsed.
+# Set the environment variable to read them from somewhere else (the
+# calculator sets it to the frozen app's resource, so worker processes
+# inherit it)
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'resources', 'base', 'units.json')
+DATA_ENV = 'CALCULUX_UNITS'
+
+# number of (source, target) conversion factors kept
+CACHE_SIZE = 256
+
+# a dimension is packed into one integer with a signed 8 bit exponent per
+# base unit: the exponent of base unit i is the ith digit in balanced base
+# 256. Multiplying units adds their dimensions, and raising to a power
+# multiplies, so no vectors are built while parsing
+_FIELD = 1 << 8
+
+_TOKEN = re.compile(r'\s*(?:(?P<number>\d+)|(?P<word>[A-Za-z_][A-Za-z_0-9]*)|(?P<op>[-*/^()]))')
+
+
+class UnitError(ParseError):
+    """
+    Raised for an unknown unit or a conversion between units that measure
+    different things.
+    """
+
+
+class Unit(NamedTuple):
+    """
+    A unit as a multiple of the base units: a value v in this unit is
+    (v + offset) * factor in base units. Only temperatures have an offset.
+    """
+    factor: Fraction
+    dimension: int
+    offset: Fraction = Fraction(0)
+
+
+def exponents(dimension: int, count: int) -> List[int]:
+    """
+    Unpacks the exponents of the first count base units from a dimension.
+    """
+    result = []
+    for _ in range(count):
+        digit = dimension % _FIELD
+        if digit >= _FIELD // 2:
+            digit -= _FIELD
+        result.append(digit)
+        dimension = (dimension - digit) // _FIELD
+    return result
+
+
+def _tokenize(text: str) -> List[Tuple[str, str, int]]:
+    """
+    Splits a unit expression from the unit tables into tokens, like
+    expression.tokenize.
+    """
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise ValueError('unexpected character {!r} in unit {!r}'.format(text[pos], text))
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind), match.start(kind)))
+        pos = match.end()
+    return tokens
+
+
+class UnitTable:
+    """
+    The units that can be converted between. Every named unit is resolved
+    to a factor and dimension relative to the base units when the table is
+    built, by following its definition through the units it is defined in
+    (e.g. mi -> yd -> ft -> in -> m). Any conversion is then a ratio of two
+    factors, and the factor for each (source, target) pair is cached, so
+    converting a value is one multiplication.
+
+    Units are written as in physics: products with '*' or a space, quotients
+    with '/', and integer powers with '^' (e.g. 'kg m/s^2'). Named units can
+    take the prefixes listed for them (e.g. km, MiB).
+    """
+
+    def __init__(self, data: dict, cache_size: int = CACHE_SIZE):
+        self.base = data['base']
+        self.prefixes = {
+            kind: {prefix: Fraction(factor) for prefix, factor in prefixes.items()}
+            for kind, prefixes in data['prefixes'].items()
+        }
+        self.definitions = data['units']
+        self.allowed = {name: definition.get('prefixes', ()) for name, definition in self.definitions.items()}
+        self.units = {}  # name -> Unit, including prefixed names once used
+        for name in self.definitions:
+            self.resolve(name, ())
+        self.conversions = LRUCache(cache_size)
+        return
+
+    @classmethod
+    def load(cls, path: str) -> 'UnitTable':
+        """
+        Reads the tables from a JSON file.
+        """
+        with open(path, 'r') as data:
+            return cls(json.load(data))
+
+    def resolve(self, name: str, chain: Tuple[str, ...]) -> Unit:
+        """
+        Returns a named unit in base units, resolving the units it is defined
+        in first. chain is the names being resolved, to catch circular
+        definitions.
+        """
+        if name in self.units:
+            return self.units[name]
+        if name in chain:
+            raise ValueError('unit {!r} is defined in terms of itself'.format(name))
+        definition = self.definitions[name]
+        if 'unit' not in definition:
+            if name not in self.base:
+                raise ValueError('unit {!r} has no definition'.format(name))
+            unit = Unit(Fraction(1), _FIELD ** self.base.index(name))
+        else:
+            chain = chain + (name,)
+            defined = self.product(_tokenize(definition['unit']), lambda word: self.resolve(word, chain))
+            factor = Fraction(definition['factor']) * defined.factor
+            unit = Unit(factor, defined.dimension, Fraction(definition.get('offset', 0)))
+        self.units[name] = unit
+        return unit
+
+    def lookup(self, word: str) -> Unit:
+        """
+        Returns the unit a word names, which may be a named unit with a
+        prefix. Raises UnitError if it isn't a unit.
+        """
+        unit = self.units.get(word)
+        if unit is not None:
+            return unit
+        for kind, prefixes in self.prefixes.items():
+            for prefix, factor in prefixes.items():
+                name = word[len(prefix):]
+                if word.startswith(prefix) and kind in self.allowed.get(name, ()):
+                    named = self.units[name]
+                    unit = Unit(factor * named.factor, named.dimension)
+                    self.units[word] = unit
+                    return unit
+        raise UnitError('unknown unit {!r}'.format(word))
+
+    def is_unit(self, word: str) -> bool:
+        """
+        Returns whether a word names a unit.
+        """
+        try:
+            self.lookup(word)
+        except UnitError:
+            return False
+        return True
+
+    def parse(self, tokens: Sequence[Tuple[str, str, int]]) -> Unit:
+        """
+        Returns the unit a sequence of expression tokens describes. A single
+        named unit keeps its offset, so temperatures convert as
+        temperatures; in a product they convert as temperature differences.
+        """
+        if len(tokens) == 1 and tokens[0][0] == 'word':
+            return self.lookup(tokens[0][1])
+        return self.product(tokens, self.lookup)
+
+    def product(self, tokens: Sequence[Tuple[str, str, int]], lookup: Any) -> Unit:
+        """
+        Parses a product of units, looking up each named unit with lookup:
+
+            product := factor (('*' | '/')? factor)*
+            factor  := (word | '(' product ')') ('^' '-'? number)?
+        """
+        unit, pos = self.factors(tokens, 0, lookup)
+        if pos < len(tokens):
+            raise UnitError('unexpected {!r} in unit'.format(tokens[pos][1]))
+        return unit
+
+    def factors(self, tokens: Sequence[Tuple[str, str, int]], pos: int, lookup: Any) -> Tuple[Unit, int]:
+        """
+        Parses factors from tokens[pos] up to a ')' or the end, and returns
+        their product with the position after them.
+        """
+        factor, dimension = Fraction(1), 0
+        first = True
+        while pos < len(tokens) and tokens[pos][1] != ')':
+            sign = 1
+            if tokens[pos][1] in '*/' and not first:
+                sign = -1 if tokens[pos][1] == '/' else 1
+                pos += 1
+            if pos >= len(tokens):
+                raise UnitError('expected a unit')
+            kind, text, _ = tokens[pos]
+            if kind == 'word':
+                unit = lookup(text)
+                pos += 1
+            elif text == '(':
+                unit, pos = self.factors(tokens, pos + 1, lookup)
+                if pos >= len(tokens):
+                    raise UnitError("expected ')' in unit")
+                pos += 1
+            else:
+                raise UnitError('unexpected {!r} in unit'.format(text))
+            power, pos = self.exponent(tokens, pos)
+            factor *= unit.factor ** (sign * power)
+            dimension += unit.dimension * sign * power
+            first = False
+        if first:
+            raise UnitError('expected a unit')
+        return Unit(factor, dimension), pos
+
+    def exponent(self, tokens: Sequence[Tuple[str, str, int]], pos: int) -> Tuple[int, int]:
+        """
+        Parses an optional '^' and integer power, returning the power (1 if
+        there is none) and the position after it.
+        """
+        if pos >= len(tokens) or tokens[pos][1] != '^':
+            return 1, pos
+        sign = 1
+        pos += 1
+        if pos < len(tokens) and tokens[pos][1] == '-':
+            sign = -1
+            pos += 1
+        if pos >= len(tokens) or tokens[pos][0] != 'number':
+            raise UnitError('units can only be raised to integer powers')
+        return sign * int(tokens[pos][1]), pos + 1
+
+    def describe(self, dimension: int) -> str:
+        """
+        Returns a dimension in base units, e.g. 'm s^-1'.
+        """
+        parts = []
+        for name, power in zip(self.base, exponents(dimension, len(self.base))):
+            if power == 1:
+                parts.append(name)
+            elif power != 0:
+                parts.append('{}^{}'.format(name, power))
+        return ' '.join(parts) or '1'
+
+    def conversion(self, source: Sequence[Tuple[str, str, int]],
+                   target: Sequence[Tuple[str, str, int]]) -> Tuple[Fraction, Fraction]:
+        """
+        Returns (scale, shift) such that a value in the source unit is
+        value * scale + shift in the target unit. Raises UnitError if the
+        units measure different things.
+        """
+        key = (' '.join(token[1] for token in source), ' '.join(token[1] for token in target))
+        return self.conversions.get_or_create(key, lambda: self.compute_conversion(source, target))
+
+    def compute_conversion(self, source: Sequence[Tuple[str, str, int]],
+                           target: Sequence[Tuple[str, str, int]]) -> Tuple[Fraction, Fraction]:
+        """
+        Computes the (scale, shift) for conversion() on a cache miss.
+        """
+        if not target:
+            raise UnitError('expected a unit after {!r}'.format(CONVERT))
+        start, end = self.parse(source), self.parse(target)
+        if start.dimension != end.dimension:
+            raise UnitError("can't convert {} ({}) to {} ({})".format(
+                ' '.join(token[1] for token in source), self.describe(start.dimension),
+                ' '.join(token[1] for token in target), self.describe(end.dimension)))
+        scale = start.factor / end.factor
+        return scale, start.offset * scale - end.offset
+
+
+_table = None
+
+
+def table() -> UnitTable:
+    """
+    Returns the unit tables, reading them on first use.
+    """
+    global _table
+    if _table is None:
+        _table = UnitTable.load(os.environ.get(DATA_ENV, DATA_PATH))
+    return _table
+
+
+def _constant(value: Fraction) -> Any:
+    """
+    Returns an exact tree for a fraction: an integer, or an integer
+    division that the optimizer folds in float mode and the precise modes
+    keep exact.
+    """
+    if value.denominator == 1:
+        return Number(value.numerator)
+    return BinOp('/', Number(value.numerator), Number(value.denominator))
+
+
+def find_unit(tokens: Sequence[Tuple[str, str, int]], names: Any) -> int:
+    """
+    Returns the index of the first token of the unit the value in tokens is
+    written in: the first word that names a unit and isn't one of names or
+    a function call (so min is a unit in 5 min to s and a function in
+    min(5, 3) h to s). Raises UnitError if there is none.
+    """
+    for i, (kind, text, _) in enumerate(tokens):
+        called = i + 1 < len(tokens) and tokens[i+1][1] == '('
+        if kind == 'word' and text not in names and not called and table().is_unit(text):
+            return i
+    raise UnitError('expected a unit before {!r}'.format(CONVERT))
+
+
+def convert(value: Any, source: Sequence[Tuple[str, str, int]], target: Sequence[Tuple[str, str, int]]) -> Any:
+    """
+    Returns the tree for converting the value tree from the source unit to
+    the target unit, both given as expression tokens.
+    """
+    scale, shift = table().conversion(source, target)
+    if scale != 1:
+        value = BinOp('*', value, _constant(scale))
+    if shift != 0:
+        value = BinOp('+', value, _constant(shift))
+    return value
@@ -0,0 +1,289 @@
+# python built-in imports
+import math
+import operator
+from typing import Any, Iterable, Tuple
+
+# third party imports
+import numpy as np
+
+# calculux imports
+from calculus import ANGLE, integrate
+from evaluator import PLACES, Evaluator, use_radians
+from expression import INTEGRATE, POWER, Expression
+import functions
+from stats import fraction
+
+
+# factor between degrees and radians
+_DEG = np.pi / 180
+
+
+def _real(x: Any) -> Any:
+    """
+    Returns the real part of x, which must not have an imaginary part.
+    """
+    if np.iscomplexobj(x):
+        if np.any(np.imag(x) != 0):
+            raise TypeError('operation is not defined for complex numbers')
+        return np.real(x)
+    return x
+
+
+def ln(x: Any) -> Any:
+    """
+    Returns the natural logarithm of every element of x.
+    """
+    return np.emath.log(x)
+
+
+def log(x: Any, base: Any = None) -> Any:
+    """
+    Returns the logarithm of every element of x, in base e unless a base is
+    given (same argument order as cmath.log).
+    """
+    if base is None:
+        return np.emath.log(x)
+    return np.emath.log(x) / np.emath.log(base)
+
+
+def x_rt(x: Any, expr: Any) -> Any:
+    """
+    Returns the xth root of every element of expr.
+    """
+    return expr ** (1.0/x)
+
+
+def mod(expr: Any, x: Any) -> Any:
+    """
+    Returns the modulo of every element of expr by x.
+    """
+    return np.mod(_real(expr), _real(x))
+
+
+def _gamma_element(x: float) -> float:
+    """
+    Returns math.gamma(x), or nan at its poles (0 and the negative integers)
+    and inf where it overflows, so one element doesn't fail the array.
+    """
+    try:
+        return math.gamma(x)
+    except ValueError:
+        return math.nan
+    except OverflowError:
+        return math.inf
+
+
+# gamma applied element by element, factorial(n) == gamma(n+1)
+_gamma = np.vectorize(_gamma_element, otypes=[float])
+
+
+def factorial(x: Any) -> Any:
+    """
+    Returns the factorial of every element of x as a float, so results past
+    170! are inf rather than exact integers, and those of negative integers
+    are nan.
+    """
+    return _gamma(_real(x) + 1)
+
+
+def _integers(x: Any) -> Any:
+    """
+    Returns x as an integer array for the bitwise operators, which only take
+    whole numbers.
+    """
+    x = _real(x)
+    if np.any(x != np.round(x)):
+        raise TypeError('bitwise operators need integers')
+    return np.asarray(x).astype(np.int64)
+
+
+def integral(batch: Any, low: Any, high: Any) -> Any:
+    """
+    Returns the integral from low to high of the function batch evaluates,
+    for every element at once. The integrand may depend on the array
+    variable but the limits may not.
+    """
+    if np.ndim(low) or np.ndim(high):
+        raise ValueError('limits of integration must not depend on the variable')
+    return integrate(batch, low, high)
+
+
+def _stack(func: str, values: Tuple[Any, ...]) -> np.ndarray:
+    """
+    Returns the values broadcast to one shape and stacked along a new first
+    axis, so the aggregates work element by element over their arguments
+    (mean(x, 1) is the mean of each element and 1). Raises ValueError if
+    there are no values.
+    """
+    if not values:
+        raise ValueError('{}() of no values'.format(func))
+    return np.stack(np.broadcast_arrays(*(_real(np.asarray(value)) for value in values)))
+
+
+def total(*values: Any) -> Any:
+    """
+    Returns the sum of the values, element by element.
+    """
+    if not values:
+        return 0
+    return np.sum(_stack('sum', values), axis=0)
+
+
+def mean(*values: Any) -> Any:
+    """
+    Returns the mean of the values, element by element.
+    """
+    return np.mean(_stack('mean', values), axis=0)
+
+
+def stdev(*values: Any) -> Any:
+    """
+    Returns the sample standard deviation of the values, element by element.
+    """
+    if len(values) < 2:
+        raise ValueError('stdev() needs at least two values')
+    return np.std(_stack('stdev', values), axis=0, ddof=1)
+
+
+def minimum(*values: Any) -> Any:
+    """
+    Returns the smallest of the values, element by element.
+    """
+    return np.min(_stack('min', values), axis=0)
+
+
+def maximum(*values: Any) -> Any:
+    """
+    Returns the largest of the values, element by element.
+    """
+    return np.max(_stack('max', values), axis=0)
+
+
+def median(*values: Any) -> Any:
+    """
+    Returns the median of the values, element by element.
+    """
+    return np.median(_stack('median', values), axis=0)
+
+
+def percentile(*args: Any) -> Any:
+    """
+    Returns the pth percentile of the values, element by element, where p is
+    the last argument and may not depend on the array variable.
+    """
+    *values, p = args
+    if np.ndim(p):
+        raise ValueError('the percentile must not depend on the variable')
+    return np.quantile(_stack('percentile', values), fraction(p), axis=0)
+
+
+# functions and constants that do not depend on the rad/deg setting
+COMMON = {
+    'ln': ln, 'log': log, 'log10': np.emath.log10,
+    'sqrt': np.emath.sqrt, 'abs': np.abs,
+    'fact': factorial, 'mod': mod, 'x_rt': x_rt,
+    'radians': lambda x: x * _DEG, 'degrees': lambda x: x / _DEG,
+    'pi': np.pi, 'e': np.e, 'j': 1j,
+    'bit_and': lambda x, y: np.bitwise_and(_integers(x), _integers(y)),
+    'bit_or': lambda x, y: np.bitwise_or(_integers(x), _integers(y)),
+    'bit_xor': lambda x, y: np.bitwise_xor(_integers(x), _integers(y)),
+    'bit_not': lambda x: np.invert(_integers(x)),
+    'shift_left': lambda x, y: np.left_shift(_integers(x), _integers(y)),
+    'shift_right': lambda x, y: np.right_shift(_integers(x), _integers(y)),
+    'sum': total, 'mean': mean, 'stdev': stdev, 'min': minimum, 'max': maximum,
+    'median': median, 'percentile': percentile,
+    POWER: operator.pow,  # arrays are as large as their inputs, so no guard
+    INTEGRATE: integral
+}
+
+RADIANS = {
+    'sin': np.sin, 'asin': np.emath.arcsin,
+    'cos': np.cos, 'acos': np.emath.arccos,
+    'tan': np.tan, 'atan': np.arctan,
+    ANGLE: 1.0
+}
+
+DEGREES = {
+    'sin': lambda x: np.sin(x * _DEG), 'asin': lambda x: np.emath.arcsin(x) / _DEG,
+    'cos': lambda x: np.cos(x * _DEG), 'acos': lambda x: np.emath.arccos(x) / _DEG,
+    'tan': lambda x: np.tan(x * _DEG), 'atan': lambda x: np.arctan(x) / _DEG,
+    ANGLE: _DEG
+}
+
+
+def namespace(use_radians: bool = True, bindings: dict = None) -> dict:
+    """
+    Returns a copy of bindings, an evaluator's (see Evaluator.bindings) or
+    functions.namespace(use_radians) if not given, with every calculator
+    function that has one bound to a NumPy ufunc (or an element-wise
+    equivalent), for evaluating compiled expressions over whole arrays. The
+    others, such as PRV[n], the date functions and the worksheet's, stay
+    the calculator's own, so they work as long as the array isn't passed to
+    them.
+    """
+    namespace = dict(functions.namespace(use_radians) if bindings is None else bindings)
+    namespace.update(COMMON)
+    namespace.update(RADIANS if use_radians else DEGREES)
+    return namespace
+
+
+def round_array(result: np.ndarray) -> np.ndarray:
+    """
+    Rounds every element to PLACES decimal places, returning a real array if
+    no element has an imaginary part (the same rules as round_result).
+    """
+    if np.iscomplexobj(result):
+        if np.all(result.imag == 0):
+            return np.round(result.real, PLACES)
+    return np.round(result, PLACES)
+
+
+def evaluate_compiled(compiled: Expression, bindings: dict, values: Iterable, variable: str) -> np.ndarray:
+    """
+    Evaluates a compiled expression once over every element of values, which
+    are bound to variable in bindings (see namespace), and returns the
+    unrounded results. Elements where the result is undefined (e.g.
+    division by zero) are inf or nan instead of raising.
+
+    The expression is first evaluated with real arithmetic. If that produces
+    an invalid value (e.g. a fractional power of a negative number), it is
+    evaluated again with complex arithmetic, matching the scalar evaluator
+    which works with cmath throughout.
+    """
+    values = np.asarray(values)
+    if not np.iscomplexobj(values):
+        bindings[variable] = values.astype(float)
+        try:
+            with np.errstate(divide='ignore', over='ignore', invalid='raise'):
+                result = compiled(bindings)
+        except (FloatingPointError, TypeError):
+            # retry below with complex arithmetic
+            pass
+        else:
+            return np.broadcast_to(result, values.shape)
+
+    bindings[variable] = values.astype(complex)
+    with np.errstate(all='ignore'):
+        result = compiled(bindings)
+    return np.broadcast_to(result, values.shape)
+
+
+# evaluators for evaluate_array(), keyed on use_radians, so repeated calls
+# reuse compiled expressions
+_evaluators = {}
+
+
+def evaluate_array(expression: str, values: Iterable, variable: str = 'x', mode: str = 'rad',
+                   previous_result: Any = 0, memory: Any = 0) -> np.ndarray:
+    """
+    Evaluates the expression once over every element of values, which are
+    bound to the free variable, and rounds the results as evaluate() does
+    (see evaluate_compiled). PRV is previous_result and M is memory, and
+    there are no other previous results for PRV[n].
+    """
+    radians = use_radians(mode)
+    if radians not in _evaluators:
+        _evaluators[radians] = Evaluator(radians)
+    evaluator = _evaluators[radians]
+    evaluator.previous_result, evaluator.memory = previous_result, memory
+    return round_array(evaluator.evaluate_array(expression, values, variable))
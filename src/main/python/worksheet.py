@@ -0,0 +1,397 @@
+# python built-in imports
+from collections import deque
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# calculux imports
+from cache import LRUCache
+from calculus import ANGLE
+from dates import IN
+from errors import CalculuxError, ParseError
+from expression import (CONSTANTS, EXPONENT, FUNCTIONS, INTEGRATE, POINTS, POWER, RECALL, XOR, Expression,
+                        compile_function, normalize, parse)
+import functions
+from nodes import BinOp, Call, Integral, Name, UnaryOp
+from optimizer import simplify
+from units import CONVERT
+
+# a definition: a name, the parameters of a function in brackets, '=' and
+# the formula (a = 3.2, f(x) = x^2 + sin(x)). Nothing after the '=' removes
+# the definition
+DEFINITION = re.compile(r'\s*([A-Za-z_][A-Za-z_0-9]*)\s*(?:\(([^()]*)\))?\s*=(.*)', re.DOTALL)
+_NAME = re.compile(r'[A-Za-z_][A-Za-z_0-9]*')
+
+# names that can't be defined: the calculator's own names and keywords, the
+# internal functions compiled expressions call, and the names Python's
+# compiler refuses (names starting with '_' are refused as well)
+RESERVED = (FUNCTIONS | CONSTANTS | frozenset(functions.namespace(True)) | frozenset(functions.namespace(False)) |
+            {EXPONENT, XOR, CONVERT, IN, RECALL, POWER, INTEGRATE, POINTS, ANGLE, 'None', 'True', 'False'})
+
+# results kept by each worksheet function for repeated arguments
+FUNCTION_CACHE_SIZE = 1024
+
+# names whose value can change without the worksheet changing (the previous
+# results, memory, and the calendar setting workdays() and workday() read),
+# so functions that use them, directly or through other functions, aren't
+# memoized
+VOLATILE = frozenset({'PRV', 'M', RECALL, 'workdays', 'workday'})
+
+
+class DefinitionError(CalculuxError, ValueError):
+    """
+    Raised for a definition that can't be made: one that uses its own name
+    (directly or through other definitions), defines a reserved name, or
+    removes or turns into a function a variable other definitions use.
+    """
+
+
+def parse_definition(text: str) -> Optional[Tuple[str, Optional[Tuple[str, ...]], str]]:
+    """
+    Splits a definition into its name, parameters (None for a variable) and
+    formula, or returns None if text isn't a definition.
+    """
+    match = DEFINITION.fullmatch(text)
+    if match is None:
+        return None
+    name, params, formula = match.groups()
+    if params is not None:
+        params = tuple(param.strip() for param in params.split(','))
+        for param in params:
+            if _NAME.fullmatch(param) is None:
+                raise ParseError('expected a parameter name but found {!r}'.format(param))
+            if param in RESERVED or param.startswith('_'):
+                raise ParseError('{!r} can not be used as a parameter'.format(param))
+        if len(set(params)) < len(params):
+            raise ParseError('{}() has the same parameter twice'.format(name))
+    return name, params, formula.strip()
+
+
+def references(node: Any) -> Set[str]:
+    """
+    Returns the names a tree uses: the free variables and called functions.
+    """
+    if isinstance(node, Name):
+        return {node.id}
+    if isinstance(node, UnaryOp):
+        return references(node.operand)
+    if isinstance(node, BinOp):
+        return references(node.left) | references(node.right)
+    if isinstance(node, Call):
+        return {node.func}.union(*(references(arg) for arg in node.args))
+    if isinstance(node, Integral):
+        return (references(node.body) - {node.var}) | references(node.low) | references(node.high)
+    return set()
+
+
+class UserFunction:
+    """
+    A function defined on the worksheet. Its formula is compiled once into a
+    Python function whose globals are the worksheet's namespace, so the
+    variables and functions it uses are looked up when it is called.
+    Results are memoized on the arguments in a bounded LRU cache, unless
+    memoize is false. The worksheet makes a new UserFunction (with an empty
+    cache) whenever something the function uses changes, and doesn't
+    memoize functions that use VOLATILE names, so cached results are never
+    stale.
+    """
+    __slots__ = ('name', 'params', 'function', 'results')
+
+    def __init__(self, name: str, params: Tuple[str, ...], code: Any, namespace: dict,
+                 cache_size: int = FUNCTION_CACHE_SIZE, memoize: bool = True):
+        self.name = name
+        self.params = params
+        self.function = eval(code, namespace)
+        self.results = LRUCache(cache_size) if memoize else None
+        return
+
+    def __call__(self, *args: Any) -> Any:
+        if len(args) != len(self.params):
+            raise TypeError('{}() takes {} arguments'.format(self.name, len(self.params)))
+        if self.results is None:
+            return self.function(*args)
+        # 2 and 2.0 are equal keys, but not always equal results (2^2 is 4
+        # and 2.0^2 is 4.0)
+        key = args + tuple(type(arg) for arg in args)
+        return self.results.get_or_create(key, lambda: self.function(*args))
+
+    def __repr__(self) -> str:
+        return '{}({})'.format(self.name, ', '.join(self.params))
+
+
+class Cell:
+    """
+    A variable or function of the worksheet: its formula, parsed and
+    compiled, and the names of the other definitions it uses.
+    """
+    __slots__ = ('name', 'params', 'formula', 'tree', 'uses', 'code')
+
+    def __init__(self, name: str, params: Optional[Tuple[str, ...]], formula: str, tree: Any, uses: Set[str]):
+        self.name = name
+        self.params = params  # None for a variable
+        self.formula = formula
+        self.tree = tree
+        self.uses = frozenset(uses)
+        if params is None:
+            self.code = Expression(formula, tree)
+        else:
+            self.code = compile_function(tree, params)
+        return
+
+    def text(self) -> str:
+        """
+        Returns the definition as it would be typed.
+        """
+        if self.params is None:
+            return '{} = {}'.format(self.name, self.formula)
+        return '{}({}) = {}'.format(self.name, ', '.join(self.params), self.formula)
+
+
+class Worksheet:
+    """
+    Named variables and functions (a = 3.2, f(x) = x^2 + sin(x)) that can
+    use each other, kept as a dependency graph like the cells of a
+    spreadsheet. When a definition changes, only the definitions that use it
+    (directly or indirectly) are computed again, in topological order, and
+    every other value stays as it was. Cycles are refused when a definition
+    is made, so the order always exists.
+
+    The values and functions are bound in a namespace of the calculator
+    functions, which the evaluator attaches the worksheet to (one for
+    radians and one for degrees, so everything is computed again when the
+    setting changes). A change either succeeds with every value updated or
+    raises the first error with nothing changed. A value that fails when
+    everything is computed again (after attaching) is left unbound, and so
+    is everything that uses it, so using it raises NameError until it is
+    defined again.
+    """
+
+    def __init__(self, cache_size: int = FUNCTION_CACHE_SIZE):
+        self.cells = {}  # name -> Cell, in the order they were defined
+        self.dependents = {}  # name -> names of the definitions that use it
+        self.values = {}  # name -> value of a variable or UserFunction
+        self.cache_size = cache_size
+        self.namespace = None
+        self.variables = frozenset()
+        self.functions = frozenset()
+        self.version = 0  # counts changes, so copies can be told apart
+        return
+
+    def __getstate__(self) -> dict:
+        """
+        Keeps only the definitions when pickling, since compiled code can't
+        be pickled. Everything is compiled and computed again when the copy
+        is attached.
+        """
+        definitions = [(cell.name, cell.params, cell.formula, cell.tree, cell.uses) for cell in self.cells.values()]
+        return {'definitions': definitions, 'cache_size': self.cache_size, 'version': self.version}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['cache_size'])
+        for definition in state['definitions']:
+            self.add(Cell(*definition))
+        self.version = state['version']
+        return
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.cells
+
+    def definitions(self) -> List[str]:
+        """
+        Returns every definition as it would be typed, in the order they
+        were made.
+        """
+        return [cell.text() for cell in self.cells.values()]
+
+    def variable_values(self) -> Dict[str, Any]:
+        """
+        Returns the values of the variables (which are bound).
+        """
+        return {name: self.values[name] for name in self.variables if name in self.values}
+
+    def attach(self, namespace: dict) -> None:
+        """
+        Binds the worksheet's values and functions in namespace, computing
+        everything again if it was bound in another namespace.
+        """
+        if namespace is self.namespace:
+            return
+        self.namespace = namespace
+        for name in self.cells:
+            namespace.pop(name, None)
+        self.values = {}
+        self.recompute(self.cells, atomic=False)
+        return
+
+    def define(self, name: str, params: Optional[Tuple[str, ...]], formula: str, base: int = 10) -> Any:
+        """
+        Defines, redefines or (with an empty formula) removes a variable or
+        a function with the given parameters, and computes again whatever
+        uses it. Numbers in the formula are read in base (see
+        expression.parse). Returns the variable's value, or the
+        UserFunction. Raises ParseError if the formula doesn't parse,
+        DefinitionError if the definition isn't allowed and the evaluation's
+        errors if a value can't be computed, leaving the worksheet
+        unchanged.
+        """
+        if name in RESERVED or name.startswith('_'):
+            raise DefinitionError('{!r} is reserved'.format(name))
+        if not formula:
+            self.remove(name)
+            return None
+        if self.namespace is None:
+            raise RuntimeError('the worksheet must be attached to a namespace first')
+
+        old = self.cells.get(name)
+        if old is not None and (old.params is None) != (params is None) and self.dependents.get(name):
+            raise DefinitionError('{} is used by {}, so it must stay a {}'.format(
+                name, ', '.join(sorted(self.dependents[name])), 'variable' if old.params is None else 'function'))
+
+        # the name itself is only known once it is defined, so a formula
+        # using it (other than through a parameter) fails to parse or forms
+        # a cycle
+        variables = (self.variables - {name}) | set(params or ())
+        known = self.functions - {name} - set(params or ())
+        tree = simplify(parse(formula, variables, known, base))
+        uses = (references(tree) - set(params or ())) & self.cells.keys()
+        cycle = uses & self.affected(name)
+        if cycle:
+            raise DefinitionError('{} uses itself through {}'.format(name, ', '.join(sorted(cycle))))
+
+        cell = Cell(name, params, normalize(formula), tree, uses)
+        saved = dict(self.cells)
+        self.add(cell)
+        try:
+            self.recompute([name], atomic=True)
+        except BaseException:
+            self.cells, self.dependents = {}, {}
+            for previous in saved.values():
+                self.add(previous)
+            raise
+        self.version += 1
+        return self.values[name]
+
+    def remove(self, name: str) -> None:
+        """
+        Removes a definition, which nothing may use.
+        """
+        if name not in self.cells:
+            raise DefinitionError('{} is not defined'.format(name))
+        if self.dependents.get(name):
+            raise DefinitionError('{} is used by {}'.format(name, ', '.join(sorted(self.dependents[name]))))
+        for used in self.cells.pop(name).uses:
+            self.dependents[used].discard(name)
+        self.dependents.pop(name, None)
+        self.values.pop(name, None)
+        if self.namespace is not None:
+            self.namespace.pop(name, None)
+        self.rename()
+        self.version += 1
+        return
+
+    def add(self, cell: Cell) -> None:
+        """
+        Adds or replaces a cell and its edges in the dependency graph.
+        """
+        old = self.cells.get(cell.name)
+        if old is not None:
+            for used in old.uses:
+                self.dependents[used].discard(cell.name)
+        self.cells[cell.name] = cell
+        for used in cell.uses:
+            self.dependents.setdefault(used, set()).add(cell.name)
+        self.rename()
+        return
+
+    def rename(self) -> None:
+        """
+        Updates the sets of variable and function names.
+        """
+        self.variables = frozenset(name for name, cell in self.cells.items() if cell.params is None)
+        self.functions = frozenset(self.cells.keys() - self.variables)
+        return
+
+    def affected(self, name: str) -> Set[str]:
+        """
+        Returns name and the names of every definition that uses it, directly
+        or indirectly.
+        """
+        found = {name}
+        pending = [name]
+        while pending:
+            for dependent in self.dependents.get(pending.pop(), ()):
+                if dependent not in found:
+                    found.add(dependent)
+                    pending.append(dependent)
+        return found
+
+    def volatile(self, name: str) -> bool:
+        """
+        Returns whether a function uses VOLATILE names, directly or through
+        the functions it calls.
+        """
+        cell = self.cells[name]
+        if references(cell.tree) & VOLATILE:
+            return True
+        return any(self.volatile(used) for used in cell.uses if self.cells[used].params is not None)
+
+    def order(self, names: Iterable[str]) -> List[str]:
+        """
+        Returns the given names and every definition that uses them in
+        topological order, so each comes after everything it uses (Kahn's
+        algorithm on the affected part of the graph).
+        """
+        affected = set()
+        for name in names:
+            if name not in affected:
+                affected |= self.affected(name)
+        waiting = {name: len(self.cells[name].uses & affected) for name in affected}
+        ready = deque(name for name, count in waiting.items() if count == 0)
+        order = []
+        while ready:
+            name = ready.popleft()
+            order.append(name)
+            for dependent in self.dependents.get(name, ()):
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        return order
+
+    def recompute(self, names: Iterable[str], atomic: bool) -> None:
+        """
+        Computes the given definitions and everything that uses them again.
+        If atomic, the first error restores the old values and is raised,
+        otherwise a definition that fails is left unbound.
+        """
+        namespace = self.namespace
+        old = {}
+        try:
+            for name in self.order(names):
+                old[name] = self.values.get(name)
+                cell = self.cells[name]
+                try:
+                    if cell.params is None:
+                        value = cell.code(namespace)
+                    else:
+                        value = UserFunction(name, cell.params, cell.code, namespace, self.cache_size,
+                                             not self.volatile(name))
+                except Exception:
+                    if atomic:
+                        raise
+                    self.values.pop(name, None)
+                    namespace.pop(name, None)
+                    continue
+                self.values[name] = value
+                namespace[name] = value
+        except BaseException:
+            for name, value in old.items():
+                if value is None:
+                    self.values.pop(name, None)
+                    namespace.pop(name, None)
+                else:
+                    self.values[name] = value
+                    namespace[name] = value
+            raise
+        return